@@ -0,0 +1,141 @@
+"""Chemins chauds exécutés à chaque /start ou clic, et utilitaires du panneau admin."""
+import asyncio
+import itertools
+from types import SimpleNamespace
+
+import pytest
+
+import bot
+from conftest import synthetic_config
+
+
+# --------- Accueil et configuration ---------
+def bench_load_config(benchmark):
+    cfg = benchmark(bot._load_config)
+    assert cfg["miniapp_url"]
+
+
+@pytest.mark.parametrize("for_channel", [False, True], ids=["private", "channel"])
+def bench_build_welcome_keyboard_layout(benchmark, for_channel):
+    cfg = synthetic_config()
+    markup = benchmark(bot._build_welcome_keyboard_layout, cfg, bot_username="bench_bot", for_channel=for_channel)
+    assert markup is not None
+
+
+# --------- Utilisateurs (jeux 1k / 100k / 1M) ---------
+def bench_register_user_existing(benchmark, activity, monkeypatch):
+    _, idx = activity
+    monkeypatch.setattr(bot, "_ACTIVITY", idx)
+    ids = itertools.cycle(idx.ids[i] for i in range(0, len(idx.ids), max(1, len(idx.ids) // 1000)))
+    benchmark(lambda: bot._register_user(next(ids)))
+    assert not bot._PENDING_NEW_USERS
+
+
+def bench_register_user_new(benchmark, activity, monkeypatch):
+    _, idx = activity
+    monkeypatch.setattr(bot, "_ACTIVITY", idx)
+    fresh = itertools.count(50_000_000)
+    benchmark(lambda: bot._register_user(next(fresh)))
+    assert bot._PENDING_NEW_USERS
+
+
+def bench_active_count_wau(benchmark, activity):
+    _, idx = activity
+
+    def wau():
+        idx._union_cache.clear()  # mesurer le calcul, pas le cache de 10s
+        return idx.active_count(7)
+
+    assert benchmark(wau) > 0
+
+
+# --------- Journaux et compteurs ---------
+def bench_append_sent_log_100k(benchmark):
+    bot._SENT_LOG.value = [{"chat_id": 10_000_000 + i % 5000, "message_id": i} for i in range(100_000)]
+    bot._SENT_LOG._loaded = True
+    msg_ids = itertools.count(1_000_000)
+    benchmark(lambda: bot._append_sent_log(10_000_001, next(msg_ids)))
+    assert bot._SENT_LOG.dirty
+
+
+def bench_inc_click(benchmark):
+    names = itertools.cycle(["contact", "infos", "miniapp", "back", "custom:c1", "nolink_potato"])
+    benchmark(lambda: bot._inc_click(next(names)))
+    assert bot._CLICK_DELTAS
+
+
+# --------- Produits (panneau admin) ---------
+_PRODUCT = {
+    "title": "Produit test",
+    "variants": [
+        {"name": "1", "price": "10", "type": "weight"},
+        {"name": "5", "price": "45", "type": "weight"},
+        {"name": "10", "price": "80€", "type": "weight"},
+        {"name": "Pack", "price": "120", "type": "unit"},
+    ],
+}
+
+
+def bench_format_product_prices(benchmark):
+    assert "€" in benchmark(bot._format_product_prices, _PRODUCT)
+
+
+@pytest.mark.parametrize("line", ["5g 50€", "20 g : 60,5", "pas un prix"], ids=["simple", "spaced", "invalid"])
+def bench_parse_price_line(benchmark, line):
+    benchmark(bot._parse_price_line, line)
+
+
+def bench_build_new_product_add_menu(benchmark):
+    product = {
+        "title": "Produit test", "description": "Une description assez longue pour être tronquée à l'affichage",
+        "tag": "NEW", "categoryName": "Catégorie", "image": "/uploads/p.jpg",
+        "prices": [{"name": str(g), "price": str(g * 9)} for g in (1, 3, 5, 10, 20)],
+    }
+    text, markup = benchmark(bot._build_new_product_add_menu, product)
+    assert "Valider" in str(markup.to_dict())
+
+
+# --------- Résolution de cible (bot Telegram simulé) ---------
+class _StubBot:
+    def __init__(self, online: bool = True):
+        self.online = online
+
+    async def get_chat(self, chat_id):
+        if not self.online:
+            raise bot.NetworkError("offline")
+        return SimpleNamespace(id=424242, username=str(chat_id).lstrip("@"))
+
+
+def _stub_msg(text: str):
+    return SimpleNamespace(text=text, caption=None, entities=[], caption_entities=[], reply_to_message=None, forward_from=None, forward_from_chat=None)
+
+
+@pytest.mark.parametrize(
+    "text,online",
+    [("@someuser", True), ("https://t.me/someuser", True), ("-1001234567890", True), ("@cacheduser", False)],
+    ids=["username", "tme_link", "numeric_id", "username_offline_cache"],
+)
+def bench_resolve_target_id(benchmark, event_loop_runner, text, online):
+    bot._USERNAMES.value, bot._USERNAMES._loaded = {"cacheduser": 777}, True
+    msg, context = _stub_msg(text), SimpleNamespace(bot=_StubBot(online))
+    result = benchmark(lambda: event_loop_runner(bot._resolve_target_id(msg, context)))
+    assert result is not None
+
+
+# --------- Traitement des updates (verrou par chat + pool borné) ---------
+def _chat_update(chat_id: int):
+    return SimpleNamespace(effective_chat=SimpleNamespace(id=chat_id), effective_user=None)
+
+
+def bench_process_update_dispatch(benchmark, event_loop_runner):
+    proc = bot._ChatOrderedUpdateProcessor(64)
+
+    async def noop():
+        pass
+
+    async def batch():
+        await asyncio.gather(*(proc.process_update(_chat_update(i % 50), noop()) for i in range(500)))
+
+    benchmark(lambda: event_loop_runner(batch()))
+    assert proc.pending == 0 and not proc._locks
+
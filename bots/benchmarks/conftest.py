@@ -0,0 +1,108 @@
+"""Micro-benchmarks hors ligne des chemins chauds de bot.py (pytest-benchmark).
+
+Usage (depuis bots/benchmarks):
+    pip install -r ../requirements-dev.txt
+    pytest                                      # mesure seule
+    pytest --benchmark-save=baseline            # enregistre une référence dans .baselines/
+    pytest --benchmark-compare --benchmark-compare-fail=median:20%
+                                                # compare à la dernière référence, échoue si régression
+    BENCH_SIZES=1k,100k pytest                  # sans le jeu 1M (plus rapide)
+
+Le module bot est importé avec BOT_DATA_DIR pointant vers un dossier temporaire: aucun fichier
+de bots/ n'est lu ni écrit par les benchmarks, y compris à l'import.
+"""
+import asyncio
+import atexit
+import copy
+import os
+import random
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+_BOTS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, _BOTS_DIR)
+_DATA_DIR = tempfile.mkdtemp(prefix="bot-bench-")
+atexit.register(shutil.rmtree, _DATA_DIR, ignore_errors=True)
+os.environ["BOT_DATA_DIR"] = _DATA_DIR
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "123456:bench")
+
+import bot  # noqa: E402
+
+_SIZES = {"1k": 1_000, "100k": 100_000, "1M": 1_000_000}
+SIZES = [s for s in os.getenv("BENCH_SIZES", "1k,100k,1M").split(",") if s in _SIZES]
+
+
+def synthetic_config(custom_buttons: int = 6) -> dict:
+    """Config réaliste: liens renseignés, quelques boutons masqués et boutons personnalisés."""
+    cfg = {
+        "welcome_caption": "Bienvenue ! 👋\n\nUtilisez le menu ci-dessous.",
+        "miniapp_url": "https://shop.example.com",
+        "contact_link": "https://t.me/contact_example",
+        "order_link": "https://t.me/order_example",
+        "instagram_url": "https://instagram.com/example",
+        "potato_url": "https://potato.example.com",
+        "telegram_channel_url": "https://t.me/example_channel",
+        "linktree_url": "https://linktr.ee/example",
+        "whatsapp_url": "https://wa.me/33600000000",
+        "hidden_buttons": ["bots", "ig_backup"],
+        "admin_ids": [1001, 1002],
+        "custom_buttons": [
+            {"id": f"c{i}", "label": f"Bouton {i}", "type": "url" if i % 2 else "message", "value": f"https://example.com/{i}" if i % 2 else f"Texte {i}"}
+            for i in range(custom_buttons)
+        ],
+    }
+    return cfg
+
+
+def synthetic_activity(n_users: int, days: int = 35, seed: int = 1) -> "bot._ActivityIndex":
+    """Index d'activité de n_users, chacun actif sur une partie des `days` derniers jours."""
+    rnd = random.Random(seed)
+    idx = bot._ActivityIndex()
+    idx.seed(range(10_000_000, 10_000_000 + n_users))
+    now = int(bot.time.time())
+    per_day = min(20_000, max(1, n_users // 20))
+    for d in range(days):
+        ts = now - (days - 1 - d) * 86400
+        for o in rnd.sample(range(n_users), per_day):
+            idx.touch(10_000_000 + o, ts)
+    return idx
+
+
+@pytest.fixture(autouse=True)
+def isolated_paths(tmp_path, monkeypatch):
+    """Redirige tous les fichiers JSON du bot vers tmp_path (copies mémoire neuves)."""
+    for name in ("_CONFIG", "_BANS", "_USERNAMES", "_SENT_LOG", "_BROADCAST", "_LAST_BROADCAST"):
+        jf = getattr(bot, name)
+        fresh = bot._JsonFile(str(tmp_path / os.path.basename(jf.path)), jf.parse, **jf.dump_kwargs)
+        monkeypatch.setattr(bot, name, fresh)
+    monkeypatch.setattr(bot, "_io_submit", lambda fn, *args: None)  # pas d'écriture disque
+    monkeypatch.setattr(bot, "_INACTIVE", bot._JsonFile(str(tmp_path / "inactive.json"), bot._parse_inactive))
+    monkeypatch.setattr(bot, "_PENDING_NEW_USERS", set())
+    monkeypatch.setattr(bot, "_METRIC_DELTAS", {})
+    monkeypatch.setattr(bot, "_CLICK_DELTAS", {})
+    monkeypatch.setattr(bot, "_SERIES", bot._TimeSeries())
+    bot._CONFIG.value, bot._CONFIG._loaded = synthetic_config(), True
+    yield
+
+
+@pytest.fixture(scope="session", params=SIZES)
+def _activity_template(request):
+    """Index d'activité construit une fois par taille (1k / 100k / 1M utilisateurs)."""
+    return request.param, synthetic_activity(_SIZES[request.param])
+
+
+@pytest.fixture
+def activity(_activity_template):
+    """Copie propre à chaque benchmark: les mesures ne dépendent pas de l'ordre d'exécution."""
+    size, idx = _activity_template
+    return size, copy.deepcopy(idx)
+
+
+@pytest.fixture(scope="session")
+def event_loop_runner():
+    loop = asyncio.new_event_loop()
+    yield loop.run_until_complete
+    loop.close()
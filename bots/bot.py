@@ -1,6 +1,15 @@
 import os
-import tempfile
+import sys
+import queue
+import random
+import logging
+import logging.handlers
+import contextvars
+import threading
+import traceback
+from collections import OrderedDict, deque
 from dotenv import load_dotenv
+from types import MappingProxyType
 from telegram import (
     Update,
     InlineKeyboardButton,
@@ -15,8 +24,27 @@ import httpx
 import json
 import time
 import asyncio
-from telegram.error import RetryAfter, BadRequest, Forbidden
-from telegram.ext import Application, CommandHandler, CallbackQueryHandler, ContextTypes, MessageHandler, filters
+import base64
+import bisect
+import copy
+import contextlib
+import functools
+import zlib
+import hmac
+import gzip
+import hashlib
+import signal
+import pickle
+import sqlite3
+try:
+    import fcntl
+except ImportError:  # hors Linux: pas de verrou inter-processus (mode multi-worker indisponible)
+    fcntl = None
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from telegram.error import RetryAfter, BadRequest, Forbidden, TimedOut, NetworkError
+from telegram.request import BaseRequest, HTTPXRequest
+from telegram.ext import Application, ApplicationHandlerStop, BasePersistence, BaseUpdateProcessor, CommandHandler, PersistenceInput, TypeHandler, CallbackQueryHandler, ContextTypes, MessageHandler, filters
 
 
 # Charger variables depuis .env local puis environnement
@@ -24,31 +52,417 @@ load_dotenv(os.path.join(os.path.dirname(__file__), '../.env'))
 load_dotenv()
 
 TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
+BOT_API_KEY = os.getenv("BOT_API_KEY", "")
+# Multi-bot: nom du bot hébergé (vide en mode classique) et fichier listant les bots d'un même processus
+_TENANT_NAME = os.getenv("BOT_TENANT", "")
+BOT_TENANTS_FILE = os.getenv("BOT_TENANTS_FILE", "")
+# Serveur Bot API alternatif (Bot API locale, ou bots/tools/fake_bot_api.py pour les tests de charge)
+TELEGRAM_API_BASE_URL = os.getenv("TELEGRAM_API_BASE_URL", "https://api.telegram.org").rstrip("/")
+
+# --------- Journalisation structurée ---------
+# Une ligne JSON par événement sur stdout (capturé par pm2). Les handlers ne font que déposer
+# l'enregistrement dans une file; mise en forme et écriture se font dans le thread du QueueListener.
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "0.05"))  # part des logs debug « chemin chaud » conservés
+_LOG_LEVELS = ("DEBUG", "INFO", "WARNING", "ERROR")
+# Corrélation: update en cours de traitement (posé par _ChatOrderedUpdateProcessor, propre à chaque tâche)
+_LOG_CTX: contextvars.ContextVar[dict | None] = contextvars.ContextVar("log_ctx", default=None)
+_log = logging.getLogger("bot")
+_HOT_LOG = logging.getLogger("bot.hot")  # debug appelé à chaque update: échantillonné
+_LOG_LISTENER: logging.handlers.QueueListener | None = None
+
+class _JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(record.created)) + f".{int(record.msecs):03d}",
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        ctx = getattr(record, "ctx", None)
+        if ctx:
+            entry.update(ctx)
+        fields = getattr(record, "fields", None)
+        if fields:
+            entry.update(fields)
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+class _LogContextFilter(logging.Filter):
+    """Exécuté dans le thread appelant: fige update_id/chat_id/user_id sur l'enregistrement."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not hasattr(record, "ctx"):
+            record.ctx = _LOG_CTX.get()
+        return True
+
+class _SampleFilter(logging.Filter):
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno > logging.DEBUG or random.random() < self.rate
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Seule la fusion msg % args (peu coûteuse) reste sur l'appelant; JSON et traceback
+        # sont produits par le thread du listener
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+_HOT_SAMPLER = _SampleFilter(LOG_SAMPLE_RATE)
+_HOT_LOG.addFilter(_HOT_SAMPLER)
+
+def _setup_logging() -> None:
+    """Branche tous les loggers (bot, PTB, httpx) sur une file vidée par un thread dédié."""
+    global _LOG_LISTENER
+    if _LOG_LISTENER is not None:
+        return
+    q: queue.SimpleQueue = queue.SimpleQueue()
+    out = logging.StreamHandler(sys.stdout)
+    out.setFormatter(_JsonFormatter())
+    qh = _QueueHandler(q)
+    qh.addFilter(_LogContextFilter())
+    root = logging.getLogger()
+    root.handlers[:] = [qh]
+    root.setLevel(logging.WARNING)  # bibliothèques: avertissements et erreurs seulement
+    _set_log_level(LOG_LEVEL)
+    _LOG_LISTENER = logging.handlers.QueueListener(q, out)
+    _LOG_LISTENER.start()
+    import atexit
+    atexit.register(_LOG_LISTENER.stop)  # vide la file avant la sortie
+
+def _set_log_level(level: str) -> str:
+    """Change la verbosité du bot à chaud (panneau admin); retourne le niveau appliqué."""
+    level = str(level or "").upper()
+    if level not in _LOG_LEVELS:
+        level = "INFO"
+    _log.setLevel(level)
+    return level
+
+def _log_fields(**fields) -> dict:
+    """Champs structurés additionnels: _log.info("...", extra=_log_fields(n=3))."""
+    return {"fields": fields}
 # Supprimer le concept de propriétaire: uniquement des administrateurs
 OWNER_ID = 0
 ADMIN_IDS: list[int] = []
 
+# --------- Métriques Prometheus (/metrics) ---------
+# Registre en mémoire, toujours actif (incréments sur la boucle, rendu texte à la demande).
+# L'endpoint HTTP n'est ouvert que si METRICS_PORT est défini.
+METRICS_LISTEN = os.getenv("METRICS_LISTEN", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0") or 0)
+_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+_PROM_MAX_SERIES = 300  # séries par métrique: au-delà, label "other" (borne la cardinalité)
+_PROM_REGISTRY: list = []
+
+def _prom_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    esc = lambda v: str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+    parts = [f'{n}="{esc(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+class _PromCounter:
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labels: tuple = ()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.values: dict[tuple, float] = {}
+        _PROM_REGISTRY.append(self)
+
+    def inc(self, *labels, amount: float = 1.0) -> None:
+        if labels not in self.values and len(self.values) >= _PROM_MAX_SERIES:
+            labels = ("other",) * len(self.labels)
+        self.values[labels] = self.values.get(labels, 0.0) + amount
+
+    def samples(self):
+        for lv, v in list(self.values.items()):
+            yield self.name, _prom_labels(self.labels, lv), v
+
+class _PromGauge(_PromCounter):
+    """Jauge calculée au moment du rendu: fn() retourne un nombre ou {labels: valeur}."""
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, fn, labels: tuple = ()):
+        super().__init__(name, help_text, labels)
+        self.fn = fn
+
+    def samples(self):
+        try:
+            val = self.fn()
+        except Exception:
+            return
+        if isinstance(val, dict):
+            for lv, v in val.items():
+                yield self.name, _prom_labels(self.labels, lv if isinstance(lv, tuple) else (lv,)), v
+        elif val is not None:
+            yield self.name, "", val
+
+class _PromHistogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labels: tuple = (), buckets: tuple = _LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        # labels -> [compte par bucket (non cumulé)..., compte +Inf, somme]
+        self.series: dict[tuple, list] = {}
+        _PROM_REGISTRY.append(self)
+
+    def observe(self, value: float, *labels) -> None:
+        s = self.series.get(labels)
+        if s is None:
+            if len(self.series) >= _PROM_MAX_SERIES:
+                labels = ("other",) * len(self.labels)
+            s = self.series.setdefault(labels, [0] * (len(self.buckets) + 2))
+        s[bisect.bisect_left(self.buckets, value)] += 1
+        s[-1] += value
+
+    def samples(self):
+        for lv, s in list(self.series.items()):
+            cum = 0
+            for i, b in enumerate(self.buckets):
+                cum += s[i]
+                yield f"{self.name}_bucket", _prom_labels(self.labels, lv, f'le="{b:g}"'), cum
+            cum += s[len(self.buckets)]
+            yield f"{self.name}_bucket", _prom_labels(self.labels, lv, 'le="+Inf"'), cum
+            yield f"{self.name}_count", _prom_labels(self.labels, lv), cum
+            yield f"{self.name}_sum", _prom_labels(self.labels, lv), s[-1]
+
+# Registres des bots hébergés (multi-bot): rendus avec un label tenant, une famille par métrique
+_TENANT_REGISTRIES: dict[str, list] = {}
+
+def _render_metrics() -> str:
+    families: dict[str, tuple] = {}
+    for tenant, registry in [("", _PROM_REGISTRY), *_TENANT_REGISTRIES.items()]:
+        for m in registry:
+            families.setdefault(m.name, (m, []))[1].append((tenant, m))
+    out = []
+    for first, members in families.values():
+        out.append(f"# HELP {first.name} {first.help}")
+        out.append(f"# TYPE {first.name} {first.kind}")
+        for tenant, m in members:
+            for name, labels, v in m.samples():
+                if tenant:
+                    labels = f'{{tenant="{tenant}",{labels[1:]}' if labels else f'{{tenant="{tenant}"}}'
+                out.append(f"{name}{labels} {v:g}" if isinstance(v, (int, float)) else f"{name}{labels} {v}")
+    out.append("")
+    return "\n".join(out)
+
+_HANDLER_LATENCY = _PromHistogram("bot_handler_duration_seconds", "Durée des handlers par route", ("handler",))
+_HANDLER_ERRORS = _PromCounter("bot_handler_errors_total", "Exceptions levées par les handlers", ("handler",))
+_TG_LATENCY = _PromHistogram("bot_telegram_api_duration_seconds", "Latence des appels Bot API par méthode", ("method",))
+_TG_REQUESTS = _PromCounter("bot_telegram_api_requests_total", "Appels Bot API par méthode et statut HTTP", ("method", "status"))
+_TG_RETRY_AFTER = _PromCounter("bot_telegram_retry_after_total", "Réponses 429 (RetryAfter) par méthode", ("method",))
+_TG_POOL_REQUESTS = _PromCounter("bot_telegram_pool_requests_total", "Appels Bot API par pool de connexions", ("pool",))
+_SHOP_LATENCY = _PromHistogram("bot_shop_api_duration_seconds", "Latence de l'API boutique par endpoint", ("method", "endpoint"))
+_SHOP_REQUESTS = _PromCounter("bot_shop_api_requests_total", "Appels API boutique par endpoint et statut", ("method", "endpoint", "status"))
+_CACHE_REQUESTS = _PromCounter("bot_cache_requests_total", "Accès aux caches mémoire (hit/miss)", ("cache", "result"))
+
+def _cache_hit_ratios() -> dict:
+    totals: dict[str, list] = {}
+    for (cache, result), v in list(_CACHE_REQUESTS.values.items()):
+        t = totals.setdefault(cache, [0.0, 0.0])
+        t[0 if result == "hit" else 1] += v
+    return {c: h / (h + m) for c, (h, m) in totals.items() if h + m}
+
+_PromGauge("bot_cache_hit_ratio", "Taux de hit par cache depuis le démarrage", _cache_hit_ratios, ("cache",))
+
+def _cache_hit(cache: str, hit: bool) -> None:
+    _CACHE_REQUESTS.inc(cache, "hit" if hit else "miss")
+
+def _admin_route(update) -> str:
+    """Label métrique d'un callback admin: la route sans ses arguments (adm_prod_do_del:123 -> adm_prod_do_del)."""
+    data = getattr(getattr(update, "callback_query", None), "data", None) or ""
+    return data.split(":", 1)[0][:64] or "adm_?"
+
+def _timed(name: str | None = None, route=None):
+    """Décorateur de handler: histogramme de durée et compteur d'erreurs (label fixe ou calculé)."""
+    def deco(fn):
+        @functools.wraps(fn)
+        async def wrapper(update, context):
+            label = route(update) if route else (name or fn.__name__)
+            t0 = time.perf_counter()
+            try:
+                return await fn(update, context)
+            except Exception:
+                _HANDLER_ERRORS.inc(label)
+                raise
+            finally:
+                _HANDLER_LATENCY.observe(time.perf_counter() - t0, label)
+        return wrapper
+    return deco
+
+class _InstrumentedRequest(HTTPXRequest):
+    """HTTPXRequest de PTB avec latence/statut par méthode Bot API.
+    client: pool httpx partagé entre plusieurs bots (multi-bot), fermé par son propriétaire.
+    """
+
+    def __init__(self, *args, client: httpx.AsyncClient | None = None, pool: str = "control", **kwargs):
+        self._shared_client = client  # avant super().__init__, qui appelle _build_client
+        super().__init__(*args, **kwargs)
+        self.pool = pool
+
+    def _build_client(self) -> httpx.AsyncClient:
+        # Pool partagé: aucun client privé construit (ni à jeter)
+        return self._shared_client if self._shared_client is not None else super()._build_client()
+
+    async def shutdown(self) -> None:
+        if self._shared_client is None:
+            await super().shutdown()
+
+    async def do_request(self, url, method, request_data=None, *args, **kwargs):
+        api_method = url.rsplit("/", 1)[-1]
+        t0 = time.perf_counter()
+        status = "error"
+        try:
+            code, payload = await super().do_request(url, method, request_data, *args, **kwargs)
+            status = str(code)
+            if code == 429:
+                _TG_RETRY_AFTER.inc(api_method)
+            return code, payload
+        finally:
+            _TG_LATENCY.observe(time.perf_counter() - t0, api_method)
+            _TG_REQUESTS.inc(api_method, status)
+            _TG_POOL_REQUESTS.inc(self.pool)
+
+def _pool_size(env: str, default: int) -> int:
+    try:
+        return max(1, int(os.getenv(env, default)))
+    except ValueError:
+        return default
+
+# Un pool de connexions par classe de trafic Bot API: les téléversements de médias et téléchargements de
+# fichiers, lents, ne doivent pas occuper les connexions des petits appels (sendMessage, answerCallbackQuery...)
+_TG_POOLS = {
+    "control": dict(connection_pool_size=_pool_size("TG_POOL_CONTROL", 512), connect_timeout=3.0, read_timeout=3.0, write_timeout=3.0, pool_timeout=0.5),
+    "media": dict(connection_pool_size=_pool_size("TG_POOL_MEDIA", 32), connect_timeout=5.0, read_timeout=20.0, write_timeout=10.0, media_write_timeout=60.0, pool_timeout=10.0),
+    "download": dict(connection_pool_size=_pool_size("TG_POOL_DOWNLOAD", 8), connect_timeout=5.0, read_timeout=60.0, write_timeout=5.0, pool_timeout=30.0),
+}
+
+def _tg_pool(kind: str, client: httpx.AsyncClient | None = None) -> _InstrumentedRequest:
+    return _InstrumentedRequest(client=client, pool=kind, **_TG_POOLS[kind])
+
+class _RoutedRequest(BaseRequest):
+    """Requête unique vue par PTB, qui aiguille chaque appel vers le pool de sa classe de trafic:
+    download (URL /file/bot...), media (appel avec fichiers à téléverser), control (le reste).
+    getUpdates garde sa propre requête (get_updates_request).
+    """
+
+    def __init__(self, clients: dict[str, httpx.AsyncClient] | None = None):
+        clients = clients or {}
+        self._pools = {kind: _tg_pool(kind, clients.get(kind)) for kind in _TG_POOLS}
+
+    @property
+    def read_timeout(self) -> float | None:
+        return self._pools["control"].read_timeout
+
+    async def initialize(self) -> None:
+        await asyncio.gather(*(p.initialize() for p in self._pools.values()))
+
+    async def shutdown(self) -> None:
+        await asyncio.gather(*(p.shutdown() for p in self._pools.values()))
+
+    def _route(self, url: str, request_data) -> _InstrumentedRequest:
+        if "/file/bot" in url:
+            return self._pools["download"]
+        if request_data is not None and request_data.contains_files:
+            return self._pools["media"]
+        return self._pools["control"]
+
+    async def do_request(self, url, method, request_data=None, *args, **kwargs):
+        return await self._route(url, request_data).do_request(url, method, request_data, *args, **kwargs)
+
+def _shop_endpoint(url) -> str:
+    # Les segments contenant un chiffre (ids produits/catégories) sont regroupés
+    return "/".join("{id}" if any(ch.isdigit() for ch in seg) else seg for seg in url.path.split("/"))
+
+async def _shop_on_request(request) -> None:
+    request.extensions["t0"] = time.perf_counter()
+
+async def _shop_on_response(response) -> None:
+    req = response.request
+    endpoint = _shop_endpoint(req.url)
+    t0 = req.extensions.get("t0")
+    if t0 is not None:
+        _SHOP_LATENCY.observe(time.perf_counter() - t0, req.method, endpoint)
+    _SHOP_REQUESTS.inc(req.method, endpoint, str(response.status_code))
+    if req.method != "GET":
+        _SHOP_CACHE.clear()
+        if BOT_WORKERS > 1:
+            _io_submit(_touch_change_marker_sync, "shop")
+
+def _shop_client(**kwargs) -> httpx.AsyncClient:
+    """Client HTTP vers l'API boutique (Next.js), instrumenté par endpoint."""
+    return httpx.AsyncClient(event_hooks={"request": [_shop_on_request], "response": [_shop_on_response]}, **kwargs)
+
+# Lectures catalogue/catégories mises en cache peu de temps: préchargées au démarrage,
+# vidées par toute écriture passée par _shop_client (le TTL couvre les éditions faites sur le site)
+_SHOP_CACHE_TTL = float(os.getenv("SHOP_CACHE_TTL", "30"))
+_SHOP_CACHE: dict[str, tuple[float, object]] = {}
+
+async def _shop_get_json(url: str, headers: dict, timeout: float = 10.0) -> tuple[int, object]:
+    """GET JSON sur l'API boutique avec cache court; renvoie (statut HTTP, données ou None)."""
+    entry = _SHOP_CACHE.get(url)
+    if entry and time.monotonic() - entry[0] < _SHOP_CACHE_TTL:
+        _cache_hit("shop", True)
+        return 200, entry[1]
+    _cache_hit("shop", False)
+    async with _shop_client() as client:
+        resp = await client.get(url, headers=headers, timeout=timeout)
+    if resp.status_code != 200:
+        return resp.status_code, None
+    data = resp.json()
+    _SHOP_CACHE[url] = (time.monotonic(), data)
+    return 200, data
+
+async def _warm_shop_cache() -> None:
+    """Précharge produits et catégories (premier clic admin sans aller-retour API)."""
+    api_url = (_config_view().get("miniapp_url") or "").rstrip("/")
+    if not api_url:
+        return
+    api_key = BOT_API_KEY
+    headers = {"x-api-key": api_key} if api_key else {}
+    await asyncio.gather(
+        _shop_get_json(f"{api_url}/api/products", headers),
+        _shop_get_json(f"{api_url}/api/categories?all=1", headers),
+    )
+
 def _reload_admin_ids() -> None:
-    """Recharge ADMIN_IDS depuis config.json en temps réel"""
+    """Recharge ADMIN_IDS depuis config.json en temps réel (recalcul seulement si le fichier a changé)"""
     try:
-        cfg = _load_config()
-        cfg_ids = cfg.get("admin_ids", [])
-        ADMIN_IDS.clear()
-        if cfg_ids:
-            ADMIN_IDS.extend(sorted(int(a) for a in cfg_ids if a))
+        _config_view()
     except Exception:
         pass
 
 def _is_admin(user_id: int) -> bool:
     try:
-        # Recharger depuis config.json pour avoir la liste à jour
-        _reload_admin_ids()
-        is_adm = bool(user_id) and (user_id in ADMIN_IDS)
-        print(f"[DEBUG] _is_admin({user_id}) -> {is_adm}, ADMIN_IDS={ADMIN_IDS}")
+        # Vue partagée de config.json: à jour sans copie de la config à chaque appel
+        _config_view()
+        is_adm = bool(user_id) and (user_id in _CONFIG_VIEW["admins"])
+        _HOT_LOG.debug("_is_admin(%s) -> %s", user_id, is_adm)
         return is_adm
-    except Exception as e:
-        print(f"[ERROR] _is_admin error: {e}")
+    except Exception:
+        _log.exception("_is_admin")
         return False
+# Mode d'exécution: "polling" (défaut) ou "webhook" (serveur HTTP intégré)
+BOT_MODE = os.getenv("BOT_MODE", "polling").lower()
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "127.0.0.1")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8443"))
+WEBHOOK_PATH = "/" + os.getenv("WEBHOOK_PATH", "telegram/webhook").lstrip("/")
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "").rstrip("/")  # URL publique (proxy HTTPS) déclarée à Telegram
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET") or os.getenv("TELEGRAM_WEBHOOK_SECRET", "")
+# Mode multi-worker (webhook): un processus front répartit les updates par chat_id entre
+# BOT_WORKERS processus; BOT_WORKER_INDEX est positionné par le front pour chaque worker
+BOT_WORKERS = max(1, int(os.getenv("BOT_WORKERS", "1")))
+_WORKER_INDEX = int(os.environ["BOT_WORKER_INDEX"]) if os.getenv("BOT_WORKER_INDEX") else None
 WELCOME_IMAGE_PATH = os.getenv("WELCOME_IMAGE_PATH", "IMG.jpg")
 # Par défaut, ouvrir la mini‑app en WebApp dans Telegram si elle est configurée via /admin
 MINIAPP_OPEN_MODE = os.getenv("MINIAPP_OPEN_MODE", "webapp").lower()  # "url" ou "webapp"
@@ -69,7 +483,33 @@ CATEGORIES = [
 
 
 # Stockage simple des utilisateurs (chat_ids) qui ont utilisé le bot
-_BASE_DIR = os.path.dirname(__file__)
+# BOT_DATA_DIR: dossier de données propre à chaque bot en mode multi-bot
+_BASE_DIR = os.getenv("BOT_DATA_DIR") or os.path.dirname(__file__)
+_LOCK_PATH = os.path.join(_BASE_DIR, ".bot.lock")
+
+@contextlib.contextmanager
+def _shared_lock():
+    """Verrou inter-processus (flock) autour des lectures-modifications-écritures partagées
+    entre workers; sans effet en mode processus unique.
+    """
+    if BOT_WORKERS <= 1 or fcntl is None:
+        yield
+        return
+    with open(_LOCK_PATH, "a") as fh:
+        fcntl.flock(fh, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(fh, fcntl.LOCK_UN)
+
+def _shard_file(name: str, index: int | None = None) -> str:
+    """Fichier propre à un worker (activity.json -> activity.w2.json) pour les données par chat."""
+    index = _WORKER_INDEX if index is None else index
+    if index is None:
+        return name
+    stem, ext = os.path.splitext(name)
+    return f"{stem}.w{index}{ext}"
+
 _USERS_PATH = os.path.join(_BASE_DIR, "users.json")
 _CONFIG_PATH = os.path.join(_BASE_DIR, "config.json")
 _BANS_PATH = os.path.join(_BASE_DIR, "bans.json")
@@ -85,38 +525,176 @@ _PURGE_OPS_PAUSE = 0.35  # secondes entre opérations
 _PURGE_USER_PAUSE = 3.0  # pause entre utilisateurs (purge globale)
 _PURGE_LOCAL_RUNNING_CHATS: set[int] = set()
 
-def _load_sent_log():
+# --------- E/S disque hors de la boucle ---------
+# Un seul thread d'E/S: lectures et écritures de fichiers y sont sérialisées, jamais sur la
+# boucle asyncio (pas de handler bloqué par le disque, pas d'écritures concurrentes d'un fichier).
+_IO_EXECUTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix="bot-io")
+_FILES_REFRESH_INTERVAL = float(os.getenv("FILES_REFRESH_INTERVAL", "1"))
+
+async def _io(fn, *args, **kwargs):
+    """Exécute fn dans le thread d'E/S et attend son résultat."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_IO_EXECUTOR, functools.partial(fn, *args, **kwargs))
+
+def _io_submit(fn, *args) -> None:
+    """Soumet une écriture au thread d'E/S sans l'attendre (l'ordre de soumission est conservé)."""
+    def _report(fut):
+        exc = fut.exception()
+        if exc is not None:
+            _log.error("E/S %s: %s", getattr(fn, '__name__', fn), exc, exc_info=exc)
     try:
-        with open(_SENT_LOG_PATH, "r", encoding="utf-8") as f:
-            data = json.load(f)
-            if isinstance(data, list):
-                res = []
-                for x in data:
-                    if isinstance(x, dict) and "chat_id" in x and "message_id" in x:
-                        try:
-                            res.append({"chat_id": int(x.get("chat_id")), "message_id": int(x.get("message_id"))})
-                        except Exception:
-                            pass
-                return res
-    except Exception:
-        pass
-    return []
+        _IO_EXECUTOR.submit(fn, *args).add_done_callback(_report)
+    except RuntimeError:
+        # Exécuteur arrêté (fin de process): écrire directement
+        fn(*args)
+
+class _JsonFile:
+    """Copie mémoire d'un fichier JSON. Les handlers ne lisent que la copie; le thread d'E/S la
+    recharge quand le fichier change sur disque (ex: config.json modifié par le site) et écrit
+    les modifications, aussitôt ou au prochain _flush_all (defer=True).
+    """
+
+    def __init__(self, path: str, parse, merge=None, **dump_kwargs):
+        self.path = path
+        self.parse = parse
+        self.merge = merge  # merge(disque, local): écritures différées concurrentes entre workers
+        self.dump_kwargs = dump_kwargs
+        self.value = None
+        self.dirty = False
+        self._sig = None
+        self._loaded = False
+        self._gen = 0  # incrémenté à chaque modification sur la boucle (set, mark_dirty, take_dirty)
+
+    def _stat(self):
+        try:
+            st = os.stat(self.path)
+            return (st.st_mtime_ns, st.st_size)
+        except OSError:
+            return None
+
+    def read_sync(self):
+        """Thread d'E/S: (génération, signature, valeur) si le fichier a changé, sinon None."""
+        gen = self._gen
+        if self.dirty:
+            return None  # modifications locales pas encore écrites: elles priment
+        sig = self._stat()
+        if self._loaded and sig == self._sig:
+            return None
+        return gen, sig, self._read_sync()
+
+    def adopt(self, read) -> None:
+        """Boucle: adopte une lecture de read_sync si la copie n'a pas été modifiée depuis son début."""
+        gen, sig, value = read
+        if gen != self._gen or self.dirty:
+            return  # relu au prochain rafraîchissement (signature inchangée)
+        self.value = value
+        self._sig = sig
+        self._loaded = True
+
+    def refresh_sync(self) -> None:
+        """Lecture et adoption immédiates (premier accès)."""
+        read = self.read_sync()
+        if read is not None:
+            self.adopt(read)
+
+    def _read_sync(self):
+        raw = None
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                raw = json.load(f)
+        except Exception:
+            pass
+        return self.parse(raw)
+
+    def get(self):
+        if not self._loaded:
+            self.refresh_sync()
+        return self.value
+
+    def set(self, value, defer: bool = False) -> None:
+        self.value = value
+        self._loaded = True
+        self._gen += 1
+        if defer:
+            self.dirty = True
+        else:
+            _io_submit(self.write_sync, value)
+
+    def mark_dirty(self) -> None:
+        """La copie mémoire a été modifiée sur place: écriture au prochain _flush_all."""
+        self.dirty = True
+        self._gen += 1
+
+    def take_dirty(self):
+        """Copie à écrire (prise sur la boucle) si des modifications différées sont en attente."""
+        if not self.dirty:
+            return None
+        self.dirty = False
+        self._gen += 1  # une lecture en cours précède cette écriture: elle ne doit pas être adoptée
+        return copy.copy(self.value)
+
+    def write_sync(self, value, merge: bool = False) -> bool:
+        try:
+            with _shared_lock():
+                if merge and self.merge and BOT_WORKERS > 1:
+                    # Fusion avec les écritures des autres workers; la copie mémoire sera
+                    # relue au prochain rafraîchissement (signature laissée périmée)
+                    _write_json_atomic(self.path, self.merge(self._read_sync(), value), **self.dump_kwargs)
+                    return True
+                _write_json_atomic(self.path, value, **self.dump_kwargs)
+            self._sig = self._stat()
+            return True
+        except Exception:
+            _log.exception("écriture %s", os.path.basename(self.path))
+            return False
+
+    def update_sync(self, fn) -> None:
+        """Lecture-modification-écriture du fichier sous verrou (thread d'E/S)."""
+        try:
+            with _shared_lock():
+                value = self._read_sync()
+                fn(value)
+                _write_json_atomic(self.path, value, **self.dump_kwargs)
+        except Exception:
+            _log.exception("écriture %s", os.path.basename(self.path))
+
+def _parse_sent_log(data):
+    res = []
+    if isinstance(data, list):
+        for x in data:
+            if isinstance(x, dict) and "chat_id" in x and "message_id" in x:
+                try:
+                    res.append({"chat_id": int(x.get("chat_id")), "message_id": int(x.get("message_id"))})
+                except Exception:
+                    pass
+    return res
+
+def _merge_sent_log(disk: list, local: list) -> list:
+    # Union ordonnée; une entrée purgée par un autre worker peut réapparaître (purge tolérante)
+    keys = set((e["chat_id"], e["message_id"]) for e in disk)
+    return disk + [e for e in local if (e["chat_id"], e["message_id"]) not in keys]
+
+_SENT_LOG = _JsonFile(_SENT_LOG_PATH, _parse_sent_log, _merge_sent_log)
+_SENT_LOG_KEYS: dict = {"ref": None, "keys": set()}  # index de dédoublonnage de la liste en mémoire
+
+def _load_sent_log():
+    return list(_SENT_LOG.get())
 
 def _save_sent_log(entries):
-    try:
-        with open(_SENT_LOG_PATH, "w", encoding="utf-8") as f:
-            json.dump(entries, f)
-    except Exception:
-        pass
+    _SENT_LOG.set(list(entries))
 
 def _append_sent_log(chat_id: int, message_id: int):
+    # En mémoire; écrit sur disque par _flush_all (écriture différée)
     try:
-        entries = _load_sent_log()
+        entries = _SENT_LOG.get()
+        if _SENT_LOG_KEYS["ref"] is not entries:
+            _SENT_LOG_KEYS["ref"] = entries
+            _SENT_LOG_KEYS["keys"] = set((e["chat_id"], e["message_id"]) for e in entries)
         key = (int(chat_id), int(message_id))
-        existing = set((int(e.get("chat_id")), int(e.get("message_id"))) for e in entries if isinstance(e, dict))
-        if key not in existing:
-            entries.append({"chat_id": int(chat_id), "message_id": int(message_id)})
-            _save_sent_log(entries)
+        if key not in _SENT_LOG_KEYS["keys"]:
+            _SENT_LOG_KEYS["keys"].add(key)
+            entries.append({"chat_id": key[0], "message_id": key[1]})
+            _SENT_LOG.mark_dirty()
     except Exception:
         pass
 
@@ -223,30 +801,33 @@ def _parse_price_line(line: str) -> tuple[str, str] | None:
     return None
 
 # Mémoire locale: username -> id
+def _parse_usernames(data):
+    res = {}
+    if isinstance(data, dict):
+        for k, v in data.items():
+            try:
+                res[str(k)] = int(v)
+            except Exception:
+                pass
+    return res
+
+_USERNAMES = _JsonFile(_USERNAMES_PATH, _parse_usernames, lambda disk, local: {**disk, **local})
+
 def _load_usernames():
-    try:
-        with open(_USERNAMES_PATH, "r", encoding="utf-8") as f:
-            data = json.load(f) or {}
-            if isinstance(data, dict):
-                return {str(k): int(v) for k, v in data.items()}
-    except Exception:
-        pass
-    return {}
+    return dict(_USERNAMES.get())
 
 def _save_usernames(mapping: dict[str, int]):
-    try:
-        with open(_USERNAMES_PATH, "w", encoding="utf-8") as f:
-            json.dump({str(k): int(v) for k, v in mapping.items()}, f)
-    except Exception:
-        pass
+    _USERNAMES.set({str(k): int(v) for k, v in mapping.items()})
 
 def _remember_username(username: str | None, uid: int | None):
+    # En mémoire; écrit sur disque par _flush_all (écriture différée)
     try:
         if not username or not uid:
             return
-        m = _load_usernames()
-        m[username.lower()] = int(uid)
-        _save_usernames(m)
+        m = _USERNAMES.get()
+        if m.get(username.lower()) != int(uid):
+            m[username.lower()] = int(uid)
+            _USERNAMES.mark_dirty()
     except Exception:
         pass
 
@@ -334,30 +915,463 @@ async def _resolve_target_id(msg, context) -> int | None:
         pass
     return None
 
-def _load_users():
+def _load_users_file():
+    users = []
     try:
         with open(_USERS_PATH, "r", encoding="utf-8") as f:
             data = json.load(f)
             if isinstance(data, list):
-                return [int(x) for x in data]
+                users = [int(x) for x in data]
     except Exception:
         pass
-    return []
+    return users
+
+def _load_users():
+    # Registre en mémoire: l'index d'activité est amorcé depuis users.json et reçoit chaque
+    # nouvel utilisateur (users.json est réécrit par _flush_all)
+    return [cid for shard in _activity_shards() for cid in shard.ids.tolist()]
 
-def _save_users(users):
+def _save_users(users) -> bool:
     # Dédupliquer et sauvegarder
     uniq = sorted(set(int(x) for x in users))
     try:
-        with open(_USERS_PATH, "w", encoding="utf-8") as f:
-            json.dump(uniq, f)
+        _write_json_atomic(_USERS_PATH, uniq)
+        return True
     except Exception:
-        pass
+        _log.exception("écriture users.json")
+        return False
 
 def _register_user(chat_id: int):
-    users = _load_users()
-    if chat_id not in users:
-        users.append(chat_id)
-        _save_users(users)
+    # Mise à jour en mémoire uniquement; users.json et activity.json sont écrits par _flush_loop
+    if _ACTIVITY.touch(int(chat_id)):
+        _PENDING_NEW_USERS.add(int(chat_id))
+    # Un utilisateur qui revient (/start, clic) redevient destinataire des envois de masse
+    _reactivate_user(chat_id)
+
+# --------- Index d'activité (premier/dernier passage, actifs par jour) ---------
+_ACTIVITY_PATH = os.path.join(_BASE_DIR, _shard_file("activity.json"))
+_ACTIVITY_RETENTION_DAYS = int(os.getenv("ACTIVITY_RETENTION_DAYS", "400"))
+_ACTIVITY_HOT_DAYS = 35  # jours gardés décompressés (DAU/WAU/MAU); les plus anciens sont compressés
+_PENDING_NEW_USERS: set[int] = set()
+_FLUSH_INTERVAL = float(os.getenv("FLUSH_INTERVAL", "5"))
+
+def _day_number(ts: float | None = None) -> int:
+    """Numéro de jour local (jours depuis l'epoch, fuseau du serveur)."""
+    ts = time.time() if ts is None else ts
+    return int((ts + time.localtime(ts).tm_gmtoff) // 86400)
+
+class _ActivityIndex:
+    """Index d'activité compact: chaque utilisateur reçoit un ordinal, chaque jour est un bitmap
+    sur ces ordinaux. DAU/WAU/MAU = popcount d'un OU de quelques bitmaps.
+    """
+
+    def __init__(self):
+        self.ids = array("q")             # ordinal -> chat_id
+        self.ordinals: dict[int, int] = {}  # chat_id -> ordinal
+        self.first_seen = array("q")
+        self.last_seen = array("q")
+        self.hot: dict[int, bytearray] = {}   # jour -> bitmap
+        self.cold: dict[int, bytes] = {}      # jour -> bitmap compressé (zlib)
+        self.day_counts: dict[int, int] = {}  # jour -> nb de bits à 1 (DAU en O(1))
+        self.new_counts: dict[int, int] = {}  # jour -> nouveaux utilisateurs
+        self.dirty = False
+        self._union_cache: dict[int, tuple[float, int]] = {}
+
+    def touch(self, chat_id: int, ts: float | None = None) -> bool:
+        """Enregistre un passage; retourne True si l'utilisateur est nouveau."""
+        ts = int(time.time() if ts is None else ts)
+        day = _day_number(ts)
+        o = self.ordinals.get(chat_id)
+        is_new = o is None
+        if is_new:
+            o = len(self.ids)
+            self.ids.append(chat_id)
+            self.ordinals[chat_id] = o
+            self.first_seen.append(ts)
+            self.last_seen.append(ts)
+            self.new_counts[day] = self.new_counts.get(day, 0) + 1
+        else:
+            self.last_seen[o] = ts
+        bm = self.hot.get(day)
+        if bm is None:
+            bm = self.hot[day] = bytearray()
+            self._rotate(day)
+        idx, bit = o >> 3, 1 << (o & 7)
+        if idx >= len(bm):
+            bm.extend(b"\x00" * (idx + 1 - len(bm)))
+        if not bm[idx] & bit:
+            bm[idx] |= bit
+            self.day_counts[day] = self.day_counts.get(day, 0) + 1
+        self.dirty = True
+        return is_new
+
+    def _rotate(self, today: int) -> None:
+        """Compresse les jours sortis de la fenêtre chaude et purge au-delà de la rétention."""
+        for d in [d for d in self.hot if d <= today - _ACTIVITY_HOT_DAYS]:
+            self.cold[d] = zlib.compress(bytes(self.hot.pop(d)))
+        limit = today - _ACTIVITY_RETENTION_DAYS
+        for store in (self.cold, self.day_counts, self.new_counts):
+            for d in [d for d in store if d <= limit]:
+                store.pop(d, None)
+
+    def _bitmap_int(self, day: int) -> int:
+        bm = self.hot.get(day)
+        if bm is None:
+            raw = self.cold.get(day)
+            bm = zlib.decompress(raw) if raw else b""
+        return int.from_bytes(bm, "little")
+
+    def _union(self, days: int) -> int:
+        today = _day_number()
+        acc = 0
+        for d in range(today - days + 1, today + 1):
+            acc |= self._bitmap_int(d)
+        return acc
+
+    def active_count(self, days: int = 1) -> int:
+        """Utilisateurs actifs sur les `days` derniers jours (1 = DAU, 7 = WAU, 30 = MAU)."""
+        if days <= 1:
+            return self.day_counts.get(_day_number(), 0)
+        cached = self._union_cache.get(days)
+        now = time.monotonic()
+        if cached and now - cached[0] < 10.0:
+            _cache_hit("activity_union", True)
+            return cached[1]
+        _cache_hit("activity_union", False)
+        n = self._union(days).bit_count()
+        self._union_cache[days] = (now, n)
+        return n
+
+    def active_ids(self, days: int) -> list[int]:
+        """chat_ids actifs sur les `days` derniers jours (segmentation des diffusions)."""
+        acc = self._union(max(1, days))
+        raw = acc.to_bytes((acc.bit_length() + 7) // 8, "little")
+        res = []
+        for i, byte in enumerate(raw):
+            if byte:
+                base = i << 3
+                for b in range(8):
+                    if byte >> b & 1:
+                        res.append(self.ids[base + b])
+        return res
+
+    def new_today(self) -> int:
+        return self.new_counts.get(_day_number(), 0)
+
+    def seed(self, chat_ids) -> None:
+        """Ajoute les utilisateurs historiques (users.json) sans horodatage connu."""
+        for cid in chat_ids:
+            if cid not in self.ordinals:
+                self.ordinals[cid] = len(self.ids)
+                self.ids.append(cid)
+                self.first_seen.append(0)
+                self.last_seen.append(0)
+                self.dirty = True
+
+    def subset(self, keep) -> "_ActivityIndex":
+        """Index restreint aux chat_ids retenus par keep() (répartition entre workers)."""
+        idx = _ActivityIndex()
+        remap: dict[int, int] = {}
+        for o, cid in enumerate(self.ids):
+            if keep(cid):
+                remap[o] = len(idx.ids)
+                idx.ordinals[cid] = remap[o]
+                idx.ids.append(cid)
+                idx.first_seen.append(self.first_seen[o])
+                idx.last_seen.append(self.last_seen[o])
+                if self.first_seen[o]:
+                    day = _day_number(self.first_seen[o])
+                    idx.new_counts[day] = idx.new_counts.get(day, 0) + 1
+        today = _day_number()
+        for day in set(self.hot) | set(self.cold):
+            raw = self.hot.get(day)
+            raw = raw if raw is not None else zlib.decompress(self.cold[day])
+            bm = bytearray((len(idx.ids) + 7) // 8)
+            n = 0
+            for i, byte in enumerate(raw):
+                if byte:
+                    for b in range(8):
+                        new = remap.get((i << 3) + b) if byte >> b & 1 else None
+                        if new is not None:
+                            bm[new >> 3] |= 1 << (new & 7)
+                            n += 1
+            if day > today - _ACTIVITY_HOT_DAYS:
+                idx.hot[day] = bm
+            else:
+                idx.cold[day] = zlib.compress(bytes(bm))
+            idx.day_counts[day] = n
+        idx.dirty = True
+        return idx
+
+    def snapshot(self) -> dict:
+        """Copie brute prise sur la boucle (copies mémoire uniquement); voir _encode_activity."""
+        self.dirty = False
+        return {
+            "ids": self.ids.tobytes(),
+            "first_seen": self.first_seen.tobytes(),
+            "last_seen": self.last_seen.tobytes(),
+            "hot": {d: bytes(bm) for d, bm in self.hot.items()},
+            "cold": dict(self.cold),
+            "day_counts": dict(self.day_counts),
+            "new_counts": dict(self.new_counts),
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "_ActivityIndex":
+        idx = cls()
+        dec = lambda key: array("q", zlib.decompress(base64.b64decode(data.get(key) or "")) if data.get(key) else b"")
+        ids, first, last = dec("ids"), dec("first_seen"), dec("last_seen")
+        if len(first) != len(ids) or len(last) != len(ids):
+            first, last = array("q", [0] * len(ids)), array("q", [0] * len(ids))
+        idx.ids = ids
+        idx.ordinals = {cid: o for o, cid in enumerate(ids)}
+        idx.first_seen = first
+        idx.last_seen = last
+        today = _day_number()
+        for d, b64 in (data.get("days") or {}).items():
+            raw = base64.b64decode(b64)
+            if int(d) > today - _ACTIVITY_HOT_DAYS:
+                idx.hot[int(d)] = bytearray(zlib.decompress(raw))
+            else:
+                idx.cold[int(d)] = raw
+        idx.day_counts = {int(d): int(n) for d, n in (data.get("day_counts") or {}).items()}
+        idx.new_counts = {int(d): int(n) for d, n in (data.get("new_counts") or {}).items()}
+        idx._rotate(today)
+        return idx
+
+def _load_activity_file(path: str) -> _ActivityIndex | None:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+            if isinstance(data, dict):
+                return _ActivityIndex.from_dict(data)
+    except Exception:
+        pass
+    return None
+
+def _owns_chat(chat_id: int) -> bool:
+    """Le worker courant traite-t-il ce chat (même répartition que le front)?"""
+    return _WORKER_INDEX is None or int(chat_id) % BOT_WORKERS == _WORKER_INDEX
+
+def _load_activity() -> _ActivityIndex:
+    idx = _load_activity_file(_ACTIVITY_PATH)
+    if idx is None and _WORKER_INDEX is not None:
+        # Premier démarrage en multi-worker: part de l'index global pour les chats de ce worker
+        legacy = _load_activity_file(os.path.join(_BASE_DIR, "activity.json"))
+        idx = legacy.subset(_owns_chat) if legacy is not None else None
+    if idx is None:
+        idx = _ActivityIndex()
+    try:
+        with open(_USERS_PATH, "r", encoding="utf-8") as f:
+            data = json.load(f)
+            if isinstance(data, list):
+                idx.seed(int(x) for x in data if _owns_chat(int(x)))
+    except Exception:
+        pass
+    return idx
+
+def _write_bytes_atomic(path: str, data: bytes) -> None:
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+def _write_json_atomic(path: str, data, **dump_kwargs) -> None:
+    """Écrit via un fichier temporaire puis os.replace: jamais de JSON tronqué en cas de crash."""
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, **dump_kwargs)
+    os.replace(tmp, path)
+
+_ACTIVITY = _load_activity()
+_ACTIVITY_FLUSH_INTERVAL = float(os.getenv("ACTIVITY_FLUSH_INTERVAL", "60"))
+_ACTIVITY_LAST_FLUSH = time.monotonic()
+
+def _encode_activity(snap: dict) -> dict:
+    """Encodage compact (zlib + base64) d'un instantané, exécuté hors de la boucle."""
+    enc = lambda b: base64.b64encode(zlib.compress(b)).decode("ascii")
+    days = {str(d): enc(bm) for d, bm in snap["hot"].items()}
+    days.update({str(d): base64.b64encode(raw).decode("ascii") for d, raw in snap["cold"].items()})
+    return {
+        "v": 1,
+        "ids": enc(snap["ids"]),
+        "first_seen": enc(snap["first_seen"]),
+        "last_seen": enc(snap["last_seen"]),
+        "days": days,
+        "day_counts": {str(d): n for d, n in snap["day_counts"].items()},
+        "new_counts": {str(d): n for d, n in snap["new_counts"].items()},
+    }
+
+_FLUSH_STORES = ("metrics", "users", "series", "activity")
+
+def _flush_sync(snapshot: dict | None, new_users: list[int], deltas: dict, clicks: dict, series: dict | None = None, files: list | None = None) -> tuple[dict, list]:
+    """Écritures groupées exécutées dans le thread d'E/S.
+    Retourne ({magasin: écrit}, fichiers _JsonFile dont l'écriture a échoué).
+    """
+    ok = dict.fromkeys(_FLUSH_STORES, True)
+    failed_files = [jf for jf, value in files or () if not jf.write_sync(value, merge=True)]
+    if series is not None:
+        try:
+            _write_json_atomic(_SERIES_PATH, series, separators=(",", ":"))
+        except Exception:
+            ok["series"] = False
+            _log.exception("flush series")
+    if deltas or clicks:
+        try:
+            with _shared_lock():
+                _apply_metric_deltas_sync(deltas, clicks)
+        except Exception:
+            ok["metrics"] = False
+            _log.exception("flush metrics")
+    if new_users:
+        try:
+            with _shared_lock():
+                ok["users"] = _save_users(_load_users_file() + new_users)
+        except Exception:
+            ok["users"] = False
+            _log.exception("flush users")
+    if snapshot is not None:
+        try:
+            _write_json_atomic(_ACTIVITY_PATH, _encode_activity(snapshot), separators=(",", ":"))
+        except Exception:
+            ok["activity"] = False
+            _log.exception("flush activity")
+    return ok, failed_files
+
+async def _flush_all(force: bool = False) -> None:
+    """Écrit les états différés: instantané pris sur la boucle, écriture dans un thread.
+    Compteurs et nouveaux utilisateurs partent à chaque passage; l'index d'activité, plus
+    lourd, toutes les _ACTIVITY_FLUSH_INTERVAL secondes (ou immédiatement si force=True).
+    """
+    global _ACTIVITY_LAST_FLUSH
+    if _RECORDER.enabled:
+        _RECORDER.flush()
+    new_users = sorted(_PENDING_NEW_USERS)
+    # Surcharge niveau 2+: seuls users.json et sent_log partent; statistiques gardées en mémoire
+    defer = not force and _OVERLOAD.stage >= 2
+    snapshot = None
+    if not defer and _ACTIVITY.dirty and (force or time.monotonic() - _ACTIVITY_LAST_FLUSH >= _ACTIVITY_FLUSH_INTERVAL):
+        snapshot = _ACTIVITY.snapshot()
+        _ACTIVITY_LAST_FLUSH = time.monotonic()
+    deltas, clicks = _take_metric_deltas() if not defer else ({}, {})
+    series = _SERIES.snapshot() if _SERIES.dirty and not defer else None
+    files = [(jf, v) for jf in ((_SENT_LOG,) if defer else (_SENT_LOG, _USERNAMES)) if (v := jf.take_dirty()) is not None]
+    if defer:
+        _OVERLOAD_SHED.inc("deferred_flush")
+    if not new_users and snapshot is None and not deltas and not clicks and series is None and not files:
+        return
+    try:
+        ok, failed_files = await _io(_flush_sync, snapshot, new_users, deltas, clicks, series, files)
+    except Exception:
+        # Rien n'est confirmé écrit: tout repart au prochain passage
+        _log.exception("flush")
+        ok, failed_files = dict.fromkeys(_FLUSH_STORES, False), [jf for jf, _ in files]
+    # Ce qui n'a pas été écrit est remis en attente (nouveaux utilisateurs: restent dans _PENDING_NEW_USERS)
+    if not ok["metrics"]:
+        _restore_metric_deltas(deltas, clicks)
+    if not ok["series"] and series is not None:
+        _SERIES.dirty = True
+    if not ok["activity"] and snapshot is not None:
+        _ACTIVITY.dirty = True
+    for jf in failed_files:
+        jf.mark_dirty()
+    if ok["users"]:
+        _PENDING_NEW_USERS.difference_update(new_users)
+
+async def _flush_loop() -> None:
+    """Tâche de fond: écritures groupées toutes les _FLUSH_INTERVAL secondes."""
+    while True:
+        await asyncio.sleep(_FLUSH_INTERVAL)
+        try:
+            await _flush_all()
+        except Exception:
+            _log.exception("_flush_loop")
+
+# --------- Destinataires inactifs (bot bloqué, compte supprimé) ---------
+_INACTIVE_PATH = os.path.join(_BASE_DIR, "inactive_users.json")
+
+def _parse_inactive(data) -> dict[int, int]:
+    res: dict[int, int] = {}
+    if isinstance(data, dict):
+        for k, v in data.items():
+            try:
+                res[int(k)] = int(v)
+            except Exception:
+                pass
+    return res
+
+_INACTIVE = _JsonFile(_INACTIVE_PATH, _parse_inactive)  # chat_id -> timestamp du premier échec définitif
+# Fragments de BadRequest qui signifient que le chat n'existe plus pour le bot
+_DEAD_BADREQUEST_MARKERS = ("chat not found", "user is deactivated", "peer_id_invalid", "bot was blocked", "user not found")
+
+def _load_inactive() -> dict[int, int]:
+    return _INACTIVE.get()
+
+def _save_inactive(changes: dict[int, int | None]):
+    """Applique des marquages (timestamp) / réactivations (None) au fichier, relu sous verrou:
+    les changements faits par d'autres workers ne sont pas écrasés.
+    """
+    def apply(data: dict) -> None:
+        for cid, ts in changes.items():
+            if ts is None:
+                data.pop(cid, None)
+            else:
+                data.setdefault(cid, ts)
+    _io_submit(_INACTIVE.update_sync, apply)
+
+def _classify_send_error(exc: BaseException) -> str:
+    """Classe un échec d'envoi: "dead" (ne plus réessayer), "retry" (temporaire) ou "other"."""
+    if isinstance(exc, Forbidden):
+        return "dead"
+    if isinstance(exc, BadRequest):
+        msg = str(getattr(exc, "message", "") or exc).lower()
+        if any(marker in msg for marker in _DEAD_BADREQUEST_MARKERS):
+            return "dead"
+        return "other"
+    if isinstance(exc, (RetryAfter, TimedOut, NetworkError)):
+        return "retry"
+    return "other"
+
+def _mark_inactive(chat_ids) -> None:
+    """Marque des chats comme inactifs (horodatés); ignorés ensuite par les envois de masse."""
+    inactive = _load_inactive()
+    now = int(time.time())
+    changed: dict[int, int | None] = {}
+    for cid in chat_ids:
+        try:
+            cid = int(cid)
+        except Exception:
+            continue
+        if cid not in inactive:
+            inactive[cid] = now
+            changed[cid] = now
+    if changed:
+        _save_inactive(changed)
+
+def _reactivate_user(chat_id: int) -> None:
+    try:
+        inactive = _load_inactive()
+        if inactive.pop(int(chat_id), None) is not None:
+            _save_inactive({int(chat_id): None})
+    except Exception:
+        _log.exception("_reactivate_user")
+
+def _note_send_failure(chat_id: int, exc: BaseException, dead: set | None = None) -> str:
+    """Point d'entrée commun des échecs d'envoi: les chats morts sont marqués inactifs.
+    Si `dead` est fourni, les chats morts y sont collectés pour un marquage groupé.
+    """
+    kind = _classify_send_error(exc)
+    if kind == "dead":
+        if dead is not None:
+            dead.add(int(chat_id))
+        else:
+            _mark_inactive([chat_id])
+    return kind
+
+def _load_active_users():
+    """Utilisateurs enregistrés moins les chats marqués inactifs (ensemble de diffusion effectif)."""
+    inactive = _load_inactive()
+    return [u for u in _load_users() if u not in inactive]
 
 
 def _load_config():
@@ -392,13 +1406,7 @@ def _load_config():
         "whatsapp_url": "",
         "whatsapp_label": "WhatsApp 💚",
     }
-    try:
-        with open(_CONFIG_PATH, "r", encoding="utf-8") as f:
-            data = json.load(f)
-            if isinstance(data, dict):
-                defaults.update(data)
-    except Exception:
-        pass
+    defaults.update(copy.deepcopy(_CONFIG.get()))
     try:
         defaults["admin_ids"] = [int(x) for x in defaults.get("admin_ids", [])]
     except Exception:
@@ -410,39 +1418,113 @@ def _save_config(cfg: dict):
     try:
         existing = _load_config()
         existing.update(cfg)
-        with open(_CONFIG_PATH, "w", encoding="utf-8") as f:
-            json.dump(existing, f, ensure_ascii=False, indent=2)
+        _CONFIG.set(existing)
     except Exception:
         pass
 
-def _load_bans():
+# Vue en lecture seule de la config fusionnée avec les défauts, recalculée seulement quand la copie
+# mémoire de config.json est remplacée (set, relecture): chemins chauds (_is_admin, claviers).
+_CONFIG_VIEW: dict = {"src": None, "view": MappingProxyType({}), "admins": frozenset()}
+
+def _config_view() -> MappingProxyType:
+    """Config en lecture seule, partagée: ne pas modifier (utiliser _load_config pour modifier/sauver)."""
+    src = _CONFIG.get()
+    if _CONFIG_VIEW["src"] is not src:
+        cfg = _load_config()
+        admins = sorted(a for a in cfg["admin_ids"] if a)
+        _CONFIG_VIEW.update(src=src, view=MappingProxyType(cfg), admins=frozenset(admins))
+        ADMIN_IDS[:] = admins
+    return _CONFIG_VIEW["view"]
+
+def _parse_bans(data):
     try:
-        with open(_BANS_PATH, "r", encoding="utf-8") as f:
-            data = json.load(f)
-            if isinstance(data, list):
-                return [int(x) for x in data]
+        return sorted(set(int(x) for x in data)) if isinstance(data, list) else []
     except Exception:
-        pass
-    return []
+        return []
+
+_CONFIG = _JsonFile(_CONFIG_PATH, lambda data: data if isinstance(data, dict) else {}, ensure_ascii=False, indent=2)
+_BANS = _JsonFile(_BANS_PATH, _parse_bans)
+
+def _load_bans():
+    return list(_BANS.get())
 
 def _save_bans(bans):
     try:
-        uniq = sorted(set(int(x) for x in bans))
-        with open(_BANS_PATH, "w", encoding="utf-8") as f:
-            json.dump(uniq, f)
+        _BANS.set(sorted(set(int(x) for x in bans)))
     except Exception:
         pass
 
 def _is_banned(user_id: int) -> bool:
     try:
-        return int(user_id) in _load_bans()
+        return int(user_id) in _BANS.get()
     except Exception:
         return False
 
+def _refresh_files_sync() -> list:
+    """Thread d'E/S: relit les fichiers modifiables hors du bot (site, édition manuelle).
+    Les lectures sont adoptées ensuite sur la boucle (_refresh_files), jamais depuis ce thread.
+    """
+    reads = []
+    for jf in (_CONFIG, _BANS, _BROADCAST, _USERNAMES, _SENT_LOG, _LAST_BROADCAST, _INACTIVE):
+        try:
+            read = jf.read_sync()
+            if read is not None:
+                reads.append((jf, read))
+        except Exception:
+            _log.exception("relecture %s", os.path.basename(jf.path))
+    try:
+        _refresh_peers_sync()
+        _refresh_change_markers_sync()
+    except Exception:
+        _log.exception("relecture des autres workers")
+    return reads
+
+async def _refresh_files() -> None:
+    for jf, read in await _io(_refresh_files_sync):
+        jf.adopt(read)
+
+# Marqueurs de changement entre workers: fichier .changed-<nom> réécrit à chaque modification;
+# un worker qui voit sa signature changer vide le cache mémoire correspondant
+_CHANGE_MARKERS = {"shop": lambda: _SHOP_CACHE.clear()}
+_CHANGE_SIGS: dict[str, tuple | None] = {}
+
+def _touch_change_marker_sync(name: str) -> None:
+    try:
+        with open(os.path.join(_BASE_DIR, f".changed-{name}"), "w") as f:
+            f.write(str(time.time_ns()))
+    except OSError:
+        pass
+
+def _refresh_change_markers_sync() -> None:
+    if BOT_WORKERS <= 1:
+        return
+    for name, clear in _CHANGE_MARKERS.items():
+        try:
+            st = os.stat(os.path.join(_BASE_DIR, f".changed-{name}"))
+            sig = (st.st_mtime_ns, st.st_size)
+        except OSError:
+            sig = None
+        if name in _CHANGE_SIGS and _CHANGE_SIGS[name] != sig:
+            clear()
+        _CHANGE_SIGS[name] = sig
+
+async def _refresh_files_loop() -> None:
+    """Tâche de fond: garde les copies mémoire alignées sur le disque."""
+    while True:
+        await asyncio.sleep(_FILES_REFRESH_INTERVAL)
+        try:
+            await _refresh_files()
+        except Exception:
+            _log.exception("_refresh_files_loop")
+
 # --------- Métriques d'usage ---------
 _METRICS_PATH = os.path.join(_BASE_DIR, "metrics.json")
 
-def _load_metrics():
+# Compteurs en mémoire (incréments sans verrou sur la boucle asyncio), vidés par _flush_all
+_METRIC_DELTAS: dict[str, int] = {}
+_CLICK_DELTAS: dict[str, int] = {}
+
+def _load_metrics_file():
     defaults = {"starts_total": 0, "clicks": {}, "created_at": int(time.time())}
     try:
         with open(_METRICS_PATH, "r", encoding="utf-8") as f:
@@ -460,50 +1542,383 @@ def _load_metrics():
         pass
     return defaults
 
-def _save_metrics(metrics: dict):
-    try:
-        with open(_METRICS_PATH, "w", encoding="utf-8") as f:
-            json.dump(metrics, f, ensure_ascii=False, indent=2)
-    except Exception:
-        pass
+async def _load_metrics():
+    """metrics.json (lu dans le thread d'E/S) + incréments pas encore écrits (vue à jour pour adm_stats)."""
+    m = await _io(_load_metrics_file)
+    for k, v in list(_METRIC_DELTAS.items()):
+        m[k] = int(m.get(k, 0)) + v
+    clicks = m["clicks"]
+    for k, v in list(_CLICK_DELTAS.items()):
+        clicks[k] = int(clicks.get(k, 0)) + v
+    return m
 
 def _inc_metric(key: str, amount: int = 1):
-    try:
-        m = _load_metrics()
-        m[key] = int(m.get(key, 0)) + int(amount)
-        _save_metrics(m)
-    except Exception:
-        pass
+    _METRIC_DELTAS[key] = _METRIC_DELTAS.get(key, 0) + int(amount)
+    if key == "starts_total":
+        _SERIES.add(_SERIES_START_KEY, int(amount))
 
 def _inc_click(name: str, amount: int = 1):
+    _CLICK_DELTAS[name] = _CLICK_DELTAS.get(name, 0) + int(amount)
+    _SERIES.add(name, int(amount))
+
+def _take_metric_deltas():
+    """Échange les compteurs en cours contre des vides (sur la boucle) et renvoie les anciens."""
+    global _METRIC_DELTAS, _CLICK_DELTAS
+    deltas, clicks = _METRIC_DELTAS, _CLICK_DELTAS
+    _METRIC_DELTAS, _CLICK_DELTAS = {}, {}
+    return deltas, clicks
+
+def _restore_metric_deltas(deltas: dict, clicks: dict) -> None:
+    """Réinjecte des incréments dont l'écriture a échoué (réessayés au prochain passage)."""
+    for k, v in deltas.items():
+        _METRIC_DELTAS[k] = _METRIC_DELTAS.get(k, 0) + v
+    for k, v in clicks.items():
+        _CLICK_DELTAS[k] = _CLICK_DELTAS.get(k, 0) + v
+
+def _apply_metric_deltas_sync(deltas: dict, clicks: dict) -> None:
+    """Fusionne des incréments dans metrics.json (même format qu'avant); exécuté hors boucle."""
+    m = _load_metrics_file()
+    for k, v in deltas.items():
+        m[k] = int(m.get(k, 0)) + v
+    for k, v in clicks.items():
+        m["clicks"][k] = int(m["clicks"].get(k, 0)) + v
+    _write_json_atomic(_METRICS_PATH, m, ensure_ascii=False, indent=2)
+
+# --------- Séries temporelles (par heure / par jour) ---------
+_SERIES_PATH = os.path.join(_BASE_DIR, _shard_file("metrics_series.json"))
+_SERIES_HOURS = 48
+_SERIES_DAYS = 30
+_SERIES_MAX_KEYS = 64  # au-delà, les nouvelles clés sont cumulées dans "autres"
+_SERIES_START_KEY = "/start"
+
+class _RingSeries:
+    """Compteurs sur une fenêtre glissante de taille fixe (un emplacement par intervalle)."""
+
+    def __init__(self, size: int):
+        self.size = size
+        self.values = array("q", [0] * size)
+        self.buckets = array("q", [-1] * size)
+
+    def add(self, bucket: int, n: int = 1) -> None:
+        i = bucket % self.size
+        if self.buckets[i] != bucket:
+            if bucket < self.buckets[i]:
+                return  # intervalle déjà sorti de la fenêtre
+            self.buckets[i] = bucket
+            self.values[i] = 0
+        self.values[i] += n
+
+    def window(self, last_bucket: int, count: int) -> list[int]:
+        """Valeurs des `count` derniers intervalles, du plus ancien au plus récent."""
+        out = []
+        for b in range(last_bucket - count + 1, last_bucket + 1):
+            i = b % self.size
+            out.append(self.values[i] if self.buckets[i] == b else 0)
+        return out
+
+    def dump(self) -> list[list[int]]:
+        return [[b, v] for b, v in zip(self.buckets, self.values) if b >= 0 and v]
+
+    def load(self, pairs) -> None:
+        for b, v in pairs or []:
+            self.add(int(b), int(v))
+
+def _hour_bucket(ts: float | None = None) -> int:
+    return int((time.time() if ts is None else ts) // 3600)
+
+class _TimeSeries:
+    """Séries horaires et journalières par clé (/start et chaque bouton), mémoire bornée."""
+
+    def __init__(self):
+        self.hourly: dict[str, _RingSeries] = {}
+        self.daily: dict[str, _RingSeries] = {}
+        self.dirty = False
+
+    def _key(self, name: str) -> str:
+        if name in self.hourly or len(self.hourly) < _SERIES_MAX_KEYS:
+            return name
+        return "autres"
+
+    def add(self, name: str, n: int = 1, ts: float | None = None) -> None:
+        ts = time.time() if ts is None else ts
+        key = self._key(name)
+        if key not in self.hourly:
+            self.hourly[key] = _RingSeries(_SERIES_HOURS)
+            self.daily[key] = _RingSeries(_SERIES_DAYS)
+        self.hourly[key].add(_hour_bucket(ts), n)
+        self.daily[key].add(_day_number(ts), n)
+        self.dirty = True
+
+    def last_hours(self, name: str, hours: int = 24) -> list[int]:
+        s = self.hourly.get(name)
+        return s.window(_hour_bucket(), hours) if s else [0] * hours
+
+    def last_days(self, name: str, days: int = 7) -> list[int]:
+        s = self.daily.get(name)
+        return s.window(_day_number(), days) if s else [0] * days
+
+    def top(self, hours: int = 24, n: int = 8, exclude: tuple = (_SERIES_START_KEY,)) -> list[tuple[str, int]]:
+        totals = [(k, sum(self.last_hours(k, hours))) for k in self.hourly if k not in exclude]
+        totals = [t for t in totals if t[1]]
+        totals.sort(key=lambda t: t[1], reverse=True)
+        return totals[:n]
+
+    def snapshot(self) -> dict:
+        self.dirty = False
+        return {
+            "hourly": {k: s.dump() for k, s in self.hourly.items()},
+            "daily": {k: s.dump() for k, s in self.daily.items()},
+        }
+
+    @classmethod
+    def merged(cls, shards) -> "_TimeSeries":
+        """Somme de plusieurs séries (une par worker)."""
+        ts = cls()
+        for shard in shards:
+            for k, ring in list(shard.hourly.items()):
+                ts.hourly.setdefault(k, _RingSeries(_SERIES_HOURS)).load(ring.dump())
+            for k, ring in list(shard.daily.items()):
+                ts.daily.setdefault(k, _RingSeries(_SERIES_DAYS)).load(ring.dump())
+        return ts
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "_TimeSeries":
+        ts = cls()
+        for k, pairs in (data.get("hourly") or {}).items():
+            ts.hourly[k] = _RingSeries(_SERIES_HOURS)
+            ts.hourly[k].load(pairs)
+            ts.daily[k] = _RingSeries(_SERIES_DAYS)
+        for k, pairs in (data.get("daily") or {}).items():
+            ts.daily.setdefault(k, _RingSeries(_SERIES_DAYS)).load(pairs)
+            ts.hourly.setdefault(k, _RingSeries(_SERIES_HOURS))
+        return ts
+
+def _load_series_file(path: str) -> _TimeSeries | None:
     try:
-        m = _load_metrics()
-        clicks = m.get("clicks") or {}
-        clicks[name] = int(clicks.get(name, 0)) + int(amount)
-        m["clicks"] = clicks
-        _save_metrics(m)
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+            if isinstance(data, dict):
+                return _TimeSeries.from_dict(data)
     except Exception:
         pass
+    return None
 
+def _load_series() -> _TimeSeries:
+    series = _load_series_file(_SERIES_PATH)
+    if series is None and _WORKER_INDEX == 0:
+        series = _load_series_file(os.path.join(_BASE_DIR, "metrics_series.json"))  # historique mono-processus
+    return series or _TimeSeries()
 
-async def _get_welcome_media():
-    """Charge l'image locale IMG.jpg en mémoire (BytesIO) pour envoi fiable; max 10MB (limite Telegram)."""
-    base_dir = os.path.dirname(__file__)
-    local_path = (
-        WELCOME_IMAGE_PATH if os.path.isabs(WELCOME_IMAGE_PATH) else os.path.join(base_dir, WELCOME_IMAGE_PATH)
+_SERIES = _load_series()
+
+# --------- Données des autres workers (vues admin agrégées) ---------
+_PEERS: dict[str, tuple] = {}  # chemin -> (signature, index d'activité ou séries chargés)
+
+def _refresh_peers_sync() -> None:
+    """Thread d'E/S: recharge les fichiers par worker des autres workers qui ont changé."""
+    if _WORKER_INDEX is None:
+        return
+    for i in range(BOT_WORKERS):
+        if i == _WORKER_INDEX:
+            continue
+        for name, loader in (("activity.json", _load_activity_file), ("metrics_series.json", _load_series_file)):
+            path = os.path.join(_BASE_DIR, _shard_file(name, i))
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            sig = (st.st_mtime_ns, st.st_size)
+            if _PEERS.get(path, (None,))[0] != sig:
+                loaded = loader(path)
+                if loaded is not None:
+                    _PEERS[path] = (sig, loaded)
+
+def _activity_shards() -> list:
+    return [_ACTIVITY, *(o for _, o in list(_PEERS.values()) if isinstance(o, _ActivityIndex))]
+
+def _stats_series() -> _TimeSeries:
+    peers = [o for _, o in list(_PEERS.values()) if isinstance(o, _TimeSeries)]
+    return _TimeSeries.merged([_SERIES, *peers]) if peers else _SERIES
+# Graphique des stats: (heure, PNG, file_id Telegram) réutilisé jusqu'au changement d'heure
+_CHART_CACHE: dict = {"bucket": None, "png": None, "file_id": None}
+
+def _render_stats_chart(hourly_starts: list[int], hourly_clicks: list[int], daily_starts: list[int], daily_clicks: list[int]) -> bytes:
+    """Dessine le graphique des stats (PNG). Fonction pure, exécutée dans un thread."""
+    from PIL import Image, ImageDraw, ImageFont
+
+    W, H, pad = 960, 620, 40
+    img = Image.new("RGB", (W, H), (24, 26, 33))
+    draw = ImageDraw.Draw(img)
+    font = ImageFont.load_default()
+    col_start, col_click, col_axis = (88, 166, 255), (255, 159, 67), (90, 94, 110)
+
+    def panel(top: int, title: str, a: list[int], b: list[int], labels: list[str]):
+        h = 230
+        x0, x1, y0, y1 = pad, W - pad, top + 24, top + 24 + h
+        draw.text((x0, top), title, fill=(230, 230, 235), font=font)
+        draw.line([(x0, y1), (x1, y1)], fill=col_axis)
+        peak = max([1] + a + b)
+        draw.text((x0, y0 - 2), str(peak), fill=col_axis, font=font)
+        n = max(1, len(a))
+        slot = (x1 - x0) / n
+        bw = max(1.0, slot * 0.4)
+        for i in range(n):
+            x = x0 + i * slot
+            for j, (vals, col) in enumerate(((a, col_start), (b, col_click))):
+                v = vals[i] if i < len(vals) else 0
+                if v:
+                    bh = (v / peak) * (h - 14)
+                    draw.rectangle([x + j * bw, y1 - bh, x + (j + 1) * bw - 1, y1], fill=col)
+            step = max(1, n // 12)
+            if i % step == 0 and i < len(labels):
+                draw.text((x, y1 + 4), labels[i], fill=col_axis, font=font)
+
+    now = time.time()
+    hour_labels = [time.strftime("%Hh", time.localtime(now - (len(hourly_starts) - 1 - i) * 3600)) for i in range(len(hourly_starts))]
+    day_labels = [time.strftime("%d/%m", time.localtime(now - (len(daily_starts) - 1 - i) * 86400)) for i in range(len(daily_starts))]
+    panel(10, f"Dernieres {len(hourly_starts)} h  (bleu: /start, orange: clics)", hourly_starts, hourly_clicks, hour_labels)
+    panel(320, f"Derniers {len(daily_starts)} jours", daily_starts, daily_clicks, day_labels)
+    out = BytesIO()
+    img.save(out, format="PNG", optimize=True)
+    return out.getvalue()
+
+def _sum_series(rows: list[list[int]]) -> list[int]:
+    return [sum(col) for col in zip(*rows)] if rows else []
+
+async def _get_stats_chart():
+    """PNG (ou file_id déjà téléversé) du graphique; recalculé une fois par heure au plus."""
+    bucket = _hour_bucket()
+    if _CHART_CACHE["bucket"] == bucket and (_CHART_CACHE["file_id"] or _CHART_CACHE["png"]):
+        _cache_hit("stats_chart", True)
+        return _CHART_CACHE["file_id"] or _CHART_CACHE["png"]
+    _cache_hit("stats_chart", False)
+    series = _stats_series()
+    click_keys = [k for k in series.hourly if k != _SERIES_START_KEY]
+    args = (
+        series.last_hours(_SERIES_START_KEY, _SERIES_HOURS),
+        _sum_series([series.last_hours(k, _SERIES_HOURS) for k in click_keys]) or [0] * _SERIES_HOURS,
+        series.last_days(_SERIES_START_KEY, _SERIES_DAYS),
+        _sum_series([series.last_days(k, _SERIES_DAYS) for k in click_keys]) or [0] * _SERIES_DAYS,
     )
-    if not os.path.exists(local_path):
-        return None
+    png = await asyncio.to_thread(_render_stats_chart, *args)
+    _CHART_CACHE.update({"bucket": bucket, "png": png, "file_id": None})
+    return png
+
+# --------- Diffusion (broadcast) ---------
+_BROADCAST_PATH = os.path.join(_BASE_DIR, "broadcast.json")
+_LAST_BROADCAST_PATH = os.path.join(_BASE_DIR, "last_broadcast.json")
+# Telegram limite à ~30 messages/s au global: rester en dessous par défaut
+_BROADCAST_RATE = float(os.getenv("BROADCAST_RATE", "25"))
+_BROADCAST_CONCURRENCY = int(os.getenv("BROADCAST_CONCURRENCY", "16"))
+_BROADCAST_PROGRESS_EVERY = 2.0  # secondes entre mises à jour de la progression
+_BROADCAST_RUNNING = False
+
+def _parse_last_broadcast(data):
+    res = []
+    if isinstance(data, dict):
+        for x in data.get("messages") or []:
+            try:
+                res.append({"chat_id": int(x.get("chat_id")), "message_id": int(x.get("message_id"))})
+            except Exception:
+                pass
+        return {"id": str(data.get("id") or ""), "messages": res}
+    return {"id": "", "messages": []}
+
+_BROADCAST = _JsonFile(_BROADCAST_PATH, lambda data: data if isinstance(data, dict) else {}, ensure_ascii=False)
+_LAST_BROADCAST = _JsonFile(_LAST_BROADCAST_PATH, _parse_last_broadcast)
+
+def _load_broadcast():
+    defaults = {"text": "", "media_url": None, "media_type": None, "updated_at": None}
+    defaults.update(copy.deepcopy(_BROADCAST.get()))
+    return defaults
+
+def _save_broadcast(draft: dict):
+    _BROADCAST.set(dict(draft))
+
+def _load_last_broadcast():
+    last = _LAST_BROADCAST.get()
+    return {"id": last["id"], "messages": list(last["messages"])}
+
+def _save_last_broadcast(data: dict):
+    _LAST_BROADCAST.set({"id": str(data.get("id") or ""), "messages": list(data.get("messages") or [])})
+
+class _RateLimiter:
+    """Seau à jetons asynchrone partagé par les envois de masse (limite globale Telegram)."""
+
+    def __init__(self, rate: float, burst: int | None = None):
+        self.rate = max(0.1, float(rate))
+        self.capacity = float(burst or max(1, int(self.rate)))
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds: float) -> None:
+        """Suspend tous les envois (RetryAfter reçu: l'attente est globale côté Telegram)."""
+        self._paused_until = max(self._paused_until, time.monotonic() + float(seconds))
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+# file_id: identifiant Telegram de l'image une fois envoyée (plus de téléversement ensuite)
+_WELCOME_MEDIA_CACHE: dict = {"sig": None, "data": None, "file_id": None}
+
+def _read_welcome_bytes(local_path: str) -> tuple[bytes | None, bool]:
+    """Thread d'E/S: (contenu de l'image d'accueil, hit du cache); relue seulement si le fichier a changé.
+    Le hit est compté par l'appelant, sur la boucle (métriques jamais modifiées hors de la boucle).
+    """
     try:
+        st = os.stat(local_path)
+    except OSError:
+        return None, False
+    sig = (st.st_mtime_ns, st.st_size)
+    hit = _WELCOME_MEDIA_CACHE["sig"] == sig
+    if not hit:
         with open(local_path, "rb") as f:
             data = f.read()
+        _WELCOME_MEDIA_CACHE.update(sig=sig, data=data, file_id=None)
+    return _WELCOME_MEDIA_CACHE["data"], hit
+
+async def _get_welcome_media():
+    """Image d'accueil: file_id déjà connu, sinon IMG.jpg en mémoire (BytesIO); max 10MB (limite Telegram)."""
+    local_path = (
+        WELCOME_IMAGE_PATH if os.path.isabs(WELCOME_IMAGE_PATH) else os.path.join(_BASE_DIR, WELCOME_IMAGE_PATH)
+    )
+    try:
+        data, hit = await _io(_read_welcome_bytes, local_path)
+        if data is not None:
+            _cache_hit("welcome_media", hit)
         # Telegram: photo max 10MB
-        if len(data) > 10 * 1024 * 1024:
+        if not data or len(data) > 10 * 1024 * 1024:
             return None
+        if _WELCOME_MEDIA_CACHE["file_id"]:
+            return _WELCOME_MEDIA_CACHE["file_id"]
         return InputFile(BytesIO(data), filename=os.path.basename(local_path))
     except Exception:
         return None
 
+def _note_welcome_media(msg, media) -> None:
+    """Retient le file_id de l'image d'accueil après son premier téléversement réussi."""
+    if isinstance(media, InputFile) and getattr(msg, "photo", None):
+        _WELCOME_MEDIA_CACHE["file_id"] = msg.photo[-1].file_id
+
+def _forget_welcome_media(media) -> None:
+    """Envoi refusé avec le file_id (jeton changé, fichier expiré): retéléverser la prochaine fois."""
+    if isinstance(media, str) and media == _WELCOME_MEDIA_CACHE["file_id"]:
+        _WELCOME_MEDIA_CACHE["file_id"] = None
+
 
 def _get_default_button_label(cfg, key):
     """Label des boutons par défaut (config ou valeur par défaut)."""
@@ -550,7 +1965,7 @@ def _build_welcome_keyboard_layout(cfg, hidden=None, bot_username=None, for_chan
                 # Dans les canaux, web_app est interdit (BUTTON_TYPE_INVALID) → toujours url
                 if key == "miniapp" and not for_channel:
                     try:
-                        mode = os.getenv("MINIAPP_OPEN_MODE", "webapp").lower()
+                        mode = MINIAPP_OPEN_MODE
                         if mode == "webapp":
                             return InlineKeyboardButton(label, web_app=WebAppInfo(url=str(value).strip()))
                     except Exception:
@@ -626,8 +2041,8 @@ def _build_welcome_keyboard_layout(cfg, hidden=None, bot_username=None, for_chan
                 rows.append(temp_row)
 
         return InlineKeyboardMarkup(rows) if rows else InlineKeyboardMarkup([[]])
-    except Exception as e:
-        print(f"[ERROR] _build_welcome_keyboard_layout: {e}")
+    except Exception:
+        _log.exception("_build_welcome_keyboard_layout")
         return InlineKeyboardMarkup([[]])
 
 
@@ -641,6 +2056,12 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         except Exception:
             pass
         return
+    # Surcharge niveau 3: /start répétés d'un même utilisateur ignorés (admins exclus)
+    stage = _OVERLOAD.stage
+    user = update.effective_user
+    if stage >= 3 and user and not _is_admin(user.id) and not _OVERLOAD.allow_start(user.id, time.monotonic()):
+        _OVERLOAD_SHED.inc("start_limited")
+        return
 
     # Enregistrer l'utilisateur qui démarre le bot
     try:
@@ -662,30 +2083,38 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     main_caption = WELCOME_CAPTION_TEXT
     # Surcharger via config.json si présent
     try:
-        cfg = _load_config()
+        cfg = _config_view()
         if cfg.get("welcome_caption"):
             main_caption = cfg.get("welcome_caption")
     except Exception:
         pass
     # Clavier exactement comme l'image : 1 pleine largeur + 2x2
     try:
-        cfg2 = _load_config()
+        cfg2 = _config_view()
     except Exception:
         cfg2 = {}
     reply_markup = _build_welcome_keyboard_layout(cfg2)
     caption = main_caption
-    media = await _get_welcome_media()
+    # Surcharge niveau 1+: accueil en texte seul (pas de photo)
+    if stage >= 1:
+        media = None
+        _OVERLOAD_SHED.inc("text_welcome")
+    else:
+        media = await _get_welcome_media()
     try:
         if media is not None:
             m = await context.bot.send_photo(chat_id=update.effective_chat.id, photo=media, caption=caption, reply_markup=reply_markup)
+            _note_welcome_media(m, media)
         else:
             m = await context.bot.send_message(chat_id=update.effective_chat.id, text=caption, reply_markup=reply_markup)
         try:
             _append_sent_log(update.effective_chat.id, m.message_id)
         except Exception:
             pass
-    except Exception:
-        pass
+    except Exception as e:
+        if isinstance(e, BadRequest):
+            _forget_welcome_media(media)
+        _note_send_failure(update.effective_chat.id, e)
     return
 
 
@@ -722,7 +2151,7 @@ async def handle_category(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     try:
         if str(data).startswith("custom:"):
             cid = str(data).split(":", 1)[1]
-            cfg = _load_config()
+            cfg = _config_view()
             customs = cfg.get("custom_buttons", [])
             for c in customs:
                 if str(c.get("id")) == str(cid):
@@ -735,8 +2164,8 @@ async def handle_category(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
                                     _append_sent_log(m.chat.id, m.message_id)
                                 except Exception:
                                     pass
-                            except Exception:
-                                pass
+                            except Exception as e:
+                                _note_send_failure(query.message.chat_id, e)
                         return
                     # Si type=url, le bouton doit être créé avec url et ne passe pas par ici
                     break
@@ -756,14 +2185,14 @@ async def handle_category(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     if data == "back":
         main_caption = WELCOME_CAPTION_TEXT
         try:
-            cfg = _load_config()
+            cfg = _config_view()
             if cfg.get("welcome_caption"):
                 main_caption = cfg.get("welcome_caption")
         except Exception:
             pass
         await query.edit_message_caption(caption=main_caption)
         try:
-            cfg3 = _load_config()
+            cfg3 = _config_view()
         except Exception:
             cfg3 = {}
         reply_markup = _build_welcome_keyboard_layout(cfg3)
@@ -781,7 +2210,7 @@ async def handle_category(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     text = responses.get(data, "Catégorie inconnue.")
     await query.edit_message_caption(caption=text)
     try:
-        cfg4 = _load_config()
+        cfg4 = _config_view()
     except Exception:
         cfg4 = {}
     reply_markup = _build_welcome_keyboard_layout(cfg4)
@@ -824,7 +2253,7 @@ async def handle_category(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     try:
         if str(data).startswith("custom:"):
             cid = str(data).split(":", 1)[1]
-            cfg = _load_config()
+            cfg = _config_view()
             customs = cfg.get("custom_buttons", [])
             for c in customs:
                 if str(c.get("id")) == str(cid):
@@ -837,8 +2266,8 @@ async def handle_category(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
                                     _append_sent_log(m.chat.id, m.message_id)
                                 except Exception:
                                     pass
-                            except Exception:
-                                pass
+                            except Exception as e:
+                                _note_send_failure(query.message.chat_id, e)
                         return
                     # Si type=url, le bouton doit être créé avec url et ne passe pas par ici
                     break
@@ -858,14 +2287,14 @@ async def handle_category(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     if data == "back":
         main_caption = WELCOME_CAPTION_TEXT
         try:
-            cfg = _load_config()
+            cfg = _config_view()
             if cfg.get("welcome_caption"):
                 main_caption = cfg.get("welcome_caption")
         except Exception:
             pass
         await query.edit_message_caption(caption=main_caption)
         try:
-            cfg3 = _load_config()
+            cfg3 = _config_view()
         except Exception:
             cfg3 = {}
         reply_markup = _build_welcome_keyboard_layout(cfg3)
@@ -883,7 +2312,7 @@ async def handle_category(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     text = responses.get(data, "Catégorie inconnue.")
     await query.edit_message_caption(caption=text)
     try:
-        cfg4 = _load_config()
+        cfg4 = _config_view()
     except Exception:
         cfg4 = {}
     reply_markup = _build_welcome_keyboard_layout(cfg4)
@@ -894,7 +2323,7 @@ async def page_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
     """Dans un canal, répond à /page en supprimant la commande et en postant l'accueil avec boutons."""
     if not update.effective_chat:
         try:
-            print("[ERROR] page_command: effective_chat is None")
+            _log.error("page_command: effective_chat is None")
         except Exception:
             pass
         return
@@ -906,20 +2335,20 @@ async def page_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
     except Exception as e:
         # Ignorer erreurs (permissions manquantes, bot non admin, etc.) mais logger
         try:
-            print(f"[WARN] page_command: impossible de supprimer le message: {e}")
+            _log.warning("page_command: impossible de supprimer le message: %s", e)
         except Exception:
             pass
     # Construire le même clavier que /start
     main_caption = WELCOME_CAPTION_TEXT
     try:
-        cfg = _load_config()
+        cfg = _config_view()
         if cfg.get("welcome_caption"):
             main_caption = cfg.get("welcome_caption")
     except Exception:
         pass
     # Même clavier que /start : layout comme l'image (Mini-App pleine largeur + grille 2x2)
     try:
-        cfg2 = _load_config()
+        cfg2 = _config_view()
     except Exception:
         cfg2 = {}
     # for_channel=True : bouton Mini App en URL uniquement (web_app interdit dans les canaux)
@@ -950,7 +2379,7 @@ async def page_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
             except Exception:
                 pass
         except Exception as e:
-            print(f"[ERROR] page_command send_photo+markup: {type(e).__name__}: {e}")
+            _log.error("page_command send_photo+markup: %s: %s", type(e).__name__, e)
     # 2) Photo + légende seulement (sans boutons)
     if media and not sent:
         try:
@@ -969,7 +2398,7 @@ async def page_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
             except Exception:
                 pass
         except Exception as e:
-            print(f"[ERROR] page_command send_photo only: {type(e).__name__}: {e}")
+            _log.error("page_command send_photo only: %s: %s", type(e).__name__, e)
     # 3) Message texte + boutons (sans photo)
     if not sent:
         try:
@@ -982,7 +2411,7 @@ async def page_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
             except Exception:
                 pass
         except Exception as e:
-            print(f"[ERROR] page_command send_message+markup: {type(e).__name__}: {e}")
+            _log.error("page_command send_message+markup: %s: %s", type(e).__name__, e)
     # 4) Message texte seul (sans boutons)
     if not sent:
         try:
@@ -994,7 +2423,7 @@ async def page_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
             except Exception:
                 pass
         except Exception as e:
-            print(f"[ERROR] page_command send_message only: {type(e).__name__}: {e}")
+            _log.error("page_command send_message only: %s: %s", type(e).__name__, e)
     if not sent:
         try:
             await context.bot.send_message(
@@ -1025,9 +2454,10 @@ async def _purge_privates_background(context: ContextTypes.DEFAULT_TYPE, notify_
     global_deleted = 0
     global_edited = 0
     global_errors = 0
+    dead: set[int] = set()
     try:
         try:
-            users = _load_users()
+            users = _load_active_users()
         except Exception:
             users = []
         PURGE_ALL_WINDOW = 8000
@@ -1040,9 +2470,11 @@ async def _purge_privates_background(context: ContextTypes.DEFAULT_TYPE, notify_
                 try:
                     await asyncio.sleep(float(getattr(e, "retry_after", 1.0)) + 0.1)
                     tmp_msg = await context.bot.send_message(chat_id=u_chat_id, text="\u2060")
-                except Exception:
+                except Exception as e2:
+                    _note_send_failure(u_chat_id, e2, dead)
                     tmp_msg = None
-            except Exception:
+            except Exception as e:
+                _note_send_failure(u_chat_id, e, dead)
                 tmp_msg = None
             last_id = None
             try:
@@ -1133,6 +2565,9 @@ async def _purge_privates_background(context: ContextTypes.DEFAULT_TYPE, notify_
                 pass
     finally:
         _PURGE_BG_RUNNING = False
+        # Chats morts détectés pendant la purge: ne plus les solliciter
+        if dead:
+            _mark_inactive(dead)
         # Message de fin
         try:
             done_text = (
@@ -1272,23 +2707,261 @@ async def _purge_local_background(context: ContextTypes.DEFAULT_TYPE, chat_id: i
         except Exception:
             pass
 
-async def handle_delete(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Callback pour suppression owner-only. Ici: delall pour supprimer chez tous."""
-    query = update.callback_query
+def _broadcast_summary(draft: dict) -> str:
+    """Résumé lisible du brouillon de diffusion (broadcast.json)."""
+    text = (draft.get("text") or "").strip()
+    mtype = draft.get("media_type")
+    media = {"photo": "🖼 Photo", "video": "🎬 Vidéo"}.get(str(mtype), "aucun")
+    preview = text[:300] + ("…" if len(text) > 300 else "") if text else "(vide)"
+    return f"📝 Texte:\n----\n{preview}\n----\n📎 Média: {media}"
+
+async def _broadcast_send_one(bot, chat_id: int, draft: dict, media_ref):
+    """Envoie le message de diffusion à un destinataire selon le type de média."""
+    text = (draft.get("text") or "").strip()
+    mtype = draft.get("media_type")
+    if mtype == "photo" and media_ref:
+        return await bot.send_photo(chat_id=chat_id, photo=media_ref, caption=text[:1024] or None)
+    if mtype == "video" and media_ref:
+        return await bot.send_video(chat_id=chat_id, video=media_ref, caption=text[:1024] or None)
+    return await bot.send_message(chat_id=chat_id, text=text[:4096])
+
+def _sent_media_file_id(msg, mtype) -> str | None:
+    """Récupère le file_id Telegram d'un média déjà envoyé pour le réutiliser."""
     try:
-        await query.answer()
+        if mtype == "photo" and msg.photo:
+            return msg.photo[-1].file_id
+        if mtype == "video" and msg.video:
+            return msg.video.file_id
     except Exception:
         pass
-    user_id = query.from_user.id if query.from_user else 0
-    if not _is_admin(user_id):
-        # Refuser si ce n'est pas le propriétaire
+    return None
+
+def _broadcast_recipients(segment_days: int | None = None) -> list[int]:
+    """Destinataires actifs et non bannis; segment_days limite aux utilisateurs vus récemment."""
+    bans = set(_load_bans())
+    users = _load_active_users()
+    if segment_days:
+        recent = set(cid for shard in _activity_shards() for cid in shard.active_ids(segment_days))
+        users = [u for u in users if u in recent]
+    return [u for u in users if u not in bans]
+
+async def _broadcast_background(context: ContextTypes.DEFAULT_TYPE, notify_chat_id: int, segment_days: int | None = None) -> None:
+    """Tâche de fond: diffuse broadcast.json à tous les utilisateurs enregistrés.
+    Concurrence bornée + seau à jetons global; le média est téléversé une seule fois
+    puis son file_id est réutilisé. Les (chat_id, message_id) sont conservés dans
+    last_broadcast.json pour pouvoir rappeler la diffusion.
+    """
+    global _BROADCAST_RUNNING
+    if _BROADCAST_RUNNING:
         try:
-            await query.answer("Non autorisé", show_alert=True)
+            await context.bot.send_message(chat_id=notify_chat_id, text="Diffusion déjà en cours…")
         except Exception:
             pass
         return
+    _BROADCAST_RUNNING = True
+    bot = context.bot
+    draft = _load_broadcast()
+    mtype = draft.get("media_type") if draft.get("media_type") in ("photo", "video") else None
+    media_ref = (draft.get("media_file_id") or draft.get("media_url")) if mtype else None
+    users = _broadcast_recipients(segment_days)
+    total = len(users)
+    bid = str(int(time.time()))
+    dead: set[int] = set()
+    sent: list[dict] = []
+    stats = {"ok": 0, "failed": 0}
+    started = time.monotonic()
+    limiter = _RateLimiter(_BROADCAST_RATE)
+    status = None
+    try:
+        try:
+            status = await bot.send_message(chat_id=notify_chat_id, text=f"📣 Diffusion démarrée: 0/{total}")
+        except Exception:
+            status = None
 
-    data = query.data or ""
+        async def _deliver(chat_id: int, ref):
+            for _ in range(3):
+                await limiter.acquire()
+                try:
+                    return await _broadcast_send_one(bot, chat_id, draft, ref)
+                except RetryAfter as e:
+                    limiter.pause(float(getattr(e, "retry_after", 1.0)) + 0.1)
+                except (Forbidden, BadRequest) as e:
+                    _note_send_failure(chat_id, e, dead)
+                    return None
+                except Exception:
+                    await asyncio.sleep(0.5)
+            return None
+
+        queue: asyncio.Queue = asyncio.Queue()
+        for u in users:
+            queue.put_nowait(u)
+        # Téléverser le média une seule fois: envoyer au premier destinataire jusqu'à obtenir un file_id
+        if mtype and not draft.get("media_file_id"):
+            while not queue.empty():
+                chat_id = queue.get_nowait()
+                m = await _deliver(chat_id, await _open_broadcast_media(media_ref))
+                if m is None:
+                    stats["failed"] += 1
+                    continue
+                stats["ok"] += 1
+                sent.append({"chat_id": int(chat_id), "message_id": int(m.message_id)})
+                file_id = _sent_media_file_id(m, mtype)
+                if file_id:
+                    media_ref = file_id
+                    draft["media_file_id"] = file_id
+                    _save_broadcast(draft)
+                break
+
+        async def _worker():
+            while True:
+                try:
+                    chat_id = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                ref = media_ref if (not mtype or draft.get("media_file_id")) else await _open_broadcast_media(media_ref)
+                m = await _deliver(chat_id, ref)
+                if m is None:
+                    stats["failed"] += 1
+                else:
+                    stats["ok"] += 1
+                    sent.append({"chat_id": int(chat_id), "message_id": int(m.message_id)})
+
+        async def _progress():
+            last_txt = ""
+            while True:
+                await asyncio.sleep(_BROADCAST_PROGRESS_EVERY)
+                txt = (
+                    f"📣 Diffusion en cours…\n"
+                    f"✅ Envoyés: {stats['ok']}\n"
+                    f"⚠️ Échecs: {stats['failed']}\n"
+                    f"⏳ Progression: {stats['ok'] + stats['failed']}/{total}"
+                )
+                if status is not None and txt != last_txt:
+                    try:
+                        await bot.edit_message_text(chat_id=status.chat.id, message_id=status.message_id, text=txt)
+                        last_txt = txt
+                    except Exception:
+                        pass
+
+        progress_task = asyncio.create_task(_progress())
+        try:
+            await asyncio.gather(*(_worker() for _ in range(max(1, _BROADCAST_CONCURRENCY))))
+        finally:
+            progress_task.cancel()
+    except Exception:
+        _log.exception("_broadcast_background")
+    finally:
+        _BROADCAST_RUNNING = False
+        _save_last_broadcast({"id": bid, "messages": sent})
+        if dead:
+            _mark_inactive(dead)
+        elapsed = max(0.001, time.monotonic() - started)
+        done_text = (
+            f"📣 Diffusion terminée\n"
+            f"✅ Envoyés: {stats['ok']}\n"
+            f"⚠️ Échecs: {stats['failed']} (dont {len(dead)} inactif(s) retiré(s))\n"
+            f"👥 Destinataires: {total}\n"
+            f"⏱ Durée: {elapsed:.1f}s ({stats['ok'] / elapsed:.1f} msg/s)"
+        )
+        try:
+            if status is not None:
+                await bot.edit_message_text(chat_id=status.chat.id, message_id=status.message_id, text=done_text)
+            else:
+                await bot.send_message(chat_id=notify_chat_id, text=done_text)
+        except Exception:
+            pass
+
+def _read_local_media(ref):
+    """Thread d'E/S: (octets, nom) si ref désigne un fichier local, sinon None."""
+    if ref and not str(ref).startswith(("http://", "https://")):
+        path = ref if os.path.isabs(ref) else os.path.join(_BASE_DIR, ref)
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                return f.read(), os.path.basename(path)
+    return None
+
+async def _open_broadcast_media(ref):
+    """Chemin local -> InputFile (premier envoi); URL ou file_id transmis tels quels."""
+    try:
+        local = await _io(_read_local_media, ref)
+        if local:
+            return InputFile(BytesIO(local[0]), filename=local[1])
+    except Exception:
+        pass
+    return ref
+
+async def _broadcast_recall_background(context: ContextTypes.DEFAULT_TYPE, notify_chat_id: int) -> None:
+    """Tâche de fond: supprime les messages de la dernière diffusion (deleteMessages par lots de 100)."""
+    global _BROADCAST_RUNNING
+    if _BROADCAST_RUNNING:
+        try:
+            await context.bot.send_message(chat_id=notify_chat_id, text="Diffusion en cours, rappel impossible pour le moment.")
+        except Exception:
+            pass
+        return
+    _BROADCAST_RUNNING = True
+    bot = context.bot
+    last = _load_last_broadcast()
+    by_chat: dict[int, list[int]] = {}
+    for e in last.get("messages") or []:
+        by_chat.setdefault(int(e["chat_id"]), []).append(int(e["message_id"]))
+    batches = [(cid, mids[i:i + 100]) for cid, mids in by_chat.items() for i in range(0, len(mids), 100)]
+    limiter = _RateLimiter(_BROADCAST_RATE)
+    stats = {"deleted": 0, "failed": 0}
+    try:
+        queue: asyncio.Queue = asyncio.Queue()
+        for b in batches:
+            queue.put_nowait(b)
+
+        async def _worker():
+            while True:
+                try:
+                    cid, mids = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                for _ in range(3):
+                    await limiter.acquire()
+                    try:
+                        await bot.delete_messages(chat_id=cid, message_ids=mids)
+                        stats["deleted"] += len(mids)
+                        break
+                    except RetryAfter as e:
+                        limiter.pause(float(getattr(e, "retry_after", 1.0)) + 0.1)
+                    except Exception:
+                        stats["failed"] += len(mids)
+                        break
+
+        await asyncio.gather(*(_worker() for _ in range(max(1, _BROADCAST_CONCURRENCY))))
+        _save_last_broadcast({"id": "", "messages": []})
+    except Exception:
+        _log.exception("_broadcast_recall_background")
+    finally:
+        _BROADCAST_RUNNING = False
+        try:
+            await bot.send_message(
+                chat_id=notify_chat_id,
+                text=f"↩️ Rappel terminé: {stats['deleted']} supprimé(s), {stats['failed']} échec(s).",
+            )
+        except Exception:
+            pass
+
+async def handle_delete(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Callback pour suppression owner-only. Ici: delall pour supprimer chez tous."""
+    query = update.callback_query
+    try:
+        await query.answer()
+    except Exception:
+        pass
+    user_id = query.from_user.id if query.from_user else 0
+    if not _is_admin(user_id):
+        # Refuser si ce n'est pas le propriétaire
+        try:
+            await query.answer("Non autorisé", show_alert=True)
+        except Exception:
+            pass
+        return
+
+    data = query.data or ""
 
 # --------- Panneau d'administration ---------
 def _admin_panel_caption() -> str:
@@ -1297,7 +2970,7 @@ def _admin_panel_caption() -> str:
 
 # Strictement 2 boutons par ligne, libellés courts pour éviter la troncature
 def _admin_keyboard():
-    cfg = _load_config()
+    cfg = _config_view()
     base_url = (cfg.get("miniapp_url") or "").rstrip("/")
     # Utiliser /administration/index.html directement avec hash router
     admin_url = f"{base_url}/administration/index.html#/product" if base_url else ""
@@ -1309,7 +2982,8 @@ def _admin_keyboard():
         [InlineKeyboardButton("📂 Catégories", callback_data="adm_categories"), InlineKeyboardButton("🎛️ Gérer boutons", callback_data="adm_manage_buttons")],
         [InlineKeyboardButton("📝 Profil (textes)", callback_data="adm_profil_blocks"), InlineKeyboardButton("🚫 Bans", callback_data="adm_bans")],
         [InlineKeyboardButton("🖼️ Logo", callback_data="adm_change_logo"), InlineKeyboardButton("👑 Admins", callback_data="adm_admins")],
-        [InlineKeyboardButton("❓ Aide", callback_data="adm_help")],
+        [InlineKeyboardButton("📣 Diffusion", callback_data="adm_broadcast"), InlineKeyboardButton("❓ Aide", callback_data="adm_help")],
+        [InlineKeyboardButton("🪵 Journaux", callback_data="adm_logs"), InlineKeyboardButton("🩺 Diagnostics", callback_data="adm_diag")],
         [InlineKeyboardButton("⬅️ Retour accueil", callback_data="adm_retour_accueil")],
     ]
     # Bouton "Ouvrir l'admin site" si l'URL est configurée (Catégories + Profil dans l'admin web)
@@ -1317,38 +2991,125 @@ def _admin_keyboard():
         rows.insert(-1, [InlineKeyboardButton("🖥 Ouvrir l'admin site", web_app=WebAppInfo(url=admin_url))])
     return InlineKeyboardMarkup(rows)
 
+# Message panneau: un seul message par chat admin, modifié sur place d'un écran à l'autre.
+# user_data["adm_panel"] = (message_id, nature): "welcome" (image d'accueil, seule la légende change),
+# "text" (message texte) ou "other" (autre média, remplacé par l'image d'accueil).
+async def _panel_send(context, chat_id: int, text: str, reply_markup=None, parse_mode=None):
+    """Envoie un nouveau message panneau (image d'accueil + légende, ou texte) et le retient."""
+    media = await _get_welcome_media()
+    if media is not None:
+        try:
+            m = await context.bot.send_photo(chat_id=chat_id, photo=media, caption=text, reply_markup=reply_markup, parse_mode=parse_mode)
+            _note_welcome_media(m, media)
+            context.user_data["adm_panel"] = (m.message_id, "welcome")
+            return m
+        except BadRequest:
+            _forget_welcome_media(media)
+    m = await context.bot.send_message(chat_id=chat_id, text=text, reply_markup=reply_markup, parse_mode=parse_mode)
+    context.user_data["adm_panel"] = (m.message_id, "text")
+    return m
+
+async def _panel_show(context, chat_id: int, text: str, reply_markup=None, message=None, parse_mode=None):
+    """Affiche un écran dans le message panneau (celui du callback, sinon le dernier connu) par édition;
+    renvoi d'un nouveau message seulement si Telegram refuse l'édition.
+    """
+    panel = context.user_data.get("adm_panel")
+    target = panel
+    if message is not None:
+        if panel and panel[0] == message.message_id:
+            target = panel
+        elif message.text is not None:
+            target = (message.message_id, "text")
+        else:
+            target = (message.message_id, "welcome" if message.photo else "other")
+    if target:
+        mid, kind = target
+        try:
+            if kind == "text":
+                await context.bot.edit_message_text(chat_id=chat_id, message_id=mid, text=text, reply_markup=reply_markup, parse_mode=parse_mode)
+            elif kind == "welcome":
+                await context.bot.edit_message_caption(chat_id=chat_id, message_id=mid, caption=text, reply_markup=reply_markup, parse_mode=parse_mode)
+            else:
+                media = await _get_welcome_media()
+                if media is None:
+                    raise BadRequest("no welcome media")
+                m = await context.bot.edit_message_media(chat_id=chat_id, message_id=mid, reply_markup=reply_markup,
+                                                         media=InputMediaPhoto(media=media, caption=text, parse_mode=parse_mode))
+                _note_welcome_media(m, media)
+                kind = "welcome"
+            context.user_data["adm_panel"] = (mid, kind)
+            return
+        except BadRequest as e:
+            if "not modified" in str(e).lower():
+                context.user_data["adm_panel"] = (mid, kind)
+                return
+            _log.debug("Panneau %s non modifiable (%s): renvoi", mid, e)
+        with contextlib.suppress(Exception):
+            await context.bot.delete_message(chat_id=chat_id, message_id=mid)
+    await _panel_send(context, chat_id, text, reply_markup, parse_mode)
+
+# Navigation admin: l'écran courant et la pile de retour sont des (route, args) issus du callback
+# qui les a affichés (adm_prod_sel_edit:42 -> ("adm_prod_sel_edit", ("42",))); Retour rejoue la route.
+_ADMIN_NAV_DEPTH = 16
+_ADMIN_NAV_ROOT = ("adm_panel", ())
+# Callbacks à effet de bord (envoi, suppression, création): jamais rejoués par Retour
+_ADMIN_NAV_ACTIONS = frozenset({
+    "adm_back", "adm_retour_accueil", "adm_broadcast_send", "adm_broadcast_recall", "adm_prod_add_do_create",
+    "adm_prod_do_del", "adm_confirm_delete", "adm_confirm_edit", "adm_profile", "adm_diag_report",
+})
+# Invites de saisie (await_action / adm_edit_key): jamais empilées ni rejouées, Retour quitte la saisie
+_ADMIN_NAV_PROMPTS = frozenset({
+    "adm_welcome_ask_new", "adm_contact_ask_new", "adm_edit_miniapp_label", "adm_edit_order_username",
+    "adm_change_logo", "adm_add_admin", "adm_remove_admin", "adm_prod_add_field", "adm_prod_add_validate",
+    "adm_prod_field", "adm_btn_add", "adm_edit_btn_name", "adm_edit_btn_url", "adm_bans_add", "adm_bans_remove",
+    "adm_broadcast_compose", "adm_link_miniapp", "adm_link_potato", "adm_link_contact", "adm_link_tg",
+    "adm_link_whatsapp",
+})
+# Callbacks dont l'écran se réaffiche par une autre route (sans réinitialiser l'assistant ni rejouer le réglage)
+_ADMIN_NAV_ALIASES = {"adm_prod_add": "adm_prod_add_menu", "adm_log_level": "adm_logs", "adm_log_sample": "adm_logs"}
+
+def _nav_route(data: str) -> tuple[str, tuple] | None:
+    """(route, args) de l'écran affiché par un callback admin; None s'il n'est pas rejouable."""
+    route, _, rest = data.partition(":")
+    if route in _ADMIN_NAV_ALIASES:
+        return (_ADMIN_NAV_ALIASES[route], ())
+    if route in _ADMIN_NAV_ACTIONS or route in _ADMIN_NAV_PROMPTS:
+        return None
+    return (route, tuple(rest.split(":")) if rest else ())
+
+def _nav_push(user_data: dict, data: str) -> None:
+    """Passe à l'écran de `data`: l'écran courant est empilé, ou la pile remonte si `data` y figure déjà."""
+    cur = user_data.get("adm_route")
+    new = _nav_route(data)
+    stack = user_data.setdefault("adm_nav_stack", [])
+    if new is not None and new in stack:
+        del stack[stack.index(new):]
+    elif cur and cur != new:
+        stack.append(cur)
+        if len(stack) > _ADMIN_NAV_DEPTH:
+            del stack[0]
+    user_data["adm_route"] = new
+
 async def admin_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     user_id = update.effective_user.id if update.effective_user else 0
-    print(f"[DEBUG] /admin command from user_id={user_id}")
+    _log.debug("/admin command from user_id=%s", user_id)
     if not _is_admin(user_id):
         await update.message.reply_text(f"Accès réservé aux administrateurs.\nVotre ID: {user_id}")
         return
     # Réinitialiser la pile de navigation de l'admin pour cette session
-    try:
-        context.user_data["adm_nav_stack"] = []
-    except Exception:
-        pass
-    # Afficher l'image du bot en tête du panneau admin si disponible
-    caption = _admin_panel_caption()
-    try:
-        media = await _get_welcome_media()
-    except Exception:
-        media = None
-    if media is not None:
+    context.user_data["adm_nav_stack"] = []
+    context.user_data["adm_route"] = _ADMIN_NAV_ROOT
+    # Nouveau message panneau (image du bot en tête si disponible, sinon texte)
+    await _panel_send(context, update.effective_chat.id, _admin_panel_caption(), _admin_keyboard())
+
+async def handle_admin_action(update: Update, context: ContextTypes.DEFAULT_TYPE, replay: str | None = None) -> None:
+    """Callbacks adm_*; replay: route réaffichée par Retour (callback déjà acquitté, rien n'est empilé)."""
+    query = update.callback_query
+    if replay is None:
         try:
-            await update.message.reply_photo(photo=media, caption=caption, reply_markup=_admin_keyboard())
-            return
+            await query.answer()
         except Exception:
             pass
-    # Fallback texte si l'image n'est pas disponible
-    await update.message.reply_text(caption, reply_markup=_admin_keyboard())
-
-async def handle_admin_action(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    query = update.callback_query
-    try:
-        await query.answer()
-    except Exception:
-        pass
     user_id = query.from_user.id if query.from_user else 0
     if not _is_admin(user_id):
         try:
@@ -1356,47 +3117,20 @@ async def handle_admin_action(update: Update, context: ContextTypes.DEFAULT_TYPE
         except Exception:
             pass
         return
-    data = query.data
+    data = replay or query.data
+    # Empiler l'écran courant pour permettre un retour contextuel (sauf réaffichage par Retour)
+    def _nav_enter():
+        if replay is None:
+            _nav_push(context.user_data, data)
     # Helper pour éditer en conservant media/caption si nécessaire
-    async def _admin_edit(text: str, reply_markup=None, store_prev: bool = True):
+    async def _admin_edit(text: str, reply_markup=None, store_prev: bool = True, parse_mode=None):
         try:
             msg = query.message
             if not msg:
                 return
-            # Empiler l'état précédent pour permettre un retour contextuel
             if store_prev:
-                try:
-                    prev_text = None
-                    if msg.photo or msg.video or msg.animation:
-                        prev_text = msg.caption
-                    else:
-                        prev_text = msg.text
-                    prev_kb = getattr(msg, "reply_markup", None)
-                    # Éviter d'empiler si l'état est identique
-                    same_text = (str(prev_text or "").strip() == str(text or "").strip())
-                    prev_kb_rows = getattr(prev_kb, "inline_keyboard", None)
-                    next_kb_rows = getattr(reply_markup, "inline_keyboard", None)
-                    same_kb = False
-                    try:
-                        same_kb = json.dumps(prev_kb_rows, ensure_ascii=False) == json.dumps(next_kb_rows, ensure_ascii=False)
-                    except Exception:
-                        same_kb = False
-                    if not (same_text and same_kb):
-                        stack = context.user_data.get("adm_nav_stack") or []
-                        has_photo = bool(msg.photo or msg.video or msg.animation)
-                        stack.append({"text": prev_text, "reply_markup": prev_kb, "has_photo": has_photo})
-                        context.user_data["adm_nav_stack"] = stack
-                except Exception:
-                    pass
-            if msg.photo or msg.video or msg.animation:
-                # Remplacer uniquement la légende si média présent
-                try:
-                    await msg.edit_caption(caption=text, reply_markup=reply_markup)
-                    return
-                except Exception:
-                    pass
-            # Sinon éditer le texte du message
-            await msg.edit_text(text=text, reply_markup=reply_markup)
+                _nav_enter()
+            await _panel_show(context, msg.chat_id, text, reply_markup, message=msg, parse_mode=parse_mode)
         except Exception:
             pass
     # Helper pour ajouter systématiquement un bouton Retour
@@ -1413,7 +3147,7 @@ async def handle_admin_action(update: Update, context: ContextTypes.DEFAULT_TYPE
     if data == "adm_stats":
         users = _load_users()
         bans = _load_bans()
-        m = _load_metrics()
+        m = await _load_metrics()
         clicks = m.get("clicks", {})
         created_ts = int(m.get("created_at", int(time.time())))
         created_fmt = "inconnu"
@@ -1421,120 +3155,131 @@ async def handle_admin_action(update: Update, context: ContextTypes.DEFAULT_TYPE
             created_fmt = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(created_ts))
         except Exception:
             pass
-        # Construire un aperçu des clics (limiter l'affichage pour éviter les messages trop longs)
+        # Top N trié (limiter l'affichage: la légende d'une photo est plafonnée à 1024 caractères)
         top_items = []
         try:
-            for k, v in clicks.items():
+            ranked = sorted(((str(k), int(v)) for k, v in clicks.items()), key=lambda kv: kv[1], reverse=True)
+            for k, v in ranked[:8]:
                 top_items.append(f"• {k}: {v}")
         except Exception:
             pass
         clicks_text = "\n".join(top_items) if top_items else "• Aucun clic enregistré pour le moment"
+        series = _stats_series()
+        recent = "\n".join(f"• {k}: {v}" for k, v in series.top(24, 5)) or "• —"
+        g = _update_gauges(context.application)
+        starts_24h = sum(series.last_hours(_SERIES_START_KEY, 24))
+        starts_7d = sum(series.last_days(_SERIES_START_KEY, 7))
         txt = (
             f"📊 Statistiques du bot\n\n"
             f"🗓️ Créé le: {created_fmt}\n"
             f"👥 Total utilisateurs uniques: {len(users)}\n"
+            f"💤 Inactifs (bot bloqué / chat supprimé): {len(_load_inactive())}\n"
             f"🚀 Démarrages cumulés (/start): {int(m.get('starts_total', 0))}\n"
-            f"👉 Clics par action:\n{clicks_text}\n\n"
-            f"🚫 Utilisateurs bannis: {len(bans)}"
-        )
-        await _admin_edit(txt, reply_markup=_with_back(_admin_keyboard()))
+            f"🚀 /start 24h: {starts_24h} • 7j: {starts_7d}\n"
+            f"👉 Top clics (cumul):\n{clicks_text}\n"
+            f"🔥 Top clics 24h:\n{recent}\n\n"
+            f"🚫 Utilisateurs bannis: {len(bans)}\n"
+            f"⚙️ Updates: {g['in_flight']} en cours, {g['waiting']} en attente, file {g['queue_depth']}"
+        )[:1024]
+        kb = _with_back(_admin_keyboard())
+        # Graphique en image du panneau (mis en cache jusqu'au changement d'heure)
+        try:
+            chart = await _get_stats_chart()
+            # file_id déjà téléversé, sinon un InputFile neuf par envoi (celui d'un InputMediaPhoto
+            # est une pièce jointe attach://, à ne pas réutiliser pour sendPhoto)
+            def photo():
+                return chart if isinstance(chart, str) else InputFile(BytesIO(chart), filename="stats.png")
+            msg = query.message
+            _nav_enter()
+            if msg.photo or msg.video or msg.animation:
+                try:
+                    edited = await msg.edit_media(media=InputMediaPhoto(media=photo(), caption=txt), reply_markup=kb)
+                except BadRequest as e:
+                    # Même graphique et même légende (heure inchangée): l'écran est déjà à jour
+                    if "not modified" not in str(e).lower():
+                        raise
+                    context.user_data["adm_panel"] = (msg.message_id, "other")
+                    return
+            else:
+                # Panneau texte: le graphique le remplace (pas de second panneau laissé au-dessus)
+                edited = await msg.reply_photo(photo=photo(), caption=txt, reply_markup=kb)
+                with contextlib.suppress(Exception):
+                    await msg.delete()
+            context.user_data["adm_panel"] = (edited.message_id, "other")
+            try:
+                if not isinstance(chart, str) and getattr(edited, "photo", None):
+                    _CHART_CACHE["file_id"] = edited.photo[-1].file_id
+            except Exception:
+                pass
+            return
+        except Exception as e:
+            _log.warning("adm_stats chart: %s: %s", type(e).__name__, e)
+        await _admin_edit(txt, reply_markup=kb)
         return
     # Users : afficher uniquement les infos (total, actifs, aujourd'hui), pas la liste
     if data == "adm_users":
         try:
             users = _load_users()
             total = len(users)
-            m = _load_metrics()
-            starts_today = m.get("starts_today", 0)  # optionnel si on enregistre /start par jour
-            # Actifs et aujourd'hui non suivis pour l'instant
+            shards = _activity_shards()  # workers: chats disjoints, les comptes s'additionnent
             txt = (
                 f"💬 Utilisateurs\n\n"
                 f"👥 Total : {total}\n"
-                f"🟢 Actifs : —\n"
-                f"📅 Aujourd'hui : —"
+                f"💤 Inactifs : {len(_load_inactive())}\n"
+                f"🟢 Actifs 7j : {sum(a.active_count(7) for a in shards)} • 30j : {sum(a.active_count(30) for a in shards)}\n"
+                f"📅 Aujourd'hui : {sum(a.active_count(1) for a in shards)}\n"
+                f"🆕 Nouveaux aujourd'hui : {sum(a.new_today() for a in shards)}"
             )
             await _admin_edit(txt, reply_markup=_with_back(_admin_keyboard()))
         except Exception:
             pass
         return
-    # Message accueil : supprimer le message actuel, envoyer photo + message actuel + bouton "Changer le message"
+    # Message accueil : message actuel + bouton "Changer le message" (dans le message panneau)
     if data == "adm_edit_welcome":
-        try:
-            await query.message.delete()
-        except Exception:
-            pass
         try:
             cfg = _load_config()
             current = (cfg.get("welcome_caption") or WELCOME_CAPTION_TEXT).strip()
-            media = await _get_welcome_media()
             caption = f"💬 Message d'accueil actuel:\n\n----\n{current}\n----"
             kb = InlineKeyboardMarkup([
                 [InlineKeyboardButton("Changer le message", callback_data="adm_welcome_ask_new")],
                 [InlineKeyboardButton("⬅️ Retour", callback_data="adm_back")],
             ])
-            if media:
-                await context.bot.send_photo(chat_id=query.message.chat_id, photo=media, caption=caption, reply_markup=kb)
-            else:
-                await context.bot.send_message(chat_id=query.message.chat_id, text=caption, reply_markup=kb)
+            await _admin_edit(caption, reply_markup=kb)
         except Exception:
             pass
         return
-    # Clic sur "Changer le message" : supprimer la fenêtre, renvoyer photo + "Envoyez le nouveau texte de bienvenue"
+    # Clic sur "Changer le message" : "Envoyez le nouveau texte de bienvenue"
     if data == "adm_welcome_ask_new":
-        try:
-            await query.message.delete()
-        except Exception:
-            pass
         context.user_data["await_action"] = "edit_welcome"
         try:
-            media = await _get_welcome_media()
             prompt = "Envoyez le nouveau texte de bienvenue."
             kb = InlineKeyboardMarkup([[InlineKeyboardButton("⬅️ Retour", callback_data="adm_back")]])
-            if media:
-                await context.bot.send_photo(chat_id=query.message.chat_id, photo=media, caption=prompt, reply_markup=kb)
-            else:
-                await context.bot.send_message(chat_id=query.message.chat_id, text=prompt, reply_markup=kb)
+            await _admin_edit(prompt, reply_markup=kb)
         except Exception:
             pass
         return
     # Contact : URL configurable (contact_link) — affichage et édition
     if data == "adm_edit_contact":
-        try:
-            await query.message.delete()
-        except Exception:
-            pass
         try:
             cfg = _load_config()
             current = (cfg.get("contact_link") or "").strip() or "(vide)"
-            media = await _get_welcome_media()
             caption = f"☎️ URL Contact (bouton à l'accueil):\n\n----\n{current}\n----\n\nLe bouton ouvrira ce lien (t.me, WhatsApp, etc.)."
             kb = InlineKeyboardMarkup([
                 [InlineKeyboardButton("Changer l'URL", callback_data="adm_contact_ask_new")],
                 [InlineKeyboardButton("⬅️ Retour", callback_data="adm_back")],
             ])
-            if media:
-                await context.bot.send_photo(chat_id=query.message.chat_id, photo=media, caption=caption, reply_markup=kb)
-            else:
-                await context.bot.send_message(chat_id=query.message.chat_id, text=caption, reply_markup=kb)
+            await _admin_edit(caption, reply_markup=kb)
         except Exception:
             pass
         return
     if data == "adm_contact_ask_new":
-        try:
-            await query.message.delete()
-        except Exception:
-            pass
         context.user_data["await_action"] = "edit_contact"
         try:
             cfg = _load_config()
             current = (cfg.get("contact_link") or "").strip() or "(vide)"
-            media = await _get_welcome_media()
             prompt = "Entrez l'URL du bouton Contact (ex: https://t.me/votrecontact ou https://wa.me/…).\n\nURL actuelle:\n----\n{current}\n----".format(current=current)
             kb = InlineKeyboardMarkup([[InlineKeyboardButton("⬅️ Retour", callback_data="adm_back")]])
-            if media:
-                await context.bot.send_photo(chat_id=query.message.chat_id, photo=media, caption=prompt, reply_markup=kb)
-            else:
-                await context.bot.send_message(chat_id=query.message.chat_id, text=prompt, reply_markup=kb)
+            await _admin_edit(prompt, reply_markup=kb)
         except Exception:
             pass
         return
@@ -1662,8 +3407,10 @@ async def handle_admin_action(update: Update, context: ContextTypes.DEFAULT_TYPE
         await _admin_edit("🛒 Gestion Produits\n\nGérez les produits du site depuis Telegram.", reply_markup=_with_back(kb))
         return
 
-    if data == "adm_prod_add":
-        context.user_data["new_product"] = {}
+    if data in ("adm_prod_add", "adm_prod_add_menu"):
+        # adm_prod_add démarre un produit vierge; adm_prod_add_menu réaffiche celui en cours (Retour)
+        if data == "adm_prod_add":
+            context.user_data["new_product"] = {}
         context.user_data.pop("await_action", None)
         _txt, _kb = _build_new_product_add_menu(context.user_data.get("new_product", {}))
         await _admin_edit(_txt, reply_markup=_with_back(_kb))
@@ -1689,17 +3436,15 @@ async def handle_admin_action(update: Update, context: ContextTypes.DEFAULT_TYPE
             try:
                 cfg = _load_config()
                 api_url = cfg.get("miniapp_url", "").rstrip("/")
-                api_key = os.getenv("BOT_API_KEY", "")
+                api_key = BOT_API_KEY
                 headers = {"x-api-key": api_key} if api_key else {}
                 if not api_url:
                     await _admin_edit("❌ URL de l'API non configurée.", reply_markup=_with_back(None))
                     return
-                async with httpx.AsyncClient() as client:
-                    resp = await client.get(f"{api_url}/api/categories?all=1", headers=headers, timeout=10.0)
-                if resp.status_code != 200:
-                    await _admin_edit(f"❌ Erreur chargement catégories: {resp.status_code}", reply_markup=_with_back(None))
+                status, cats_raw = await _shop_get_json(f"{api_url}/api/categories?all=1", headers)
+                if status != 200:
+                    await _admin_edit(f"❌ Erreur chargement catégories: {status}", reply_markup=_with_back(None))
                     return
-                cats_raw = resp.json()
                 flat = []
                 parents = [c for c in (cats_raw or []) if not c.get("parentId")]
                 for c in parents:
@@ -1725,47 +3470,9 @@ async def handle_admin_action(update: Update, context: ContextTypes.DEFAULT_TYPE
             except Exception as e:
                 await _admin_edit(f"❌ Erreur: {str(e)}", reply_markup=_with_back(None))
             return
-        if field == "photo":
-            stack = context.user_data.get("adm_nav_stack") or []
-            prev_text = query.message.text or (query.message.caption or "")
-            prev_kb = getattr(query.message, "reply_markup", None)
-            stack.append({"text": prev_text, "reply_markup": prev_kb, "has_photo": False})
-            context.user_data["adm_nav_stack"] = stack
-            try:
-                await query.message.delete()
-            except Exception:
-                pass
-            media = await _get_welcome_media()
-            caption = f"➕ Ajout produit\n\n{prompt}"
-            try:
-                if media:
-                    await context.bot.send_photo(chat_id=query.message.chat_id, photo=media, caption=caption, parse_mode="HTML", reply_markup=_with_back(None))
-                else:
-                    await context.bot.send_message(chat_id=query.message.chat_id, text=caption, parse_mode="HTML", reply_markup=_with_back(None))
-            except Exception:
-                await context.bot.send_message(chat_id=query.message.chat_id, text=caption, parse_mode="HTML", reply_markup=_with_back(None))
-            return
-        if field == "video":
-            stack = context.user_data.get("adm_nav_stack") or []
-            prev_text = query.message.text or (query.message.caption or "")
-            prev_kb = getattr(query.message, "reply_markup", None)
-            stack.append({"text": prev_text, "reply_markup": prev_kb, "has_photo": False})
-            context.user_data["adm_nav_stack"] = stack
-            try:
-                await query.message.delete()
-            except Exception:
-                pass
-            media = await _get_welcome_media()
-            caption = f"➕ Ajout produit\n\n{prompt}"
-            try:
-                if media:
-                    await context.bot.send_photo(chat_id=query.message.chat_id, photo=media, caption=caption, parse_mode="HTML", reply_markup=_with_back(None))
-                else:
-                    await context.bot.send_message(chat_id=query.message.chat_id, text=caption, parse_mode="HTML", reply_markup=_with_back(None))
-            except Exception:
-                await context.bot.send_message(chat_id=query.message.chat_id, text=caption, parse_mode="HTML", reply_markup=_with_back(None))
-            return
-        await _admin_edit(f"➕ Ajout produit\n\n{prompt}", reply_markup=_with_back(None))
+        # Photo / vidéo: invite dans le message panneau (HTML pour /skip), comme les autres champs
+        await _admin_edit(f"➕ Ajout produit\n\n{prompt}", reply_markup=_with_back(None),
+                          parse_mode="HTML" if field in ("photo", "video") else None)
         return
 
     if data == "adm_prod_add_validate":
@@ -1809,7 +3516,7 @@ async def handle_admin_action(update: Update, context: ContextTypes.DEFAULT_TYPE
         try:
             cfg = _load_config()
             api_url = cfg.get("miniapp_url", "").rstrip("/")
-            api_key = os.getenv("BOT_API_KEY", "")
+            api_key = BOT_API_KEY
             headers = {"x-api-key": api_key} if api_key else {}
             if not api_url:
                 await _admin_edit("❌ URL de l'API non configurée.", reply_markup=_with_back(None))
@@ -1825,7 +3532,7 @@ async def handle_admin_action(update: Update, context: ContextTypes.DEFAULT_TYPE
                 "videoUrl": product.get("videoUrl") or None,
                 "variants": [{"name": p["name"], "type": "weight", "price": p["price"]} for p in prices],
             }
-            async with httpx.AsyncClient() as client:
+            async with _shop_client() as client:
                 resp = await client.post(f"{api_url}/api/products", json=payload, headers=headers, timeout=10.0)
             if resp.status_code in (200, 201):
                 prices_txt = ", ".join(f"{p['name']}g {_format_price(p['price'])}" for p in prices)
@@ -1850,29 +3557,27 @@ async def handle_admin_action(update: Update, context: ContextTypes.DEFAULT_TYPE
         try:
             cfg = _load_config()
             api_url = cfg.get("miniapp_url", "").rstrip("/")
-            api_key = os.getenv("BOT_API_KEY", "")
+            api_key = BOT_API_KEY
             if not api_url:
                 await _admin_edit("❌ URL de l'API non configurée. Configurez miniapp_url.", reply_markup=_with_back(None))
                 return
             headers = {"x-api-key": api_key} if api_key else {}
-            async with httpx.AsyncClient() as client:
-                resp = await client.get(f"{api_url}/api/products", headers=headers, timeout=10.0)
-                if resp.status_code == 200:
-                    products = resp.json()
-                    if not products:
-                        await _admin_edit("📦 Aucun produit trouvé.", reply_markup=_with_back(None))
-                        return
-                    txt = f"📦 Liste des produits ({len(products)} total):\n\n"
-                    # Limiter à 50 pour éviter message trop long (limite Telegram 4096 caractères)
-                    display_limit = min(len(products), 50)
-                    for i, p in enumerate(products[:display_limit], 1):
-                        prix_display = _format_product_prices(p)
-                        txt += f"{i}. {p.get('title', 'Sans titre')}\n   💰 {prix_display}\n\n"
-                    if len(products) > display_limit:
-                        txt += f"\n... et {len(products) - display_limit} autres produits.\nUtilisez Modifier/Supprimer pour voir tous les produits."
-                    await _admin_edit(txt, reply_markup=_with_back(None))
-                else:
-                    await _admin_edit(f"❌ Erreur API: {resp.status_code}", reply_markup=_with_back(None))
+            status, products = await _shop_get_json(f"{api_url}/api/products", headers)
+            if status == 200:
+                if not products:
+                    await _admin_edit("📦 Aucun produit trouvé.", reply_markup=_with_back(None))
+                    return
+                txt = f"📦 Liste des produits ({len(products)} total):\n\n"
+                # Limiter à 50 pour éviter message trop long (limite Telegram 4096 caractères)
+                display_limit = min(len(products), 50)
+                for i, p in enumerate(products[:display_limit], 1):
+                    prix_display = _format_product_prices(p)
+                    txt += f"{i}. {p.get('title', 'Sans titre')}\n   💰 {prix_display}\n\n"
+                if len(products) > display_limit:
+                    txt += f"\n... et {len(products) - display_limit} autres produits.\nUtilisez Modifier/Supprimer pour voir tous les produits."
+                await _admin_edit(txt, reply_markup=_with_back(None))
+            else:
+                await _admin_edit(f"❌ Erreur API: {status}", reply_markup=_with_back(None))
         except Exception as e:
             await _admin_edit(f"❌ Erreur: {str(e)}", reply_markup=_with_back(None))
         return
@@ -1881,34 +3586,32 @@ async def handle_admin_action(update: Update, context: ContextTypes.DEFAULT_TYPE
         try:
             cfg = _load_config()
             api_url = cfg.get("miniapp_url", "").rstrip("/")
-            api_key = os.getenv("BOT_API_KEY", "")
+            api_key = BOT_API_KEY
             if not api_url:
                 await _admin_edit("❌ URL de l'API non configurée.", reply_markup=_with_back(None))
                 return
             headers = {"x-api-key": api_key} if api_key else {}
-            async with httpx.AsyncClient() as client:
-                resp = await client.get(f"{api_url}/api/products", headers=headers, timeout=10.0)
-                if resp.status_code == 200:
-                    products = resp.json()
-                    if not products:
-                        await _admin_edit("📦 Aucun produit à modifier.", reply_markup=_with_back(None))
-                        return
-                    # Afficher 2 boutons par ligne pour tous les produits
-                    kb_rows = []
-                    row = []
-                    for p in products:
-                        pid = p.get("id", "")
-                        title = p.get("title", "Sans titre")[:20]
-                        row.append(InlineKeyboardButton(f"✏️ {title}", callback_data=f"adm_prod_sel_edit:{pid}"))
-                        if len(row) == 2:
-                            kb_rows.append(row)
-                            row = []
-                    # Ajouter le dernier bouton s'il est seul
-                    if row:
+            status, products = await _shop_get_json(f"{api_url}/api/products", headers)
+            if status == 200:
+                if not products:
+                    await _admin_edit("📦 Aucun produit à modifier.", reply_markup=_with_back(None))
+                    return
+                # Afficher 2 boutons par ligne pour tous les produits
+                kb_rows = []
+                row = []
+                for p in products:
+                    pid = p.get("id", "")
+                    title = p.get("title", "Sans titre")[:20]
+                    row.append(InlineKeyboardButton(f"✏️ {title}", callback_data=f"adm_prod_sel_edit:{pid}"))
+                    if len(row) == 2:
                         kb_rows.append(row)
-                    await _admin_edit(f"✏️ Sélectionnez un produit à modifier:\n\n📦 Total: {len(products)} produits", reply_markup=_with_back(InlineKeyboardMarkup(kb_rows)))
-                else:
-                    await _admin_edit(f"❌ Erreur API: {resp.status_code}", reply_markup=_with_back(None))
+                        row = []
+                # Ajouter le dernier bouton s'il est seul
+                if row:
+                    kb_rows.append(row)
+                await _admin_edit(f"✏️ Sélectionnez un produit à modifier:\n\n📦 Total: {len(products)} produits", reply_markup=_with_back(InlineKeyboardMarkup(kb_rows)))
+            else:
+                await _admin_edit(f"❌ Erreur API: {status}", reply_markup=_with_back(None))
         except Exception as e:
             await _admin_edit(f"❌ Erreur: {str(e)}", reply_markup=_with_back(None))
         return
@@ -1933,12 +3636,12 @@ async def handle_admin_action(update: Update, context: ContextTypes.DEFAULT_TYPE
         pid = context.user_data.get("edit_product_id")
         cfg = _load_config()
         api_url = cfg.get("miniapp_url", "").rstrip("/")
-        api_key = os.getenv("BOT_API_KEY", "")
+        api_key = BOT_API_KEY
         headers = {"x-api-key": api_key} if api_key else {}
         p = None
         try:
             if pid and api_url:
-                async with httpx.AsyncClient() as client:
+                async with _shop_client() as client:
                     resp = await client.get(f"{api_url}/api/products/{pid}", headers=headers, timeout=10.0)
                     if resp.status_code == 200:
                         p = resp.json()
@@ -1955,83 +3658,19 @@ async def handle_admin_action(update: Update, context: ContextTypes.DEFAULT_TYPE
 
         # Photo : logo du bot uniquement, pas de preview de la photo produit
         if field == "image":
-            stack = context.user_data.get("adm_nav_stack") or []
-            prev_text = query.message.text
-            prev_kb = getattr(query.message, "reply_markup", None)
-            stack.append({"text": prev_text, "reply_markup": prev_kb, "has_photo": False})
-            context.user_data["adm_nav_stack"] = stack
-            try:
-                await query.message.delete()
-            except Exception:
-                pass
             if (p.get("image") or "").strip():
                 caption = "🖼 Envoyez une nouvelle photo pour remplacer ou /skip pour garder."
             else:
                 caption = "🖼 Aucune photo actuelle.\n\nEnvoyez une photo pour ajouter ou /skip."
-            try:
-                media = await _get_welcome_media()
-                if media:
-                    await context.bot.send_photo(
-                        chat_id=query.message.chat_id,
-                        photo=media,
-                        caption=caption,
-                        parse_mode="HTML",
-                        reply_markup=_with_back(None)
-                    )
-                else:
-                    await context.bot.send_message(
-                        chat_id=query.message.chat_id,
-                        text=caption,
-                        parse_mode="HTML",
-                        reply_markup=_with_back(None)
-                    )
-            except Exception:
-                await context.bot.send_message(
-                    chat_id=query.message.chat_id,
-                    text=caption,
-                    parse_mode="HTML",
-                    reply_markup=_with_back(None)
-                )
+            await _admin_edit(caption, reply_markup=_with_back(None), parse_mode="HTML")
             return
 
         # Vidéo : logo du bot uniquement, pas de preview de la vidéo
         if field == "video":
-            stack = context.user_data.get("adm_nav_stack") or []
-            prev_text = query.message.text
-            prev_kb = getattr(query.message, "reply_markup", None)
-            stack.append({"text": prev_text, "reply_markup": prev_kb, "has_photo": False})
-            context.user_data["adm_nav_stack"] = stack
-            try:
-                await query.message.delete()
-            except Exception:
-                pass
             caption = "🎬 Envoyez une nouvelle vidéo pour remplacer ou /skip pour garder."
             if not (p.get("videoUrl") or "").strip():
                 caption = "🎬 Aucune vidéo actuelle.\n\nEnvoyez une vidéo pour ajouter ou /skip."
-            try:
-                media = await _get_welcome_media()
-                if media:
-                    await context.bot.send_photo(
-                        chat_id=query.message.chat_id,
-                        photo=media,
-                        caption=caption,
-                        parse_mode="HTML",
-                        reply_markup=_with_back(None)
-                    )
-                else:
-                    await context.bot.send_message(
-                        chat_id=query.message.chat_id,
-                        text=caption,
-                        parse_mode="HTML",
-                        reply_markup=_with_back(None)
-                    )
-            except Exception:
-                await context.bot.send_message(
-                    chat_id=query.message.chat_id,
-                    text=caption,
-                    parse_mode="HTML",
-                    reply_markup=_with_back(None)
-                )
+            await _admin_edit(caption, reply_markup=_with_back(None), parse_mode="HTML")
             return
 
         label = field_labels.get(field, field)
@@ -2044,34 +3683,32 @@ async def handle_admin_action(update: Update, context: ContextTypes.DEFAULT_TYPE
         try:
             cfg = _load_config()
             api_url = cfg.get("miniapp_url", "").rstrip("/")
-            api_key = os.getenv("BOT_API_KEY", "")
+            api_key = BOT_API_KEY
             if not api_url:
                 await _admin_edit("❌ URL de l'API non configurée.", reply_markup=_with_back(None))
                 return
             headers = {"x-api-key": api_key} if api_key else {}
-            async with httpx.AsyncClient() as client:
-                resp = await client.get(f"{api_url}/api/products", headers=headers, timeout=10.0)
-                if resp.status_code == 200:
-                    products = resp.json()
-                    if not products:
-                        await _admin_edit("📦 Aucun produit à supprimer.", reply_markup=_with_back(None))
-                        return
-                    # Afficher 2 boutons par ligne pour tous les produits
-                    kb_rows = []
-                    row = []
-                    for p in products:
-                        pid = p.get("id", "")
-                        title = p.get("title", "Sans titre")[:20]
-                        row.append(InlineKeyboardButton(f"🗑️ {title}", callback_data=f"adm_prod_confirm_del:{pid}"))
-                        if len(row) == 2:
-                            kb_rows.append(row)
-                            row = []
-                    # Ajouter le dernier bouton s'il est seul
-                    if row:
+            status, products = await _shop_get_json(f"{api_url}/api/products", headers)
+            if status == 200:
+                if not products:
+                    await _admin_edit("📦 Aucun produit à supprimer.", reply_markup=_with_back(None))
+                    return
+                # Afficher 2 boutons par ligne pour tous les produits
+                kb_rows = []
+                row = []
+                for p in products:
+                    pid = p.get("id", "")
+                    title = p.get("title", "Sans titre")[:20]
+                    row.append(InlineKeyboardButton(f"🗑️ {title}", callback_data=f"adm_prod_confirm_del:{pid}"))
+                    if len(row) == 2:
                         kb_rows.append(row)
-                    await _admin_edit(f"🗑️ Sélectionnez un produit à supprimer:\n\n📦 Total: {len(products)} produits", reply_markup=_with_back(InlineKeyboardMarkup(kb_rows)))
-                else:
-                    await _admin_edit(f"❌ Erreur API: {resp.status_code}", reply_markup=_with_back(None))
+                        row = []
+                # Ajouter le dernier bouton s'il est seul
+                if row:
+                    kb_rows.append(row)
+                await _admin_edit(f"🗑️ Sélectionnez un produit à supprimer:\n\n📦 Total: {len(products)} produits", reply_markup=_with_back(InlineKeyboardMarkup(kb_rows)))
+            else:
+                await _admin_edit(f"❌ Erreur API: {status}", reply_markup=_with_back(None))
         except Exception as e:
             await _admin_edit(f"❌ Erreur: {str(e)}", reply_markup=_with_back(None))
         return
@@ -2089,9 +3726,9 @@ async def handle_admin_action(update: Update, context: ContextTypes.DEFAULT_TYPE
         try:
             cfg = _load_config()
             api_url = cfg.get("miniapp_url", "").rstrip("/")
-            api_key = os.getenv("BOT_API_KEY", "")
+            api_key = BOT_API_KEY
             headers = {"x-api-key": api_key} if api_key else {}
-            async with httpx.AsyncClient() as client:
+            async with _shop_client() as client:
                 resp = await client.delete(f"{api_url}/api/products/{pid}", headers=headers, timeout=10.0)
                 if resp.status_code == 200:
                     await _admin_edit(f"✅ Produit #{pid} supprimé avec succès!", reply_markup=_with_back(_admin_keyboard()))
@@ -2228,11 +3865,11 @@ async def handle_admin_action(update: Update, context: ContextTypes.DEFAULT_TYPE
         try:
             context.user_data.pop("adm_edit_key", None)
             parts = data.split(":", 2)
-            print(f"[DEBUG] adm_edit_btn_name parts: {parts}")
+            _log.debug("adm_edit_btn_name parts: %s", parts)
             if len(parts) >= 3:
                 _, kind, ident = parts[0], parts[1], parts[2]
             else:
-                print(f"[ERROR] Pas assez de parties dans le callback: {parts}")
+                _log.error("Pas assez de parties dans le callback: %s", parts)
                 await _admin_edit("❌ Erreur de format. Réessayez.", reply_markup=_with_back(None))
                 return
             
@@ -2241,22 +3878,22 @@ async def handle_admin_action(update: Update, context: ContextTypes.DEFAULT_TYPE
             
             try:
                 await query.message.reply_text("📝 Envoyez le nouveau nom du bouton:")
-                print("[DEBUG] Message envoyé avec succès")
+                _log.debug("Message envoyé avec succès")
             except Exception as e:
-                print(f"[ERROR] Erreur lors de l'envoi du message: {e}")
-        except Exception as e:
-            print(f"[ERROR] Erreur dans adm_edit_btn_name: {e}")
+                _log.error("Erreur lors de l'envoi du message: %s", e)
+        except Exception:
+            _log.exception("Erreur dans adm_edit_btn_name")
         return
     
     if data.startswith("adm_edit_btn_url:"):
         try:
             context.user_data.pop("adm_edit_key", None)
             parts = data.split(":", 2)
-            print(f"[DEBUG] adm_edit_btn_url parts: {parts}")
+            _log.debug("adm_edit_btn_url parts: %s", parts)
             if len(parts) >= 3:
                 _, kind, ident = parts[0], parts[1], parts[2]
             else:
-                print(f"[ERROR] Pas assez de parties dans le callback: {parts}")
+                _log.error("Pas assez de parties dans le callback: %s", parts)
                 await _admin_edit("❌ Erreur de format. Réessayez.", reply_markup=_with_back(None))
                 return
             
@@ -2265,11 +3902,11 @@ async def handle_admin_action(update: Update, context: ContextTypes.DEFAULT_TYPE
             
             try:
                 await query.message.reply_text("🔗 Envoyez la nouvelle URL du bouton:")
-                print("[DEBUG] Message envoyé avec succès")
+                _log.debug("Message envoyé avec succès")
             except Exception as e:
-                print(f"[ERROR] Erreur lors de l'envoi du message: {e}")
-        except Exception as e:
-            print(f"[ERROR] Erreur dans adm_edit_btn_url: {e}")
+                _log.error("Erreur lors de l'envoi du message: %s", e)
+        except Exception:
+            _log.exception("Erreur dans adm_edit_btn_url")
         return
     
     if data.startswith("adm_confirm_edit:"):
@@ -2385,7 +4022,7 @@ async def handle_admin_action(update: Update, context: ContextTypes.DEFAULT_TYPE
         return
     # Links submenu: uniquement les vrais boutons affichés à l'accueil
     if data == "adm_links":
-        miniapp_label = _load_config().get("miniapp_label", "GhostLine13 MiniApp")
+        miniapp_label = _config_view().get("miniapp_label", "GhostLine13 MiniApp")
         kb = InlineKeyboardMarkup([
             [InlineKeyboardButton(f"{miniapp_label} (URL)", callback_data="adm_link_miniapp")],
             [InlineKeyboardButton("Potato 🥔🚀", callback_data="adm_link_potato"), InlineKeyboardButton("Contact 📱", callback_data="adm_link_contact")],
@@ -2422,97 +4059,127 @@ async def handle_admin_action(update: Update, context: ContextTypes.DEFAULT_TYPE
         context.user_data["await_action"] = "ban_add" if data.endswith("add") else "ban_remove"
         await _admin_edit("Envoyez l'ID utilisateur ou @pseudo à traiter.", reply_markup=_with_back(None))
         return
+    # Diffusion: brouillon (broadcast.json), envoi à tous et rappel de la dernière diffusion
+    if data == "adm_broadcast":
+        draft = _load_broadcast()
+        last = _load_last_broadcast()
+        rows = [[InlineKeyboardButton("✏️ Composer", callback_data="adm_broadcast_compose")]]
+        if (draft.get("text") or "").strip() or draft.get("media_type"):
+            rows.append([InlineKeyboardButton("🚀 Envoyer à tous", callback_data="adm_broadcast_confirm")])
+        if last.get("messages"):
+            rows.append([InlineKeyboardButton(f"↩️ Rappeler la dernière ({len(last['messages'])})", callback_data="adm_broadcast_recall")])
+        txt = f"📣 Diffusion\n\n{_broadcast_summary(draft)}"
+        if _BROADCAST_RUNNING:
+            txt += "\n\n⏳ Une diffusion est en cours."
+        await _admin_edit(txt, reply_markup=_with_back(InlineKeyboardMarkup(rows)))
+        return
+    if data == "adm_broadcast_compose":
+        context.user_data["await_action"] = "broadcast_compose"
+        await _admin_edit(
+            "✏️ Envoyez le message à diffuser: texte, photo ou vidéo (la légende sert de texte).",
+            reply_markup=_with_back(None),
+        )
+        return
+    if data == "adm_broadcast_confirm":
+        seg_all, seg_30, seg_7 = len(_broadcast_recipients()), len(_broadcast_recipients(30)), len(_broadcast_recipients(7))
+        kb = InlineKeyboardMarkup([
+            [InlineKeyboardButton(f"👥 Tous ({seg_all})", callback_data="adm_broadcast_send:0")],
+            [InlineKeyboardButton(f"🟢 Actifs 30j ({seg_30})", callback_data="adm_broadcast_send:30"), InlineKeyboardButton(f"🔥 Actifs 7j ({seg_7})", callback_data="adm_broadcast_send:7")],
+            [InlineKeyboardButton("❌ Annuler", callback_data="adm_broadcast")],
+        ])
+        await _admin_edit(f"⚠️ Choisissez les destinataires:\n\n{_broadcast_summary(_load_broadcast())}", reply_markup=kb)
+        return
+    if data.startswith("adm_broadcast_send"):
+        try:
+            seg = int(data.split(":", 1)[1]) if ":" in data else 0
+        except Exception:
+            seg = 0
+        context.application.create_task(_broadcast_background(context, query.message.chat_id, seg or None), update=update, name="broadcast")
+        await _admin_edit("📣 Diffusion lancée en tâche de fond. La progression s'affiche ci-dessous.", reply_markup=_with_back(_admin_keyboard()))
+        return
+    if data == "adm_broadcast_recall":
+        context.application.create_task(_broadcast_recall_background(context, query.message.chat_id), update=update, name="broadcast_recall")
+        await _admin_edit("↩️ Rappel de la dernière diffusion lancé en tâche de fond.", reply_markup=_with_back(_admin_keyboard()))
+        return
+    # Journaux: verbosité et échantillonnage modifiables à chaud (persistés dans config.json)
+    if data == "adm_logs" or data.startswith(("adm_log_level:", "adm_log_sample:")):
+        if data.startswith("adm_log_level:"):
+            level = _set_log_level(data.split(":", 1)[1])
+            _save_config({"log_level": level})
+            _log.warning("Niveau de log changé: %s", level, extra=_log_fields(admin_id=user_id))
+        elif data.startswith("adm_log_sample:"):
+            try:
+                _HOT_SAMPLER.rate = min(1.0, max(0.0, float(data.split(":", 1)[1])))
+                _save_config({"log_sample_rate": _HOT_SAMPLER.rate})
+            except ValueError:
+                pass
+        current = logging.getLevelName(_log.getEffectiveLevel())
+        mark = lambda ok: "• " if ok else ""
+        kb = InlineKeyboardMarkup([
+            [InlineKeyboardButton(f"{mark(current == lv)}{lv}", callback_data=f"adm_log_level:{lv}") for lv in _LOG_LEVELS[:2]],
+            [InlineKeyboardButton(f"{mark(current == lv)}{lv}", callback_data=f"adm_log_level:{lv}") for lv in _LOG_LEVELS[2:]],
+            [InlineKeyboardButton(f"{mark(_HOT_SAMPLER.rate == r)}{r:.0%}", callback_data=f"adm_log_sample:{r}") for r in (0.01, 0.1, 1.0)],
+        ])
+        txt = (
+            "🪵 Journaux (JSON sur stdout)\n\n"
+            f"Niveau actuel: {current}\n"
+            f"Échantillonnage des logs debug fréquents: {_HOT_SAMPLER.rate:.0%}\n\n"
+            "DEBUG est très verbeux: à réserver au diagnostic."
+        )
+        await _admin_edit(txt, reply_markup=_with_back(kb), store_prev=(data == "adm_logs"))
+        return
+    # Diagnostics: retard de la boucle et derniers blocages (piles complètes en document)
+    if data in ("adm_diag", "adm_diag_refresh"):
+        kb = InlineKeyboardMarkup([
+            [InlineKeyboardButton("🔄 Actualiser", callback_data="adm_diag_refresh"), InlineKeyboardButton("📄 Piles", callback_data="adm_diag_report")],
+            [InlineKeyboardButton("🔬 Profiler 15s", callback_data="adm_profile:15"), InlineKeyboardButton("🔬 Profiler 60s", callback_data="adm_profile:60")],
+        ])
+        await _admin_edit(_diagnostics_text(), reply_markup=_with_back(kb), store_prev=(data == "adm_diag"))
+        return
+    if data.startswith("adm_profile:"):
+        try:
+            seconds = min(_PROFILE_MAX_SECONDS, max(5.0, float(data.split(":", 1)[1])))
+        except ValueError:
+            seconds = 30.0
+        await _start_profile(update, context, query.message.chat_id, seconds)
+        return
+    if data == "adm_diag_report":
+        try:
+            await context.bot.send_document(
+                chat_id=query.message.chat_id,
+                document=InputFile(BytesIO(_diagnostics_report()), filename=f"diagnostics-{time.strftime('%Y%m%d-%H%M%S')}.txt"),
+            )
+        except Exception as e:
+            await query.answer(f"Envoi impossible: {e}", show_alert=True)
+        return
     # Aide: liste des commandes dans l'admin
     if data == "adm_help":
         help_text = (
             "📖 Commandes admin disponibles\n\n"
-            "/page — Publier la page d'accueil dans un canal (auto-supprime la commande)."
+            "/page — Publier la page d'accueil dans un canal (auto-supprime la commande).\n"
+            "/profile [secondes] — Profil CPU + tâches asyncio du bot en cours (fichiers flamegraph)."
         )
         await _admin_edit(help_text, reply_markup=_with_back(None))
         return
 
-    # Bouton retour: revenir à l'étape précédente si la pile a des éléments, sinon panneau admin
+    # Bouton retour: réafficher la route précédente (rendue à neuf), sinon le panneau admin
     if data == "adm_back":
         stack = context.user_data.get("adm_nav_stack") or []
-        try:
-            await query.message.delete()
-        except Exception:
-            pass
-        if stack:
-            prev = stack.pop()
-            context.user_data["adm_nav_stack"] = stack
-            context.user_data.pop("await_action", None)
-            prev_text = prev.get("text") or ""
-            # Si on revient au menu création produit, le reconstruire avec les données à jour (avec photo)
-            if "Nouveau produit" in prev_text or "Remplissez chaque champ" in prev_text or "Choisissez la catégorie" in prev_text:
-                product = context.user_data.get("new_product") or {}
-                _txt, _kb = _build_new_product_add_menu(product)
-                try:
-                    media = await _get_welcome_media()
-                    if media:
-                        await context.bot.send_photo(
-                            chat_id=query.message.chat_id,
-                            photo=media,
-                            caption=_txt,
-                            reply_markup=_with_back(_kb)
-                        )
-                    else:
-                        await context.bot.send_message(
-                            chat_id=query.message.chat_id,
-                            text=_txt,
-                            reply_markup=_with_back(_kb)
-                        )
-                except Exception:
-                    pass
-                return
-            prev_kb = prev.get("reply_markup")
-            prev_has_photo = prev.get("has_photo", False)
-            try:
-                if prev_has_photo and prev_text:
-                    media = await _get_welcome_media()
-                    if media:
-                        await context.bot.send_photo(
-                            chat_id=query.message.chat_id,
-                            photo=media,
-                            caption=prev_text,
-                            reply_markup=prev_kb
-                        )
-                    else:
-                        await context.bot.send_message(chat_id=query.message.chat_id, text=prev_text, reply_markup=prev_kb)
-                elif prev_text:
-                    await context.bot.send_message(
-                        chat_id=query.message.chat_id,
-                        text=prev_text,
-                        reply_markup=prev_kb
-                    )
-                else:
-                    media = await _get_welcome_media()
-                    panel_caption = _admin_panel_caption()
-                    if media:
-                        await context.bot.send_photo(chat_id=query.message.chat_id, photo=media, caption=panel_caption, reply_markup=_admin_keyboard())
-                    else:
-                        await context.bot.send_message(chat_id=query.message.chat_id, text=panel_caption, reply_markup=_admin_keyboard())
-            except Exception:
-                media = await _get_welcome_media()
-                panel_caption = _admin_panel_caption()
-                if media:
-                    await context.bot.send_photo(chat_id=query.message.chat_id, photo=media, caption=panel_caption, reply_markup=_admin_keyboard())
-                else:
-                    await context.bot.send_message(chat_id=query.message.chat_id, text=panel_caption, reply_markup=_admin_keyboard())
-        else:
-            try:
-                context.user_data.pop("await_action", None)
-            except Exception:
-                pass
-            try:
-                media = await _get_welcome_media()
-                panel_caption = _admin_panel_caption()
-                if media:
-                    await context.bot.send_photo(chat_id=query.message.chat_id, photo=media, caption=panel_caption, reply_markup=_admin_keyboard())
-                else:
-                    await context.bot.send_message(chat_id=query.message.chat_id, text=panel_caption, reply_markup=_admin_keyboard())
-            except Exception:
-                pass
+        context.user_data.pop("await_action", None)
+        context.user_data.pop("adm_edit_key", None)
+        route, args = _ADMIN_NAV_ROOT
+        while stack:
+            entry = stack.pop()
+            # Ignorés: ancien format (dict) persisté, invites de saisie empilées avant leur exclusion
+            if isinstance(entry, tuple) and _nav_route(entry[0]) is not None:
+                route, args = entry
+                break
+        context.user_data["adm_route"] = (route, args)
+        await handle_admin_action(update, context, replay=":".join((route, *args)))
+        return
+
+    if data == "adm_panel":
+        await _admin_edit(_admin_panel_caption(), reply_markup=_admin_keyboard())
         return
 
     # Bouton Retour accueil: supprimer le message admin et afficher l'accueil du bot (comme /start)
@@ -2521,16 +4188,15 @@ async def handle_admin_action(update: Update, context: ContextTypes.DEFAULT_TYPE
             context.user_data.pop("await_action", None)
         except Exception:
             pass
-        try:
-            context.user_data["adm_nav_stack"] = []
-        except Exception:
-            pass
+        context.user_data["adm_nav_stack"] = []
+        context.user_data.pop("adm_route", None)
+        context.user_data.pop("adm_panel", None)
         try:
             await query.message.delete()
         except Exception:
             pass
         try:
-            cfg = _load_config()
+            cfg = _config_view()
             main_caption = (cfg.get("welcome_caption") or WELCOME_CAPTION_TEXT).strip()
             reply_markup = _build_welcome_keyboard_layout(
                 cfg, cfg.get("hidden_buttons"), getattr(context.bot, "username", None)
@@ -2555,23 +4221,23 @@ async def handle_admin_input(update: Update, context: ContextTypes.DEFAULT_TYPE)
     msg = update.message
     cfg = _load_config()
     raw = (msg.text or msg.caption or "").strip()
+    # L'écran qui suit une saisie est un nouveau message (panneau par défaut) : Retour y ramène
+    context.user_data["adm_route"] = _ADMIN_NAV_ROOT
 
     # ========== GESTION PRODUITS (input handlers) ==========
     if key and str(key).startswith("prod_"):
         raw = (msg.text or msg.caption or "").strip()
         api_url = cfg.get("miniapp_url", "").rstrip("/")
-        api_key = os.getenv("BOT_API_KEY", "")
+        api_key = BOT_API_KEY
         headers = {"x-api-key": api_key} if api_key else {}
         
         async def _send_product_menu(caption: str, kb: InlineKeyboardMarkup):
+            context.user_data["adm_route"] = ("adm_prod_add_menu", ())
             kb_rows = list(kb.inline_keyboard) if kb else []
             kb_rows.append([InlineKeyboardButton("⬅️ Retour", callback_data="adm_back")])
             full_kb = InlineKeyboardMarkup(kb_rows)
-            media = await _get_welcome_media()
-            if media:
-                await context.bot.send_photo(chat_id=msg.chat_id, photo=media, caption=caption, reply_markup=full_kb)
-            else:
-                await msg.reply_text(caption, reply_markup=full_kb)
+            # Nouveau panneau sous la saisie de l'admin (l'invite reste au-dessus)
+            await _panel_send(context, msg.chat_id, caption, full_kb)
 
         # Ajout produit - Titre (retour au menu)
         if key == "prod_add_title":
@@ -2650,16 +4316,10 @@ async def handle_admin_input(update: Update, context: ContextTypes.DEFAULT_TYPE)
                     tg_file = await context.bot.get_file(file_id)
                     ext = "jpg"
                     mime = "image/jpeg"
-                    with tempfile.NamedTemporaryFile(suffix=f".{ext}", delete=False) as tmp:
-                        await tg_file.download_to_drive(tmp.name)
-                        with open(tmp.name, "rb") as f:
-                            file_data = f.read()
-                        try:
-                            os.unlink(tmp.name)
-                        except Exception:
-                            pass
+                    # Téléchargement en mémoire: pas de fichier temporaire écrit/relu sur la boucle
+                    file_data = bytes(await tg_file.download_as_bytearray())
                     files = {"file": (f"product.{ext}", file_data, mime)}
-                    async with httpx.AsyncClient(timeout=30.0) as client:
+                    async with _shop_client(timeout=30.0) as client:
                         up = await client.post(f"{api_url}/api/upload", files=files, headers=headers)
                     if up.status_code == 200:
                         data = up.json()
@@ -2689,16 +4349,10 @@ async def handle_admin_input(update: Update, context: ContextTypes.DEFAULT_TYPE)
                     tg_file = await context.bot.get_file(file_id)
                     ext = "mp4"
                     mime = "video/mp4"
-                    with tempfile.NamedTemporaryFile(suffix=f".{ext}", delete=False) as tmp:
-                        await tg_file.download_to_drive(tmp.name)
-                        with open(tmp.name, "rb") as f:
-                            file_data = f.read()
-                        try:
-                            os.unlink(tmp.name)
-                        except Exception:
-                            pass
+                    # Téléchargement en mémoire: pas de fichier temporaire écrit/relu sur la boucle
+                    file_data = bytes(await tg_file.download_as_bytearray())
                     files = {"file": (f"product.{ext}", file_data, mime)}
-                    async with httpx.AsyncClient(timeout=180.0) as client:
+                    async with _shop_client(timeout=180.0) as client:
                         up = await client.post(f"{api_url}/api/upload", files=files, headers=headers)
                     if up.status_code == 200:
                         data = up.json()
@@ -2741,18 +4395,13 @@ async def handle_admin_input(update: Update, context: ContextTypes.DEFAULT_TYPE)
                         "videoUrl": product.get("videoUrl") or None,
                         "variants": [{"name": p["name"], "type": "weight", "price": p["price"]} for p in prices],
                     }
-                    async with httpx.AsyncClient() as client:
+                    async with _shop_client() as client:
                         resp = await client.post(f"{api_url}/api/products", json=payload, headers=headers, timeout=10.0)
                     if resp.status_code in (200, 201):
                         prices_txt = ", ".join(f"{p['name']}g {_format_price(p['price'])}" for p in prices)
                         await msg.reply_text(f"✅ Produit ajouté!\n\n\"{product.get('title', '')}\" - Prix: {prices_txt}", parse_mode="HTML")
                         try:
-                            media = await _get_welcome_media()
-                            panel_caption = _admin_panel_caption()
-                            if media:
-                                await context.bot.send_photo(chat_id=msg.chat_id, photo=media, caption=panel_caption, reply_markup=_admin_keyboard())
-                            else:
-                                await context.bot.send_message(chat_id=msg.chat_id, text=panel_caption, reply_markup=_admin_keyboard())
+                            await _panel_send(context, msg.chat_id, _admin_panel_caption(), _admin_keyboard())
                         except Exception:
                             pass
                     else:
@@ -2788,44 +4437,28 @@ async def handle_admin_input(update: Update, context: ContextTypes.DEFAULT_TYPE)
                 if (raw or "").strip().lower() in ("/skip", "skip"):
                     context.user_data.pop("await_action", None)
                     try:
-                        media = await _get_welcome_media()
-                        panel_caption = _admin_panel_caption()
-                        if media:
-                            await context.bot.send_photo(chat_id=msg.chat_id, photo=media, caption=panel_caption, reply_markup=_admin_keyboard())
-                        else:
-                            await context.bot.send_message(chat_id=msg.chat_id, text=panel_caption, reply_markup=_admin_keyboard())
+                        await _panel_send(context, msg.chat_id, _admin_panel_caption(), _admin_keyboard())
                     except Exception:
                         pass
                 elif msg.photo:
                     try:
                         file_id = msg.photo[-1].file_id
                         tg_file = await context.bot.get_file(file_id)
-                        with tempfile.NamedTemporaryFile(suffix=".jpg", delete=False) as tmp:
-                            await tg_file.download_to_drive(tmp.name)
-                            with open(tmp.name, "rb") as f:
-                                file_data = f.read()
-                            try:
-                                os.unlink(tmp.name)
-                            except Exception:
-                                pass
+                        # Téléchargement en mémoire: pas de fichier temporaire écrit/relu sur la boucle
+                        file_data = bytes(await tg_file.download_as_bytearray())
                         files = {"file": ("product.jpg", file_data, "image/jpeg")}
-                        async with httpx.AsyncClient(timeout=30.0) as client:
+                        async with _shop_client(timeout=30.0) as client:
                             up = await client.post(f"{api_url}/api/upload", files=files, headers=headers)
                         if up.status_code == 200:
                             data = up.json()
                             url = (data.get("url") or data.get("fileName") or "").strip()
                             url = url if url.startswith("/") else f"/{url}" if url else ""
-                            async with httpx.AsyncClient() as client:
+                            async with _shop_client() as client:
                                 resp = await client.patch(f"{api_url}/api/products/{pid}", json={"image": url}, headers=headers, timeout=10.0)
                             if resp.status_code == 200:
                                 context.user_data.pop("await_action", None)
                                 try:
-                                    media = await _get_welcome_media()
-                                    panel_caption = _admin_panel_caption()
-                                    if media:
-                                        await context.bot.send_photo(chat_id=msg.chat_id, photo=media, caption=panel_caption, reply_markup=_admin_keyboard())
-                                    else:
-                                        await context.bot.send_message(chat_id=msg.chat_id, text=panel_caption, reply_markup=_admin_keyboard())
+                                    await _panel_send(context, msg.chat_id, _admin_panel_caption(), _admin_keyboard())
                                 except Exception:
                                     pass
                             else:
@@ -2849,12 +4482,7 @@ async def handle_admin_input(update: Update, context: ContextTypes.DEFAULT_TYPE)
                 if (raw or "").strip().lower() in ("/skip", "skip"):
                     context.user_data.pop("await_action", None)
                     try:
-                        media = await _get_welcome_media()
-                        panel_caption = _admin_panel_caption()
-                        if media:
-                            await context.bot.send_photo(chat_id=msg.chat_id, photo=media, caption=panel_caption, reply_markup=_admin_keyboard())
-                        else:
-                            await context.bot.send_message(chat_id=msg.chat_id, text=panel_caption, reply_markup=_admin_keyboard())
+                        await _panel_send(context, msg.chat_id, _admin_panel_caption(), _admin_keyboard())
                     except Exception:
                         pass
                 elif msg.video or msg.video_note:
@@ -2862,33 +4490,22 @@ async def handle_admin_input(update: Update, context: ContextTypes.DEFAULT_TYPE)
                         vid = msg.video or msg.video_note
                         file_id = vid.file_id
                         tg_file = await context.bot.get_file(file_id)
-                        with tempfile.NamedTemporaryFile(suffix=".mp4", delete=False) as tmp:
-                            await tg_file.download_to_drive(tmp.name)
-                            with open(tmp.name, "rb") as f:
-                                file_data = f.read()
-                            try:
-                                os.unlink(tmp.name)
-                            except Exception:
-                                pass
+                        # Téléchargement en mémoire: pas de fichier temporaire écrit/relu sur la boucle
+                        file_data = bytes(await tg_file.download_as_bytearray())
                         files = {"file": ("product.mp4", file_data, "video/mp4")}
-                        async with httpx.AsyncClient(timeout=180.0) as client:
+                        async with _shop_client(timeout=180.0) as client:
                             up = await client.post(f"{api_url}/api/upload", files=files, headers=headers)
                         if up.status_code == 200:
                             data = up.json()
                             url = (data.get("url") or data.get("fileName") or "").strip()
                             url = url if url.startswith("/") else f"/{url}" if url else ""
-                            async with httpx.AsyncClient() as client:
+                            async with _shop_client() as client:
                                 resp = await client.patch(f"{api_url}/api/products/{pid}", json={"videoUrl": url}, headers=headers, timeout=10.0)
                             if resp.status_code == 200:
                                 context.user_data.pop("await_action", None)
                                 await msg.reply_text("✅ Vidéo mise à jour avec succès!")
                                 try:
-                                    media = await _get_welcome_media()
-                                    panel_caption = _admin_panel_caption()
-                                    if media:
-                                        await context.bot.send_photo(chat_id=msg.chat_id, photo=media, caption=panel_caption, reply_markup=_admin_keyboard())
-                                    else:
-                                        await context.bot.send_message(chat_id=msg.chat_id, text=panel_caption, reply_markup=_admin_keyboard())
+                                    await _panel_send(context, msg.chat_id, _admin_panel_caption(), _admin_keyboard())
                                 except Exception:
                                     pass
                             else:
@@ -2915,7 +4532,7 @@ async def handle_admin_input(update: Update, context: ContextTypes.DEFAULT_TYPE)
             try:
                 # L'API attend basePrice, pas price
                 api_field = "basePrice" if field == "price" else field
-                async with httpx.AsyncClient() as client:
+                async with _shop_client() as client:
                     resp = await client.patch(
                         f"{api_url}/api/products/{pid}",
                         json={api_field: raw},
@@ -2947,12 +4564,7 @@ async def handle_admin_input(update: Update, context: ContextTypes.DEFAULT_TYPE)
             pass
         await msg.reply_text(f"✅ Nom du bouton MiniApp mis à jour: {new_name}")
         try:
-            media = await _get_welcome_media()
-            panel_caption = _admin_panel_caption()
-            if media:
-                await context.bot.send_photo(chat_id=msg.chat_id, photo=media, caption=panel_caption, reply_markup=_admin_keyboard())
-            else:
-                await context.bot.send_message(chat_id=msg.chat_id, text=panel_caption, reply_markup=_admin_keyboard())
+            await _panel_send(context, msg.chat_id, _admin_panel_caption(), _admin_keyboard())
         except Exception:
             pass
         return
@@ -2970,12 +4582,7 @@ async def handle_admin_input(update: Update, context: ContextTypes.DEFAULT_TYPE)
             pass
         await msg.reply_text(f"✅ @ Panier mis à jour: @{new_val}")
         try:
-            media = await _get_welcome_media()
-            panel_caption = _admin_panel_caption()
-            if media:
-                await context.bot.send_photo(chat_id=msg.chat_id, photo=media, caption=panel_caption, reply_markup=_admin_keyboard())
-            else:
-                await context.bot.send_message(chat_id=msg.chat_id, text=panel_caption, reply_markup=_admin_keyboard())
+            await _panel_send(context, msg.chat_id, _admin_panel_caption(), _admin_keyboard())
         except Exception:
             pass
         return
@@ -2991,12 +4598,7 @@ async def handle_admin_input(update: Update, context: ContextTypes.DEFAULT_TYPE)
                 pass
             await msg.reply_text("Sauvegardé avec succès.")
             try:
-                media = await _get_welcome_media()
-                panel_caption = _admin_panel_caption()
-                if media:
-                    await context.bot.send_photo(chat_id=msg.chat_id, photo=media, caption=panel_caption, reply_markup=_admin_keyboard())
-                else:
-                    await context.bot.send_message(chat_id=msg.chat_id, text=panel_caption, reply_markup=_admin_keyboard())
+                await _panel_send(context, msg.chat_id, _admin_panel_caption(), _admin_keyboard())
             except Exception:
                 pass
             return
@@ -3013,12 +4615,7 @@ async def handle_admin_input(update: Update, context: ContextTypes.DEFAULT_TYPE)
             pass
         await msg.reply_text("URL Contact enregistrée.")
         try:
-            media = await _get_welcome_media()
-            panel_caption = _admin_panel_caption()
-            if media:
-                await context.bot.send_photo(chat_id=msg.chat_id, photo=media, caption=panel_caption, reply_markup=_admin_keyboard())
-            else:
-                await context.bot.send_message(chat_id=msg.chat_id, text=panel_caption, reply_markup=_admin_keyboard())
+            await _panel_send(context, msg.chat_id, _admin_panel_caption(), _admin_keyboard())
         except Exception:
             pass
         return
@@ -3356,6 +4953,27 @@ async def handle_admin_input(update: Update, context: ContextTypes.DEFAULT_TYPE)
             await msg.reply_text(f"Bouton #{bid} supprimé.")
             context.user_data.pop("await_action", None)
             return
+    # Composer le brouillon de diffusion (texte, photo ou vidéo)
+    if key == "broadcast_compose":
+        draft = {"text": raw, "media_url": None, "media_type": None, "updated_at": int(time.time())}
+        if msg.photo:
+            draft["media_type"] = "photo"
+            draft["media_file_id"] = msg.photo[-1].file_id
+        elif msg.video:
+            draft["media_type"] = "video"
+            draft["media_file_id"] = msg.video.file_id
+        elif not raw:
+            await msg.reply_text("Message vide. Envoyez un texte, une photo ou une vidéo.")
+            return
+        _save_broadcast(draft)
+        context.user_data.pop("await_action", None)
+        kb = InlineKeyboardMarkup([
+            [InlineKeyboardButton("🚀 Envoyer à tous", callback_data="adm_broadcast_confirm")],
+            [InlineKeyboardButton("✏️ Recomposer", callback_data="adm_broadcast_compose")],
+            [InlineKeyboardButton("⬅️ Retour", callback_data="adm_broadcast")],
+        ])
+        await msg.reply_text(f"✅ Brouillon enregistré.\n\n{_broadcast_summary(draft)}", reply_markup=kb)
+        return
     # Change logo
     if key == "change_logo":
         if msg.photo:
@@ -3363,7 +4981,8 @@ async def handle_admin_input(update: Update, context: ContextTypes.DEFAULT_TYPE)
                 file_id = msg.photo[-1].file_id
                 f = await context.bot.get_file(file_id)
                 local_path = os.path.join(_BASE_DIR, "IMG.jpg")
-                await f.download_to_drive(local_path)
+                data = bytes(await f.download_as_bytearray())
+                await _io(_write_bytes_atomic, local_path, data)
                 await msg.reply_text("Logo mis à jour.")
             except Exception as e:
                 await msg.reply_text(f"Échec mise à jour du logo: {e}")
@@ -3432,33 +5051,1315 @@ async def handle_admin_input(update: Update, context: ContextTypes.DEFAULT_TYPE)
         context.user_data.pop("await_action", None)
         return
 
-def main() -> None:
+# --------- Traitement concurrent des updates (ordre garanti par chat) ---------
+MAX_CONCURRENT_UPDATES = int(os.getenv("MAX_CONCURRENT_UPDATES", "64"))
+
+def _update_serial_key(update) -> int | None:
+    """Clé de sérialisation: le chat (sinon l'utilisateur). Deux updates d'un même chat
+    ne s'exécutent jamais en parallèle; les étapes d'un assistant admin restent ordonnées.
+    """
+    try:
+        if update.effective_chat:
+            return int(update.effective_chat.id)
+        if update.effective_user:
+            return int(update.effective_user.id)
+    except Exception:
+        pass
+    return None
+
+# --------- Persistance de l'état admin (assistants en cours, SQLite) ---------
+# user_data (await_action, new_product, adm_nav_stack...) survit aux redémarrages: une ligne par
+# (utilisateur, clé), réécrite seulement si sa valeur sérialisée a changé. Les sessions sans
+# modification depuis STATE_TTL secondes sont oubliées (mémoire et base).
+_STATE_DB_PATH = os.getenv("BOT_STATE_DB") or os.path.join(_BASE_DIR, _shard_file("bot_state.sqlite3"))
+_STATE_TTL = float(os.getenv("STATE_TTL", "86400"))
+_STATE_FLUSH_INTERVAL = float(os.getenv("STATE_FLUSH_INTERVAL", "5"))
+
+class _SqlitePersistence(BasePersistence):
+    """Persistance PTB limitée à user_data; toutes les requêtes SQLite passent par le thread d'E/S."""
+
+    def __init__(self, path: str, ttl: float, update_interval: float):
+        super().__init__(store_data=PersistenceInput(bot_data=False, chat_data=False, user_data=True, callback_data=False),
+                         update_interval=update_interval)
+        self.path = path
+        self.ttl = ttl
+        self._db: sqlite3.Connection | None = None
+        # Empreinte de la dernière valeur écrite et dernière écriture, par utilisateur
+        self._digests: dict[int, dict[str, bytes]] = {}
+        self._touched: dict[int, float] = {}
+        self._next_sweep = 0.0
+
+    def _conn(self) -> sqlite3.Connection:
+        if self._db is None:
+            db = sqlite3.connect(self.path, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.execute("CREATE TABLE IF NOT EXISTS user_data (user_id INTEGER NOT NULL, key TEXT NOT NULL, "
+                       "value BLOB NOT NULL, updated_at REAL NOT NULL, PRIMARY KEY (user_id, key))")
+            self._db = db
+        return self._db
+
+    def _load_sync(self) -> dict[int, dict]:
+        db = self._conn()
+        with db:
+            db.execute("DELETE FROM user_data WHERE user_id IN (SELECT user_id FROM user_data "
+                       "GROUP BY user_id HAVING MAX(updated_at) < ?)", (time.time() - self.ttl,))
+        out: dict[int, dict] = {}
+        for user_id, key, value, updated_at in db.execute("SELECT user_id, key, value, updated_at FROM user_data"):
+            try:
+                out.setdefault(user_id, {})[key] = pickle.loads(value)
+            except Exception:
+                _log.warning("État admin illisible ignoré (user %s, clé %s)", user_id, key)
+                continue
+            self._digests.setdefault(user_id, {})[key] = hashlib.blake2b(value, digest_size=16).digest()
+            self._touched[user_id] = max(self._touched.get(user_id, 0.0), updated_at)
+        return out
+
+    def _apply_sync(self, user_id: int, upserts: list, deletes: list, now: float) -> None:
+        db = self._conn()
+        with db:
+            if upserts:
+                db.executemany("INSERT INTO user_data (user_id, key, value, updated_at) VALUES (?, ?, ?, ?) "
+                               "ON CONFLICT(user_id, key) DO UPDATE SET value = excluded.value, updated_at = excluded.updated_at",
+                               [(user_id, k, v, now) for k, v in upserts])
+            if deletes:
+                db.executemany("DELETE FROM user_data WHERE user_id = ? AND key = ?", [(user_id, k) for k in deletes])
+
+    def _drop_sync(self, user_id: int) -> None:
+        with self._conn() as db:
+            db.execute("DELETE FROM user_data WHERE user_id = ?", (user_id,))
+
+    def _close_sync(self) -> None:
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    async def get_user_data(self) -> dict[int, dict]:
+        data = await _io(self._load_sync)
+        if data:
+            _log.info("État admin restauré pour %d utilisateur(s)", len(data))
+        return data
+
+    async def update_user_data(self, user_id: int, data: dict) -> None:
+        known = self._digests.get(user_id)
+        if not data and not known:
+            return  # cas courant: utilisateur sans état
+        known = known if known is not None else {}
+        upserts = []
+        for key, value in data.items():
+            try:
+                blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+            except Exception:
+                _log.debug("Clé user_data non sérialisable ignorée: %s", key)
+                continue
+            digest = hashlib.blake2b(blob, digest_size=16).digest()
+            if known.get(key) != digest:
+                known[key] = digest
+                upserts.append((key, blob))
+        deletes = [key for key in known if key not in data]
+        for key in deletes:
+            del known[key]
+        now = time.time()
+        if known:
+            self._digests[user_id] = known
+        else:
+            self._digests.pop(user_id, None)
+        if upserts or deletes:
+            self._touched[user_id] = now
+            _io_submit(self._apply_sync, user_id, upserts, deletes, now)
+        self._sweep(now)
+
+    def _sweep(self, now: float) -> None:
+        # Sessions abandonnées: oubliées en mémoire (drop_user_data -> suppression en base au cycle suivant)
+        if now < self._next_sweep or _APPLICATION is None:
+            return
+        self._next_sweep = now + 60.0
+        for user_id, seen in list(self._touched.items()):
+            if now - seen > self.ttl:
+                del self._touched[user_id]
+                _APPLICATION.drop_user_data(user_id)
+
+    async def drop_user_data(self, user_id: int) -> None:
+        self._digests.pop(user_id, None)
+        self._touched.pop(user_id, None)
+        _io_submit(self._drop_sync, user_id)
+
+    async def refresh_user_data(self, user_id: int, user_data: dict) -> None:
+        pass
+
+    async def flush(self) -> None:
+        await _io(self._close_sync)
+
+    # Données non persistées (store_data): bot_data contient des tâches, le reste est inutilisé
+    async def get_chat_data(self) -> dict:
+        return {}
+
+    async def get_bot_data(self) -> dict:
+        return {}
+
+    async def get_callback_data(self):
+        return None
+
+    async def get_conversations(self, name: str) -> dict:
+        return {}
+
+    async def update_conversation(self, name: str, key, new_state) -> None:
+        pass
+
+    async def update_chat_data(self, chat_id: int, data: dict) -> None:
+        pass
+
+    async def update_bot_data(self, data: dict) -> None:
+        pass
+
+    async def update_callback_data(self, data) -> None:
+        pass
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        pass
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: dict) -> None:
+        pass
+
+    async def refresh_bot_data(self, bot_data: dict) -> None:
+        pass
+
+# --------- Enregistrement des updates (rejeu: bots/tools/replay_updates.py) ---------
+RECORD_UPDATES_DIR = os.getenv("RECORD_UPDATES_DIR", "")  # vide = désactivé
+_RECORD_ROTATE_BYTES = int(float(os.getenv("RECORD_ROTATE_MB", "64")) * 1024 * 1024)
+_RECORD_KEEP_FILES = int(os.getenv("RECORD_KEEP_FILES", "48"))
+# Objets porteurs d'identité: id remplacé, noms et coordonnées retirés
+_RECORD_PEER_KEYS = {"from", "chat", "user", "sender_chat", "forward_from", "forward_from_chat", "via_bot", "new_chat_member", "old_chat_member"}
+_RECORD_DROP_KEYS = {"contact", "location", "venue", "phone_number"}
+
+class _UpdateRecorder:
+    """Écrit les updates reçues en JSONL gzip tournant, identifiants anonymisés de façon stable
+    (HMAC dérivé du jeton: même utilisateur -> même id anonyme, d'un fichier à l'autre).
+    Sérialisation sur la boucle, compression et écriture dans le thread d'E/S (par lots).
+    """
+
+    def __init__(self, directory: str, key: bytes):
+        self.directory = directory
+        self.enabled = bool(directory)
+        self._key = key
+        self._buffer: list[str] = []
+        self._fh = None
+        self._written = 0
+
+    def _anon_id(self, value: int) -> int:
+        digest = hmac.new(self._key, str(value).encode(), hashlib.sha256).digest()
+        anon = 1_000_000_000 + int.from_bytes(digest[:4], "big") % 1_000_000_000
+        return -anon if value < 0 else anon
+
+    def _anonymize(self, obj, key: str = ""):
+        if isinstance(obj, dict):
+            out = {}
+            for k, v in obj.items():
+                if k in _RECORD_DROP_KEYS:
+                    continue
+                if k in _RECORD_PEER_KEYS and isinstance(v, dict):
+                    peer = {pk: pv for pk, pv in v.items() if pk in ("id", "is_bot", "type", "username", "language_code")}
+                    if "id" in peer:
+                        peer["id"] = self._anon_id(int(peer["id"]))
+                        peer["first_name"] = "User"
+                        if "username" in peer:
+                            peer["username"] = f"u{abs(peer['id'])}"
+                    out[k] = peer
+                elif k == "chat_instance":
+                    out[k] = hmac.new(self._key, str(v).encode(), hashlib.sha256).hexdigest()[:16]
+                elif k in ("text", "caption") and isinstance(v, str) and not v.startswith("/"):
+                    out[k] = "x" * len(v)  # contenu libre masqué, longueur conservée
+                else:
+                    out[k] = self._anonymize(v, k)
+            return out
+        if isinstance(obj, list):
+            return [self._anonymize(v, key) for v in obj]
+        return obj
+
+    def record(self, update) -> None:
+        try:
+            user = getattr(update, "effective_user", None)
+            entry = {"t": round(time.time(), 3), "update": self._anonymize(update.to_dict())}
+            if user and user.id in ADMIN_IDS:
+                entry["admin"] = True  # le rejeu pourra mapper cet utilisateur sur un admin de test
+            self._buffer.append(json.dumps(entry, ensure_ascii=False, separators=(",", ":")))
+        except Exception:
+            _log.exception("enregistrement update")
+
+    def flush(self) -> None:
+        if self._buffer:
+            lines, self._buffer = self._buffer, []
+            _io_submit(self._write_sync, lines)
+
+    def _write_sync(self, lines: list[str]) -> None:
+        """Thread d'E/S: ajout au fichier courant, rotation par taille, purge des plus anciens."""
+        if self._fh is None or self._written >= _RECORD_ROTATE_BYTES:
+            self._close_sync()
+            os.makedirs(self.directory, exist_ok=True)
+            path = os.path.join(self.directory, f"updates-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}.jsonl.gz")
+            self._fh = gzip.open(path, "at", encoding="utf-8", compresslevel=6)
+            self._written = 0
+            files = sorted(f for f in os.listdir(self.directory) if f.startswith("updates-") and f.endswith(".jsonl.gz"))
+            for old in files[:-_RECORD_KEEP_FILES]:
+                try:
+                    os.remove(os.path.join(self.directory, old))
+                except OSError:
+                    pass
+        data = "\n".join(lines) + "\n"
+        self._fh.write(data)
+        self._fh.flush()
+        self._written += len(data)
+
+    def _close_sync(self) -> None:
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
+
+    def close(self) -> None:
+        self.flush()
+        _io_submit(self._close_sync)
+
+_RECORDER = _UpdateRecorder(RECORD_UPDATES_DIR, hashlib.sha256(b"record:" + (TOKEN or "").encode()).digest())
+
+def _update_log_ctx(update) -> dict | None:
+    """Champs de corrélation d'une update (update_id, chat_id, user_id)."""
+    if not isinstance(update, Update):
+        return None
+    ctx = {"update_id": update.update_id}
+    if _TENANT_NAME:
+        ctx["tenant"] = _TENANT_NAME
+    if _WORKER_INDEX is not None:
+        ctx["worker"] = _WORKER_INDEX
+    if update.effective_chat:
+        ctx["chat_id"] = update.effective_chat.id
+    if update.effective_user:
+        ctx["user_id"] = update.effective_user.id
+    return ctx
+
+class _ChatOrderedUpdateProcessor(BaseUpdateProcessor):
+    """Un verrou par chat (créé à la demande, libéré dès que le chat n'a plus d'update en attente),
+    puis une place du pool borné (limit): une update qui attend son chat n'occupe
+    pas de place, un chat occupé ne retarde donc pas les autres.
+    """
+
+    # Le sémaphore de BaseUpdateProcessor est pris avant le verrou de chat: on le rend inopérant
+    # et la vraie limite est appliquée dans do_process_update, après le verrou.
+    _UNBOUNDED = 1 << 30
+
+    def __init__(self, max_concurrent_updates: int):
+        super().__init__(self._UNBOUNDED)
+        self.limit = max_concurrent_updates
+        self._slots = asyncio.BoundedSemaphore(max_concurrent_updates)
+        self._locks: dict[int, asyncio.Lock] = {}
+        self._users: dict[int, int] = {}
+        self.pending = 0    # updates reçues, pas encore terminées
+        self.in_flight = 0  # handlers en cours d'exécution
+        self.processed = 0
+
+    async def do_process_update(self, update, coroutine) -> None:
+        self.pending += 1
+        # Chaque update est traitée dans sa propre tâche: le contexte de log lui reste propre
+        _LOG_CTX.set(_update_log_ctx(update))
+        if _RECORDER.enabled:
+            _RECORDER.record(update)
+        try:
+            key = _update_serial_key(update)
+            if key is None:
+                await self._run(coroutine)
+                return
+            lock = self._locks.get(key)
+            if lock is None:
+                lock = self._locks[key] = asyncio.Lock()
+            self._users[key] = self._users.get(key, 0) + 1
+            try:
+                async with lock:
+                    await self._run(coroutine)
+            finally:
+                left = self._users[key] - 1
+                if left:
+                    self._users[key] = left
+                else:
+                    self._users.pop(key, None)
+                    self._locks.pop(key, None)
+        finally:
+            self.pending -= 1
+            self.processed += 1
+
+    async def _run(self, coroutine) -> None:
+        async with self._slots:
+            self.in_flight += 1
+            try:
+                await coroutine
+            finally:
+                self.in_flight -= 1
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+_UPDATE_PROCESSOR = _ChatOrderedUpdateProcessor(MAX_CONCURRENT_UPDATES)
+
+def _update_gauges(application: Application | None = None) -> dict:
+    """Jauges de traitement: en cours, en attente (pool ou verrou de chat), file d'entrée."""
+    proc = _UPDATE_PROCESSOR
+    gauges = {
+        "in_flight": proc.in_flight,
+        "waiting": max(0, proc.pending - proc.in_flight),
+        "chats_busy": len(proc._locks),
+        "processed": proc.processed,
+        "queue_depth": 0,
+    }
+    try:
+        if application is not None:
+            gauges["queue_depth"] = application.update_queue.qsize()
+    except Exception:
+        pass
+    return gauges
+
+_APPLICATION: Application | None = None  # renseignée au démarrage (jauges /metrics)
+_PromGauge(
+    "bot_updates", "Updates en cours, en attente (pool ou verrou de chat), chats occupés, file d'entrée",
+    lambda: {k: v for k, v in _update_gauges(_APPLICATION).items() if k != "processed"}, ("state",),
+)
+_PromGauge("bot_updates_processed_total", "Updates traitées depuis le démarrage", lambda: _UPDATE_PROCESSOR.processed).kind = "counter"
+
+# --------- Surveillance de la boucle (latence, callbacks lents) ---------
+_LOOP_LAG_INTERVAL = 0.1
+_LOOP_LAG_THRESHOLD = float(os.getenv("LOOP_LAG_THRESHOLD", "0.25"))  # secondes de blocage avant échantillon
+_LOOP_LAG = _PromHistogram("bot_loop_lag_seconds", "Retard d'ordonnancement de la boucle asyncio", (),
+                           (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0))
+_LOOP_STALLS = _PromCounter("bot_loop_stalls_total", "Blocages de la boucle au-delà de LOOP_LAG_THRESHOLD")
+
+class _LoopWatchdog:
+    """Une tâche sur la boucle mesure le retard de réveil (battement de cœur); un thread voit le
+    battement s'arrêter pendant un blocage et échantillonne alors la pile du thread de la boucle:
+    c'est le code fautif, pris en flagrant délit.
+    """
+
+    def __init__(self, threshold: float = _LOOP_LAG_THRESHOLD, interval: float = _LOOP_LAG_INTERVAL):
+        self.threshold = threshold
+        self.interval = interval
+        self.samples: deque = deque(maxlen=int(60 / interval))  # (t, retard) sur ~1 min
+        self.stalls: deque = deque(maxlen=20)                   # derniers blocages, avec pile
+        self._beat = time.monotonic()
+        self._loop = None
+        self._loop_thread_id = None
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._task: asyncio.Task | None = None
+
+    def start(self) -> None:
+        if self._task is not None and not self._task.done():
+            return  # déjà actif (partagé entre bots en mode multi-bot)
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._beat = time.monotonic()
+        self._task = asyncio.create_task(self._heartbeat())
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._task:
+            self._task.cancel()
+
+    async def _heartbeat(self) -> None:
+        while True:
+            t0 = time.monotonic()
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = max(0.0, now - t0 - self.interval)
+            self._beat = now
+            self.samples.append((now, lag))
+            _LOOP_LAG.observe(lag)
+
+    def _current_task_name(self) -> str:
+        try:
+            task = asyncio.tasks._current_tasks.get(self._loop)
+            if task is not None:
+                coro = task.get_coro()
+                return f"{task.get_name()} ({getattr(coro, '__qualname__', coro)})"
+        except Exception:
+            pass
+        return "(callback hors tâche)"
+
+    def _watch(self) -> None:
+        stall = None
+        while not self._stop.wait(self.interval / 2):
+            stale = time.monotonic() - self._beat - self.interval
+            if stale > self.threshold:
+                if stall is None:
+                    frame = sys._current_frames().get(self._loop_thread_id)
+                    frames = traceback.extract_stack(frame)[-25:] if frame else []
+                    where = f"{os.path.basename(frames[-1].filename)}:{frames[-1].lineno} in {frames[-1].name}" if frames else "?"
+                    stall = {
+                        "ts": time.time(), "duration": stale, "task": self._current_task_name(),
+                        "where": where, "stack": "".join(traceback.format_list(frames)),
+                    }
+                    self.stalls.append(stall)
+                    _LOOP_STALLS.inc()
+                    _log.warning("Boucle bloquée depuis %.2fs dans %s", stale, stall["task"], extra=_log_fields(stack=stall["stack"]))
+                else:
+                    stall["duration"] = stale
+            elif stall is not None:
+                stall = None
+
+    def lag_summary(self) -> dict:
+        lags = sorted(lag for _, lag in self.samples)
+        if not lags:
+            return {"p50": 0.0, "p99": 0.0, "max": 0.0}
+        pick = lambda q: lags[min(len(lags) - 1, int(q * len(lags)))]
+        return {"p50": pick(0.5), "p99": pick(0.99), "max": lags[-1]}
+
+_WATCHDOG = _LoopWatchdog()
+_PromGauge("bot_loop_lag_max_seconds", "Retard maximal de la boucle sur la dernière minute", lambda: _WATCHDOG.lag_summary()["max"])
+
+# --------- Mode surcharge (délestage progressif) ---------
+# Niveau déduit des updates en attente (file + en cours) et du retard de boucle sur 5 s:
+# 1 = accueil en texte seul, 2 = écritures de statistiques différées (pseudos, clics, séries,
+# activité), 3 = /start répétés limités par utilisateur. Montée immédiate, descente d'un niveau
+# après OVERLOAD_COOLDOWN secondes de calme.
+def _thresholds(name: str, default: str) -> tuple[float, ...]:
+    return tuple(float(x) for x in os.getenv(name, default).split(",") if x.strip())
+
+_OVERLOAD_STAGES = ("normal", "text_welcome", "defer_writes", "limit_starts")
+_OVERLOAD_SHED = _PromCounter("bot_overload_shed_total", "Travail évité en mode surcharge, par action", ("action",))
+_OVERLOAD_TRANSITIONS = _PromCounter("bot_overload_transitions_total", "Changements de niveau de surcharge, par niveau atteint", ("stage",))
+
+class _OverloadController:
+    """Niveau de délestage courant (0 = normal) et fenêtre anti-répétition des /start (niveau 3)."""
+
+    def __init__(self, queue_thresholds: tuple, lag_thresholds: tuple, cooldown: float, start_window: float):
+        self.queue_thresholds = queue_thresholds
+        self.lag_thresholds = lag_thresholds
+        self.cooldown = cooldown
+        self.start_window = start_window
+        self.stage = 0
+        self.since = time.monotonic()
+        self._calm_since: float | None = None
+        self._last_start: dict[int, float] = {}
+
+    def level(self, backlog: int, lag: float) -> int:
+        by_queue = sum(1 for t in self.queue_thresholds if backlog >= t)
+        by_lag = sum(1 for t in self.lag_thresholds if lag >= t)
+        return min(len(_OVERLOAD_STAGES) - 1, max(by_queue, by_lag))
+
+    def evaluate(self, backlog: int, lag: float, now: float) -> None:
+        target = self.level(backlog, lag)
+        if target > self.stage:
+            self._set(target, backlog, lag, now)
+        elif target < self.stage:
+            if self._calm_since is None:
+                self._calm_since = now
+            elif now - self._calm_since >= self.cooldown:
+                self._set(self.stage - 1, backlog, lag, now)
+        else:
+            self._calm_since = None
+
+    def _set(self, stage: int, backlog: int, lag: float, now: float) -> None:
+        _log.warning("Surcharge: niveau %d (%s) -> %d (%s), %d updates en attente, retard boucle %.0f ms",
+                     self.stage, _OVERLOAD_STAGES[self.stage], stage, _OVERLOAD_STAGES[stage], backlog, lag * 1000)
+        _OVERLOAD_TRANSITIONS.inc(_OVERLOAD_STAGES[stage])
+        self.stage = stage
+        self.since = now
+        self._calm_since = now if stage else None
+        if stage < 3:
+            self._last_start.clear()
+
+    def allow_start(self, user_id: int, now: float) -> bool:
+        """Niveau 3: un /start par utilisateur et par fenêtre; les suivants sont ignorés."""
+        last = self._last_start.get(user_id)
+        if last is not None and now - last < self.start_window:
+            return False
+        self._last_start[user_id] = now
+        return True
+
+    def prune(self, now: float) -> None:
+        if self._last_start:
+            self._last_start = {u: t for u, t in self._last_start.items() if now - t < self.start_window}
+
+    async def run(self, app: Application, interval: float = 0.5) -> None:
+        """Tâche de fond: relève les signaux et ajuste le niveau."""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                now = time.monotonic()
+                backlog = _UPDATE_PROCESSOR.pending + app.update_queue.qsize()
+                lag = max((l for t, l in _WATCHDOG.samples if now - t <= 5.0), default=0.0)
+                self.evaluate(backlog, lag, now)
+                self.prune(now)
+            except Exception:
+                _log.exception("surcharge")
+
+_OVERLOAD = _OverloadController(
+    _thresholds("OVERLOAD_QUEUE", "300,1000,3000"),
+    _thresholds("OVERLOAD_LAG", "0.3,0.8,1.5"),
+    float(os.getenv("OVERLOAD_COOLDOWN", "15")),
+    float(os.getenv("OVERLOAD_START_WINDOW", "60")),
+)
+_PromGauge("bot_overload_stage", "Niveau de délestage (0 normal, 1 accueil texte, 2 écritures différées, 3 /start limités)", lambda: _OVERLOAD.stage)
+
+# --------- Anti-flood par utilisateur (seaux à jetons) ---------
+# Un seau par classe d'action (capacité, jetons/s), vérifié avant tout handler (groupe -1).
+# Les seaux vivent dans un LRU borné à FLOOD_MAX_USERS utilisateurs: un utilisateur évincé
+# repart avec des seaux pleins, la mémoire reste constante quel que soit le nombre d'utilisateurs.
+def _flood_rule(name: str, default: str) -> tuple[float, float]:
+    burst, rate = (float(x) for x in os.getenv(name, default).split(","))
+    return burst, rate
+
+_FLOOD_CLASSES = ("start", "callback", "message")
+_FLOOD_RULES = (_flood_rule("FLOOD_START", "3,0.05"), _flood_rule("FLOOD_CALLBACK", "10,2"), _flood_rule("FLOOD_MESSAGE", "5,1"))
+_FLOOD_ANSWER_CACHE = int(os.getenv("FLOOD_ANSWER_CACHE", "5"))  # s de cache client de la réponse au clic refusé
+_FLOOD_LIMITED = _PromCounter("bot_flood_limited_total", "Updates refusées par l'anti-flood, par classe d'action", ("action",))
+
+class _FloodLimiter:
+    """Seaux à jetons par utilisateur: [dernier passage, jetons classe 0, 1, 2] dans un OrderedDict LRU."""
+
+    def __init__(self, rules: tuple, max_users: int):
+        self.rules = rules
+        self.max_users = max_users
+        self._buckets: OrderedDict[int, list[float]] = OrderedDict()
+
+    def allow(self, user_id: int, cls: int, now: float) -> bool:
+        b = self._buckets.get(user_id)
+        if b is None:
+            b = [now, *(burst for burst, _ in self.rules)]
+            self._buckets[user_id] = b
+            if len(self._buckets) > self.max_users:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(user_id)
+            elapsed = now - b[0]
+            b[0] = now
+            for i, (burst, rate) in enumerate(self.rules, 1):
+                b[i] = min(burst, b[i] + elapsed * rate)
+        if b[cls + 1] < 1.0:
+            return False
+        b[cls + 1] -= 1.0
+        return True
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+_FLOOD = _FloodLimiter(_FLOOD_RULES, int(os.getenv("FLOOD_MAX_USERS", "100000")))
+_PromGauge("bot_flood_tracked_users", "Utilisateurs suivis par l'anti-flood (LRU borné)", lambda: len(_FLOOD))
+
+def _flood_class(update: Update) -> int | None:
+    """Classe d'action d'une update (index dans _FLOOD_CLASSES); None si non limitée."""
+    if update.callback_query is not None:
+        return 1
+    msg = update.message
+    if msg is None or msg.chat.type != "private":
+        return None
+    return 0 if (msg.text or "").startswith("/start") else 2
+
+async def _flood_guard(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Groupe -1: arrête le traitement des updates au-delà du seau de l'utilisateur (admins exclus)."""
+    user = update.effective_user
+    if user is None:
+        return
+    cls = _flood_class(update)
+    if cls is None or _FLOOD.allow(user.id, cls, time.monotonic()):
+        return
+    if user.id in ADMIN_IDS:  # tenu à jour par _config_view; pas de relecture de config ici
+        return
+    _FLOOD_LIMITED.inc(_FLOOD_CLASSES[cls])
+    if cls == 1:
+        # Réponse immédiate, mise en cache côté client: les clics répétés n'arrivent plus au bot
+        try:
+            await update.callback_query.answer("⏳ Doucement…", cache_time=_FLOOD_ANSWER_CACHE)
+        except Exception:
+            pass
+    raise ApplicationHandlerStop
+
+def _diagnostics_text() -> str:
+    lag = _WATCHDOG.lag_summary()
+    g = _update_gauges(_APPLICATION)
+    lines = [
+        "🩺 Diagnostics",
+        "",
+        f"⏱ Retard boucle (1 min): p50 {lag['p50'] * 1000:.1f} ms • p99 {lag['p99'] * 1000:.1f} ms • max {lag['max'] * 1000:.0f} ms",
+        f"🧱 Blocages > {_WATCHDOG.threshold * 1000:.0f} ms: {int(sum(_LOOP_STALLS.values.values()))}",
+        f"⚙️ Updates: {g['in_flight']} en cours, {g['waiting']} en attente, file {g['queue_depth']}",
+        f"🚦 Surcharge: niveau {_OVERLOAD.stage} ({_OVERLOAD_STAGES[_OVERLOAD.stage]}) depuis {time.monotonic() - _OVERLOAD.since:.0f}s",
+    ]
+    recent = list(_WATCHDOG.stalls)[-4:]
+    if recent:
+        lines += ["", "Derniers blocages:"]
+        for st in reversed(recent):
+            lines.append(f"• {time.strftime('%H:%M:%S', time.localtime(st['ts']))} {st['duration']:.2f}s — {st['task'][:60]}\n  {st['where'][:120]}")
+    return "\n".join(lines)[:1024]
+
+def _diagnostics_report() -> bytes:
+    """Rapport complet (piles des blocages) envoyé en document depuis l'écran Diagnostics."""
+    out = [_diagnostics_text(), ""]
+    for st in reversed(_WATCHDOG.stalls):
+        out.append(f"=== {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(st['ts']))} — {st['duration']:.3f}s — {st['task']}")
+        out.append(st["stack"])
+    return "\n".join(out).encode("utf-8")
+
+# --------- Profilage à la demande (échantillonnage) ---------
+_PROFILE_HZ = 100
+_PROFILE_MAX_SECONDS = 120
+_PROFILE_TASK_INTERVAL = 0.05
+_PROFILER_RUNNING = False
+
+class _SamplingProfiler:
+    """Profileur par échantillonnage, sans instrumentation: le bot continue de servir.
+    - CPU: un thread relève sys._current_frames() de tous les threads à _PROFILE_HZ;
+    - asyncio: une tâche de la boucle parcourt la chaîne cr_await de chaque tâche (où elle attend).
+    Sortie au format « collapsed stacks » (une pile par ligne + compte), lisible par flamegraph.pl,
+    speedscope ou inferno.
+    """
+
+    def __init__(self, seconds: float, hz: int = _PROFILE_HZ):
+        self.seconds = seconds
+        self.hz = hz
+        self.cpu: dict[str, int] = {}
+        self.tasks: dict[str, int] = {}
+        self.cpu_samples = 0
+        self.task_samples = 0
+        self._labels: dict = {}
+
+    def _label(self, code) -> str:
+        lab = self._labels.get(code)
+        if lab is None:
+            lab = self._labels[code] = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+        return lab
+
+    def _sample_threads(self, stop: threading.Event) -> None:
+        me = threading.get_ident()
+        period = 1.0 / self.hz
+        next_t = time.perf_counter()
+        while not stop.is_set():
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for tid, frame in sys._current_frames().items():
+                if tid == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(self._label(frame.f_code))
+                    frame = frame.f_back
+                stack.append(names.get(tid, str(tid)))
+                key = ";".join(reversed(stack))
+                self.cpu[key] = self.cpu.get(key, 0) + 1
+            self.cpu_samples += 1
+            next_t += period
+            delay = next_t - time.perf_counter()
+            if delay > 0:
+                stop.wait(delay)
+            else:
+                next_t = time.perf_counter()  # en retard: ne pas rattraper en rafale
+
+    def _sample_tasks(self) -> None:
+        current = asyncio.current_task()
+        for task in asyncio.all_tasks():
+            if task is current or task.done():
+                continue
+            stack = ["asyncio"]
+            obj = task.get_coro()
+            depth = 0
+            while obj is not None and depth < 64:
+                code = getattr(obj, "cr_code", None) or getattr(obj, "gi_code", None) or getattr(obj, "ag_code", None)
+                if code is None:
+                    stack.append(type(obj).__name__)  # Future, Event... : l'objet réellement attendu
+                    break
+                stack.append(self._label(code))
+                obj = getattr(obj, "cr_await", None) or getattr(obj, "gi_yieldfrom", None) or getattr(obj, "ag_await", None)
+                depth += 1
+            key = ";".join(stack)
+            self.tasks[key] = self.tasks.get(key, 0) + 1
+        self.task_samples += 1
+
+    async def run(self) -> None:
+        stop = threading.Event()
+        thread = threading.Thread(target=self._sample_threads, args=(stop,), name="profiler", daemon=True)
+        thread.start()
+        end = time.monotonic() + self.seconds
+        try:
+            while time.monotonic() < end:
+                await asyncio.sleep(_PROFILE_TASK_INTERVAL)
+                self._sample_tasks()
+        finally:
+            stop.set()
+            await asyncio.to_thread(thread.join)
+
+    @staticmethod
+    def collapsed(stacks: dict[str, int]) -> bytes:
+        return "".join(f"{k} {v}\n" for k, v in sorted(stacks.items(), key=lambda kv: -kv[1])).encode("utf-8")
+
+    def top_self(self, n: int = 5) -> list[tuple[str, int]]:
+        """Fonctions les plus souvent en tête de pile dans le thread de la boucle (temps propre)."""
+        loop_thread = threading.current_thread().name
+        acc: dict[str, int] = {}
+        for key, count in self.cpu.items():
+            if key.startswith(loop_thread + ";"):
+                leaf = key.rsplit(";", 1)[-1]
+                if leaf.startswith("select (selectors.py"):
+                    continue  # boucle en attente d'E/S: inactive, pas du CPU
+                acc[leaf] = acc.get(leaf, 0) + count
+        return sorted(acc.items(), key=lambda kv: -kv[1])[:n]
+
+async def _start_profile(update: Update, context: ContextTypes.DEFAULT_TYPE, chat_id: int, seconds: float) -> None:
+    """Lance _profile_background; le drapeau est pris ici, avant la tâche (deux appuis rapprochés)."""
+    global _PROFILER_RUNNING
+    if _PROFILER_RUNNING:
+        try:
+            await context.bot.send_message(chat_id=chat_id, text="Un profilage est déjà en cours…")
+        except Exception:
+            pass
+        return
+    _PROFILER_RUNNING = True
+    context.application.create_task(_profile_background(context, chat_id, seconds), update=update, name="profile")
+
+async def _profile_background(context: ContextTypes.DEFAULT_TYPE, chat_id: int, seconds: float) -> None:
+    """Tâche de fond: profil de `seconds` secondes puis envoi des deux fichiers en documents."""
+    global _PROFILER_RUNNING
+    try:
+        prof = _SamplingProfiler(seconds)
+        await context.bot.send_message(chat_id=chat_id, text=f"🔬 Profilage lancé pour {seconds:.0f}s ({prof.hz} Hz)…")
+        await prof.run()
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        cpu, tasks = await asyncio.to_thread(lambda: (prof.collapsed(prof.cpu), prof.collapsed(prof.tasks)))
+        top = "\n".join(f"• {n * 100 // max(1, prof.cpu_samples)}% {name}" for name, n in prof.top_self()) or "• (boucle inactive)"
+        await context.bot.send_document(
+            chat_id=chat_id,
+            document=InputFile(BytesIO(cpu), filename=f"profile-cpu-{stamp}.folded"),
+            caption=f"🔬 CPU: {prof.cpu_samples} échantillons / {seconds:.0f}s, tous threads\nTemps propre (thread de la boucle):\n{top}"[:1024],
+        )
+        await context.bot.send_document(
+            chat_id=chat_id,
+            document=InputFile(BytesIO(tasks), filename=f"profile-asyncio-{stamp}.folded"),
+            caption=f"🔬 Tâches asyncio: {prof.task_samples} relevés (où chaque tâche attend)",
+        )
+    except Exception:
+        _log.exception("_profile_background")
+    finally:
+        _PROFILER_RUNNING = False
+
+async def profile_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """/profile [secondes]: profilage à chaud réservé aux administrateurs (30s par défaut)."""
+    user_id = update.effective_user.id if update.effective_user else 0
+    if not _is_admin(user_id) or not update.message:
+        return
+    try:
+        seconds = float(context.args[0]) if context.args else 30.0
+    except ValueError:
+        seconds = 30.0
+    seconds = min(_PROFILE_MAX_SECONDS, max(5.0, seconds))
+    await _start_profile(update, context, update.message.chat_id, seconds)
+
+# --------- Mode webhook (serveur HTTP asyncio intégré) ---------
+_HTTP_REASONS = {200: "OK", 400: "Bad Request", 403: "Forbidden", 404: "Not Found", 405: "Method Not Allowed", 413: "Payload Too Large", 503: "Service Unavailable"}
+
+class _HttpServer:
+    """Serveur HTTP/1.1 minimal (keep-alive) sur asyncio; les sous-classes implémentent _dispatch,
+    qui retourne un statut ou (statut, corps), directement ou via une coroutine.
+    """
+
+    MAX_BODY = 1 << 20
+    CONTENT_TYPE = "text/plain; charset=utf-8"
+
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self.server: asyncio.base_events.Server | None = None
+
+    async def start(self) -> None:
+        self.server = await asyncio.start_server(self._handle, self.host, self.port)
+
+    async def stop(self) -> None:
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+
+    def _respond(self, writer, status: int, body: bytes = b"", keep_alive: bool = True) -> None:
+        head = (
+            f"HTTP/1.1 {status} {_HTTP_REASONS.get(status, 'OK')}\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Content-Type: {self.CONTENT_TYPE}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+        )
+        writer.write(head.encode("latin-1") + body)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                try:
+                    raw_head = await reader.readuntil(b"\r\n\r\n")
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+                    return
+                lines = raw_head.decode("latin-1").split("\r\n")
+                try:
+                    method, target, _ = lines[0].split(" ", 2)
+                except ValueError:
+                    self._respond(writer, 400, keep_alive=False)
+                    return
+                headers = {}
+                for line in lines[1:]:
+                    if ":" in line:
+                        k, v = line.split(":", 1)
+                        headers[k.strip().lower()] = v.strip()
+                keep_alive = headers.get("connection", "").lower() != "close"
+                length = int(headers.get("content-length") or 0)
+                if length > self.MAX_BODY:
+                    self._respond(writer, 413, keep_alive=False)
+                    return
+                body = await reader.readexactly(length) if length else b""
+                result = self._dispatch(method, target.split("?", 1)[0], headers, body)
+                if asyncio.iscoroutine(result):
+                    result = await result
+                status, payload = result if isinstance(result, tuple) else (result, b"ok" if result == 200 else b"")
+                self._respond(writer, status, payload, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    return
+        except Exception:
+            _log.exception("%s", type(self).__name__)
+        finally:
+            try:
+                writer.close()
+            except Exception:
+                pass
+
+    def _dispatch(self, method: str, path: str, headers: dict, body: bytes):
+        return 404
+
+class _WebhookServer(_HttpServer):
+    """Reçoit les updates Telegram.
+    Vérifie X-Telegram-Bot-Api-Secret-Token, désérialise l'update et la dépose dans
+    application.update_queue sans attendre son traitement: la réponse part immédiatement.
+    """
+
+    def __init__(self, application: Application, path: str, secret: str, host: str, port: int):
+        super().__init__(host, port)
+        self.application = application
+        self.path = path
+        self.secret = secret.encode("utf-8")
+        self.received = 0
+        self.rejected = 0
+
+    def _dispatch(self, method: str, path: str, headers: dict, body: bytes) -> int:
+        if path == "/healthz" and method == "GET":
+            return 200
+        if path != self.path:
+            return 404
+        if method != "POST":
+            return 405
+        token = headers.get("x-telegram-bot-api-secret-token", "").encode("utf-8")
+        if not hmac.compare_digest(token, self.secret):
+            self.rejected += 1
+            return 403
+        try:
+            update = Update.de_json(json.loads(body), self.application.bot)
+        except Exception:
+            return 400
+        if update is None:
+            return 400
+        # File non bornée: put_nowait ne bloque jamais la réponse HTTP
+        self.application.update_queue.put_nowait(update)
+        self.received += 1
+        return 200
+
+class _MetricsServer(_HttpServer):
+    """Expose GET /metrics (format texte Prometheus) et /healthz, à garder sur une interface locale."""
+
+    CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+    def _dispatch(self, method: str, path: str, headers: dict, body: bytes):
+        if method != "GET":
+            return 405
+        if path == "/metrics":
+            return 200, _render_metrics().encode("utf-8")
+        if path == "/healthz":
+            return 200
+        return 404
+
+async def _run_webhook(application: Application) -> None:
+    """Cycle de vie de l'Application en mode webhook (équivalent de run_polling)."""
+    if not WEBHOOK_SECRET:
+        raise RuntimeError("WEBHOOK_SECRET (ou TELEGRAM_WEBHOOK_SECRET) est requis en mode webhook.")
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except (NotImplementedError, RuntimeError):
+            pass
+    server = _WebhookServer(application, WEBHOOK_PATH, WEBHOOK_SECRET, WEBHOOK_LISTEN, WEBHOOK_PORT)
+    await application.initialize()
+    try:
+        if application.post_init:
+            await application.post_init(application)
+        await server.start()
+        if WEBHOOK_URL:
+            await application.bot.set_webhook(
+                url=f"{WEBHOOK_URL}{WEBHOOK_PATH}",
+                secret_token=WEBHOOK_SECRET,
+                allowed_updates=Update.ALL_TYPES,
+            )
+        await application.start()
+        _log.info("Webhook à l'écoute sur http://%s:%s%s", WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH)
+        await stop_event.wait()
+    finally:
+        await server.stop()
+        if application.running:
+            await application.stop()
+            if application.post_stop:
+                await application.post_stop(application)
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
+
+# --------- Multi-worker: front webhook + processus workers ---------
+# Le front vérifie le secret, lit le chat_id et transmet l'update brute au worker chat_id % N
+# par un socket Unix (trames longueur + JSON, une connexion par worker: l'ordre par chat est
+# conservé). Les workers partagent les fichiers sous verrou (_shared_lock) et gardent leurs
+# données par chat (activité, séries) dans des fichiers .w<i>.
+_FRONT_FORWARDED = _PromCounter("bot_front_forwarded_total", "Updates transmises par le front, par worker", ("worker",))
+_FRONT_UNAVAILABLE = _PromCounter("bot_front_unavailable_total", "Updates refusées (503): worker non connecté ou sans acquittement", ("worker",))
+
+def _worker_socket(index: int) -> str:
+    return os.path.join(_BASE_DIR, f".worker-{index}.sock")
+
+def _update_chat_id(data: dict) -> int:
+    """Clé de répartition d'une update brute: chat_id, à défaut l'expéditeur, sinon 0."""
+    for key, obj in data.items():
+        if not isinstance(obj, dict):
+            continue
+        chat = obj.get("chat") or (obj.get("message") or {}).get("chat")
+        if isinstance(chat, dict) and "id" in chat:
+            return int(chat["id"])
+        user = obj.get("from") or obj.get("user")
+        if isinstance(user, dict) and "id" in user:
+            return int(user["id"])
+    return 0
+
+_FRONT_ACK_TIMEOUT = 5.0  # s d'attente de l'acquittement du worker avant de répondre 503
+
+class _WorkerLink:
+    """Connexion front -> worker: trames [taille sur 4 octets][update JSON]; le worker renvoie un
+    octet par trame, dans l'ordre, une fois l'update déposée dans sa file.
+    """
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+        self.pending: deque = deque()  # futures des trames envoyées, pas encore acquittées
+
+    def is_closing(self) -> bool:
+        return self.writer.is_closing()
+
+    async def send(self, body: bytes) -> bool:
+        """True une fois l'update acquittée par le worker; False si la connexion tombe ou tarde."""
+        fut = asyncio.get_running_loop().create_future()
+        self.pending.append(fut)
+        self.writer.write(len(body).to_bytes(4, "big") + body)
+        try:
+            await self.writer.drain()  # contre-pression: le tampon du socket est plein
+            return await asyncio.wait_for(fut, _FRONT_ACK_TIMEOUT)
+        except (ConnectionError, asyncio.TimeoutError):
+            return False
+
+    async def read_acks(self) -> None:
+        """Lit les acquittements jusqu'à la fin de la connexion; les trames restantes échouent."""
+        try:
+            while data := await self.reader.read(4096):
+                for _ in range(len(data)):
+                    if not self.pending:
+                        break
+                    fut = self.pending.popleft()
+                    if not fut.done():
+                        fut.set_result(True)
+        finally:
+            while self.pending:
+                fut = self.pending.popleft()
+                if not fut.done():
+                    fut.set_result(False)
+            self.writer.close()
+
+class _ShardRouter(_HttpServer):
+    """Front webhook: valide le secret puis transmet l'update au worker de son chat.
+    200 seulement après l'acquittement du worker; 503 s'il n'est pas joignable ou ne répond pas:
+    Telegram renverra l'update plus tard.
+    """
+
+    def __init__(self, path: str, secret: str, host: str, port: int, workers: int):
+        super().__init__(host, port)
+        self.path = path
+        self.secret = secret.encode("utf-8")
+        self.links: list[_WorkerLink | None] = [None] * workers
+
+    async def _dispatch(self, method: str, path: str, headers: dict, body: bytes) -> int:
+        if path == "/healthz" and method == "GET":
+            return 200 if all(self.links) else 503
+        if path != self.path:
+            return 404
+        if method != "POST":
+            return 405
+        token = headers.get("x-telegram-bot-api-secret-token", "").encode("utf-8")
+        if not hmac.compare_digest(token, self.secret):
+            return 403
+        try:
+            shard = _update_chat_id(json.loads(body)) % len(self.links)
+        except Exception:
+            return 400
+        link = self.links[shard]
+        if link is None or link.is_closing() or not await link.send(body):
+            _FRONT_UNAVAILABLE.inc(str(shard))
+            return 503
+        _FRONT_FORWARDED.inc(str(shard))
+        return 200
+
+async def _run_front() -> None:
+    """Processus front: lance et supervise BOT_WORKERS workers, puis route les updates."""
+    if not WEBHOOK_SECRET:
+        raise RuntimeError("WEBHOOK_SECRET (ou TELEGRAM_WEBHOOK_SECRET) est requis en mode webhook.")
+    if fcntl is None:
+        raise RuntimeError("Le mode multi-worker nécessite fcntl (Linux).")
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except (NotImplementedError, RuntimeError):
+            pass
+    router = _ShardRouter(WEBHOOK_PATH, WEBHOOK_SECRET, WEBHOOK_LISTEN, WEBHOOK_PORT, BOT_WORKERS)
+    procs: list = [None] * BOT_WORKERS
+
+    async def link(i: int, proc) -> None:
+        # Connexion au socket du worker (réessayée jusqu'à ce qu'il écoute); EOF = worker parti
+        while proc.returncode is None:
+            try:
+                reader, writer = await asyncio.open_unix_connection(_worker_socket(i))
+            except OSError:
+                await asyncio.sleep(0.2)
+                continue
+            worker_link = router.links[i] = _WorkerLink(reader, writer)
+            try:
+                await worker_link.read_acks()
+            finally:
+                router.links[i] = None
+
+    async def supervise(i: int) -> None:
+        env = {**os.environ, "BOT_WORKER_INDEX": str(i)}
+        if METRICS_PORT:
+            env["METRICS_PORT"] = str(METRICS_PORT + 1 + i)
+        while not stop_event.is_set():
+            proc = await asyncio.create_subprocess_exec(sys.executable, os.path.abspath(__file__), env=env)
+            procs[i] = proc
+            link_task = asyncio.create_task(link(i, proc))
+            code = await proc.wait()
+            link_task.cancel()
+            router.links[i] = None
+            if not stop_event.is_set():
+                _log.error("Worker %d arrêté (code %s), redémarrage", i, code)
+                await asyncio.sleep(1.0)
+
+    supervisors = [asyncio.create_task(supervise(i)) for i in range(BOT_WORKERS)]
+    metrics_server = None
+    try:
+        await router.start()
+        if METRICS_PORT:
+            metrics_server = _MetricsServer(METRICS_LISTEN, METRICS_PORT)
+            await metrics_server.start()
+        deadline = time.monotonic() + 60
+        while not all(router.links) and time.monotonic() < deadline and not stop_event.is_set():
+            await asyncio.sleep(0.1)
+        if WEBHOOK_URL:
+            async with httpx.AsyncClient(timeout=10.0) as client:
+                r = await client.post(f"{TELEGRAM_API_BASE_URL}/bot{TOKEN}/setWebhook", data={
+                    "url": f"{WEBHOOK_URL}{WEBHOOK_PATH}",
+                    "secret_token": WEBHOOK_SECRET,
+                    "allowed_updates": json.dumps(Update.ALL_TYPES),
+                })
+                if not r.json().get("ok"):
+                    _log.error("setWebhook refusé: %s", r.text[:200])
+        _log.info("Front webhook sur http://%s:%s%s, %d/%d workers connectés", WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH,
+                  sum(1 for w in router.links if w), BOT_WORKERS)
+        await stop_event.wait()
+    finally:
+        await router.stop()
+        if metrics_server:
+            await metrics_server.stop()
+        for proc in procs:
+            if proc is not None and proc.returncode is None:
+                proc.send_signal(signal.SIGTERM)
+        try:
+            await asyncio.wait_for(asyncio.gather(*(p.wait() for p in procs if p is not None)), 20)
+        except asyncio.TimeoutError:
+            for proc in procs:
+                if proc is not None and proc.returncode is None:
+                    proc.kill()
+        for task in supervisors:
+            task.cancel()
+
+async def _run_worker(application: Application) -> None:
+    """Processus worker: reçoit ses updates du front par socket Unix (pas de HTTP ni de polling)."""
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except (NotImplementedError, RuntimeError):
+            pass
+
+    async def inbox(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                size = int.from_bytes(await reader.readexactly(4), "big")
+                body = await reader.readexactly(size)
+                try:
+                    update = Update.de_json(json.loads(body), application.bot)
+                except Exception:
+                    update = None
+                    _log.warning("Update illisible reçue du front (%d octets)", size)
+                if update is not None:
+                    application.update_queue.put_nowait(update)
+                # Acquittement (le front ne répond 200 à Telegram qu'après)
+                writer.write(b"\x01")
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+    path = _worker_socket(_WORKER_INDEX)
+    server = None
+    await application.initialize()
+    try:
+        if application.post_init:
+            await application.post_init(application)
+        await application.start()
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(path)  # socket d'une instance précédente
+        server = await asyncio.start_unix_server(inbox, path)
+        _log.info("Worker %d/%d prêt", _WORKER_INDEX, BOT_WORKERS)
+        await stop_event.wait()
+    finally:
+        if server is not None:
+            server.close()
+            await server.wait_closed()
+        if application.running:
+            await application.stop()
+            if application.post_stop:
+                await application.post_stop(application)
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
+
+# --------- Démarrage ---------
+_STARTUP_DEADLINE = float(os.getenv("STARTUP_DEADLINE", "3"))  # s accordées au préchauffage avant le polling
+_STARTUP_T0 = 0.0
+_STARTUP_PHASES: dict[str, float] = {}
+
+_PromGauge("bot_startup_phase_seconds", "Durée des phases du dernier démarrage", lambda: dict(_STARTUP_PHASES), ("phase",))
+
+async def _startup_phase(name: str, coro) -> None:
+    """Exécute une tâche de post_init et note sa durée (erreur journalisée, jamais bloquante)."""
+    t0 = time.perf_counter()
+    try:
+        await coro
+    except Exception as e:
+        _log.warning("Démarrage: %s en échec: %s: %s", name, type(e).__name__, e)
+    finally:
+        _STARTUP_PHASES[name] = round(time.perf_counter() - t0, 4)
+
+# Arriéré au démarrage: updates reçues pendant l'arrêt, lues avant le polling puis triées.
+# replay: tout rejouer (comportement de Telegram); coalesce: un seul /start ou clic par utilisateur
+# (le dernier) et abandon des messages plus vieux que BACKLOG_MAX_AGE; drop: ne garder que les
+# saisies admin et les posts de canal. Les admins ne sont jamais fusionnés ni abandonnés.
+_BACKLOG_MODE = os.getenv("BACKLOG_MODE", "coalesce").strip().lower()
+_BACKLOG_MAX_AGE = float(os.getenv("BACKLOG_MAX_AGE", "600"))
+_BACKLOG_UPDATES = _PromCounter("bot_backlog_updates_total", "Updates en attente au démarrage, par issue du tri", ("outcome",))
+
+def _triage_backlog(updates: list, now: float) -> tuple[list, dict[str, int]]:
+    """Trie l'arriéré (ordre conservé): renvoie les updates à traiter et le décompte par issue."""
+    counts = {"kept": 0, "coalesced": 0, "stale": 0, "dropped": 0}
+    last_press: dict[int, int] = {}  # utilisateur -> index de son dernier /start ou clic
+    verdicts: list[str] = []
+    admins = set(ADMIN_IDS)  # instantané unique (jusqu'à 10 000 updates à trier)
+    for i, upd in enumerate(updates):
+        user = upd.effective_user
+        msg = upd.message or upd.edited_message
+        if upd.channel_post or upd.edited_channel_post or (user is not None and user.id in admins):
+            verdicts.append("kept")
+            continue
+        if _BACKLOG_MODE == "drop":
+            verdicts.append("dropped")
+            continue
+        if msg is not None and msg.date is not None and now - msg.date.timestamp() > _BACKLOG_MAX_AGE:
+            verdicts.append("stale")
+            continue
+        is_press = upd.callback_query is not None or (msg is not None and (msg.text or "").split("@")[0].split(" ")[0] == "/start")
+        if is_press and user is not None:
+            prev = last_press.get(user.id)
+            if prev is not None:
+                verdicts[prev] = "coalesced"
+            last_press[user.id] = i
+        verdicts.append("kept")
+    for v in verdicts:
+        counts[v] += 1
+    return [u for u, v in zip(updates, verdicts) if v == "kept"], counts
+
+async def _drain_backlog(app: Application) -> None:
+    """Lit les updates en attente (acquittées au fur et à mesure), les trie et met les retenues en file."""
+    if _BACKLOG_MODE == "replay" or _WORKER_INDEX is not None:
+        return
+    if BOT_MODE == "webhook":
+        if not WEBHOOK_URL:
+            return  # webhook géré hors du bot: l'arriéré arrive par le webhook
+        await app.bot.delete_webhook(drop_pending_updates=False)  # redéclaré ensuite par _run_webhook
+    pending: list = []
+    offset = 0
+    while len(pending) < 10_000:
+        batch = await app.bot.get_updates(offset=offset, limit=100, timeout=0, allowed_updates=Update.ALL_TYPES)
+        if not batch:
+            break
+        pending.extend(batch)
+        offset = batch[-1].update_id + 1
+    if not pending:
+        return
+    if offset and len(pending) >= 10_000:
+        await app.bot.get_updates(offset=offset, limit=1, timeout=0)  # acquitter le dernier lot
+    kept, counts = _triage_backlog(pending, time.time())
+    for upd in kept:
+        app.update_queue.put_nowait(upd)
+    for outcome, n in counts.items():
+        if n:
+            _BACKLOG_UPDATES.inc(outcome, amount=n)
+    _log.info("Arriéré au démarrage: %d updates, %d traitées, %d fusionnées, %d trop anciennes, %d ignorées (mode %s)",
+              len(pending), counts["kept"], counts["coalesced"], counts["stale"], counts["dropped"], _BACKLOG_MODE,
+              extra=_log_fields(**{f"backlog_{k}": v for k, v in counts.items()}))
+
+def _build_application(clients: dict[str, httpx.AsyncClient] | None = None) -> Application:
+    """Construit l'Application (admins, cycle de vie, handlers). clients: pools HTTP partagés en multi-bot."""
     # Charger les admins depuis config.json
     try:
         cfg = _load_config()
+        # Verbosité choisie dans le panneau admin (prioritaire sur LOG_LEVEL)
+        if cfg.get("log_level"):
+            _set_log_level(cfg["log_level"])
+        if cfg.get("log_sample_rate") is not None:
+            _HOT_SAMPLER.rate = float(cfg["log_sample_rate"])
         cfg_ids = cfg.get("admin_ids", [])
         ADMIN_IDS.clear()
         if cfg_ids:
             ADMIN_IDS.extend(sorted(int(a) for a in cfg_ids if a))
-        print(f"Admins chargés depuis config.json: {ADMIN_IDS}")
+        _log.info("Admins chargés depuis config.json: %s", ADMIN_IDS)
         if not ADMIN_IDS:
-            print("⚠️ AUCUN ADMIN dans config.json ! Utilisez le bot pour ajouter un admin.")
+            _log.warning("AUCUN ADMIN dans config.json ! Utilisez le bot pour ajouter un admin.")
     except Exception as e:
-        print(f"Erreur chargement admins: {e}")
+        _log.error("Erreur chargement admins: %s", e)
 
     if not TOKEN:
         raise RuntimeError("La variable d’environnement TELEGRAM_BOT_TOKEN n’est pas définie.")
-    # Valider le token avant d’initialiser l’application (getMe)
-    try:
-        r = httpx.get(f"https://api.telegram.org/bot{TOKEN}/getMe", timeout=10)
-        r.raise_for_status()
-        data = r.json()
-        if not data.get("ok"):
-            raise RuntimeError(f"Token invalide: getMe ok=false: {data}")
-        bot_username = data.get("result", {}).get("username")
-        print(f"Bot connecté: @{bot_username}")
-    except Exception as e:
-        raise RuntimeError(f"Token rejeté par Telegram: {e}")
+    # Le token est validé une seule fois, par le getMe d'Application.initialize() (InvalidToken sinon)
+    _STARTUP_PHASES["config"] = round(time.perf_counter() - _STARTUP_T0, 4)
     async def _set_menu_button(app: Application):
         # Utiliser miniapp_url depuis config si présent; sinon ne rien définir
         try:
@@ -3475,18 +6376,73 @@ def main() -> None:
                     )
                 )
             except Exception as e:
-                print(f"Impossible de définir le bouton de menu WebApp: {e}")
+                _log.warning("Impossible de définir le bouton de menu WebApp: %s", e)
+
+    async def _post_init(app: Application):
+        global _APPLICATION
+        _APPLICATION = app
+        t_init = time.perf_counter()
+        _STARTUP_PHASES["initialize"] = round(t_init - _STARTUP_T0 - _STARTUP_PHASES.get("config", 0.0), 4)
+        _log.info("Bot connecté: @%s", app.bot.username)
+        # Copies mémoire des fichiers JSON chargées dans le thread d'E/S avant le premier update
+        await _startup_phase("files", _refresh_files())
+        # Arriéré trié avant que le polling (ou le webhook) ne reprenne
+        await _startup_phase("backlog", _drain_backlog(app))
+        # Préchauffage en parallèle sous délai: ce qui dépasse continue en tâche de fond sans retarder le polling
+        warmup = [
+            asyncio.create_task(_startup_phase("menu_button", _set_menu_button(app))),
+            asyncio.create_task(_startup_phase("welcome_media", _get_welcome_media())),
+            asyncio.create_task(_startup_phase("shop_cache", _warm_shop_cache())),
+        ]
+        _, pending = await asyncio.wait(warmup, timeout=_STARTUP_DEADLINE)
+        if pending:
+            _log.warning("Démarrage: %d tâche(s) de préchauffage au-delà de %.1fs, poursuivies en fond", len(pending), _STARTUP_DEADLINE)
+        # Écritures différées (utilisateurs, activité): tâche de fond unique
+        app.bot_data["_flush_task"] = asyncio.create_task(_flush_loop())
+        app.bot_data["_refresh_task"] = asyncio.create_task(_refresh_files_loop())
+        app.bot_data["_overload_task"] = asyncio.create_task(_OVERLOAD.run(app))
+        _WATCHDOG.start()
+        if METRICS_PORT:
+            try:
+                metrics_server = _MetricsServer(METRICS_LISTEN, METRICS_PORT)
+                await metrics_server.start()
+                app.bot_data["_metrics_server"] = metrics_server
+                _log.info("Métriques Prometheus sur http://%s:%s/metrics", METRICS_LISTEN, METRICS_PORT)
+            except OSError as e:
+                _log.error("Endpoint /metrics indisponible: %s", e)
+        _STARTUP_PHASES["post_init"] = round(time.perf_counter() - t_init, 4)
+        _STARTUP_PHASES["total"] = round(time.perf_counter() - _STARTUP_T0, 4)
+        _log.info("Démarrage en %.2fs", _STARTUP_PHASES["total"], extra=_log_fields(**{f"startup_{k}": v for k, v in _STARTUP_PHASES.items()}))
+
+    async def _post_shutdown(app: Application):
+        for key in ("_flush_task", "_refresh_task", "_overload_task"):
+            task = app.bot_data.pop(key, None)
+            if task:
+                task.cancel()
+        _WATCHDOG.stop()
+        if _RECORDER.enabled:
+            _RECORDER.close()
+        metrics_server = app.bot_data.pop("_metrics_server", None)
+        if metrics_server:
+            await metrics_server.stop()
+        try:
+            await _flush_all(force=True)
+        except Exception:
+            _log.exception("flush à l'arrêt")
 
     # Builder avec timeouts plus courts et pool plus large pour éviter les blocages
     application = (
         Application.builder()
         .token(TOKEN)
-        .connection_pool_size(512)
-        .connect_timeout(3.0)
-        .read_timeout(3.0)
-        .write_timeout(3.0)
-        .pool_timeout(0.5)
-        .post_init(_set_menu_button)
+        .base_url(f"{TELEGRAM_API_BASE_URL}/bot")
+        .base_file_url(f"{TELEGRAM_API_BASE_URL}/file/bot")
+        # Requêtes instrumentées (latence par méthode Bot API), pools séparés contrôle / médias / fichiers
+        .request(_RoutedRequest(clients))
+        .get_updates_request(_InstrumentedRequest(connection_pool_size=1, pool="updates"))
+        .concurrent_updates(_UPDATE_PROCESSOR)
+        .persistence(_SqlitePersistence(_STATE_DB_PATH, _STATE_TTL, _STATE_FLUSH_INTERVAL))
+        .post_init(_post_init)
+        .post_shutdown(_post_shutdown)
         .build()
     )
 
@@ -3494,19 +6450,22 @@ def main() -> None:
     async def on_error(update, context: ContextTypes.DEFAULT_TYPE):
         err = getattr(context, "error", None)
         try:
-            print(f"[ERROR] {err}")
+            _log.error("Erreur de handler: %s: %s", type(err).__name__, err, exc_info=err)
         except Exception:
             pass
     application.add_error_handler(on_error)
 
-    application.add_handler(CommandHandler("start", start))
-    application.add_handler(CommandHandler("admin", admin_command))
-    application.add_handler(CommandHandler("page", page_command))
+    # Anti-flood avant tout handler (ApplicationHandlerStop coupe les groupes suivants)
+    application.add_handler(TypeHandler(Update, _flood_guard), group=-1)
+    application.add_handler(CommandHandler("start", _timed("start")(start)))
+    application.add_handler(CommandHandler("admin", _timed("admin_command")(admin_command)))
+    application.add_handler(CommandHandler("page", _timed("page_command")(page_command)))
+    application.add_handler(CommandHandler("profile", _timed("profile_command")(profile_command)))
     # Handler spécifique pour capter /page dans les posts de canal (texte brut)
     application.add_handler(
         MessageHandler(
             filters.ChatType.CHANNEL & filters.Regex(r"^/page(?:@[A-Za-z0-9_]+)?(?:\s|$)"),
-            page_command,
+            _timed("page_command")(page_command),
         )
     )
     # Capter /page dans la légende d'un média publié dans le canal
@@ -3515,7 +6474,7 @@ def main() -> None:
             filters.ChatType.CHANNEL
             & (filters.PHOTO | filters.VIDEO | filters.ANIMATION | filters.Document.ALL)
             & filters.CaptionRegex(r"^/page(?:@[A-Za-z0-9_]+)?(?:\s|$)"),
-            page_command,
+            _timed("page_command")(page_command),
         )
     )
     # Inputs d'admin (édition textes, bans, logo, etc.)
@@ -3525,17 +6484,157 @@ def main() -> None:
             MessageHandler(
                 filters.User(list(allowed_ids))
                 & (filters.TEXT | filters.PHOTO | filters.VIDEO | filters.ANIMATION | filters.Document.ALL),
-                handle_admin_input,
+                _timed("handle_admin_input")(handle_admin_input),
             )
         )
     # Traiter d'abord le bouton de suppression globale (admin-only)
-    application.add_handler(CallbackQueryHandler(handle_delete, pattern="^delall:"))
+    application.add_handler(CallbackQueryHandler(_timed("handle_delete")(handle_delete), pattern="^delall:"))
     # Panneau d'administration
-    application.add_handler(CallbackQueryHandler(handle_admin_action, pattern="^adm_"))
+    application.add_handler(CallbackQueryHandler(_timed(route=_admin_route)(handle_admin_action), pattern="^adm_"))
     # Restreindre le handler de catégories aux clés prévues
-    application.add_handler(CallbackQueryHandler(handle_category, pattern="^(infos|contact|miniapp|back|nolink_.*|custom:.*)$"))
+    application.add_handler(CallbackQueryHandler(_timed("handle_category")(handle_category), pattern="^(infos|contact|miniapp|back|nolink_.*|custom:.*)$"))
+
+    return application
+
+
+# --------- Multi-bot (plusieurs jetons dans un processus) ---------
+# Chaque bot est une copie indépendante de ce module (globals, fichiers, admins, métriques),
+# chargée avec ses propres variables d'environnement. Sont partagés: boucle asyncio, pool HTTP
+# Bot API, thread d'E/S, cache catalogue, contexte de log et watchdog.
+def _load_tenants(path: str) -> list[dict]:
+    """tenants.json: [{"name": "lgdf", "token": "...", "data_dir": "/srv/lgdf", "env": {...}}, ...]"""
+    with open(path, "r", encoding="utf-8") as f:
+        tenants = json.load(f)
+    names = [t.get("name") for t in tenants]
+    if not tenants or not all(names) or len(set(names)) != len(names):
+        raise RuntimeError(f"{path}: noms de bots absents ou dupliqués")
+    return tenants
+
+def _load_tenant_module(tenant: dict):
+    """Importe une copie de bot.py avec l'environnement du bot (lu une seule fois, à l'import)."""
+    import importlib.util
+    name = tenant["name"]
+    overrides = {
+        **{k: str(v) for k, v in (tenant.get("env") or {}).items()},
+        "BOT_TENANT": name,
+        "TELEGRAM_BOT_TOKEN": tenant["token"],
+        "BOT_DATA_DIR": tenant["data_dir"],
+        "BOT_TENANTS_FILE": "",
+        "METRICS_PORT": "",
+    }
+    if RECORD_UPDATES_DIR:
+        overrides["RECORD_UPDATES_DIR"] = os.path.join(RECORD_UPDATES_DIR, name)
+    os.makedirs(tenant["data_dir"], exist_ok=True)
+    saved = {k: os.environ.get(k) for k in overrides}
+    os.environ.update(overrides)
+    try:
+        spec = importlib.util.spec_from_file_location(f"bot_tenant_{name}", os.path.abspath(__file__))
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[spec.name] = module
+        spec.loader.exec_module(module)
+    finally:
+        for k, v in saved.items():
+            if v is None:
+                os.environ.pop(k, None)
+            else:
+                os.environ[k] = v
+    module._IO_EXECUTOR = _IO_EXECUTOR
+    module._SHOP_CACHE = _SHOP_CACHE
+    module._LOG_CTX = _LOG_CTX
+    module._WATCHDOG = _WATCHDOG
+    return module
+
+async def _start_tenant(tenant: dict, clients: dict[str, httpx.AsyncClient]):
+    """Démarre un bot (tâche dédiée: son contexte de log porte le nom du bot)."""
+    _LOG_CTX.set({"tenant": tenant["name"]})
+    module = _load_tenant_module(tenant)
+    module._STARTUP_T0 = time.perf_counter()
+    app = module._build_application(clients=clients)
+    await app.initialize()
+    if app.post_init:
+        await app.post_init(app)
+    await app.updater.start_polling(allowed_updates=Update.ALL_TYPES)
+    await app.start()
+    _TENANT_REGISTRIES[tenant["name"]] = module._PROM_REGISTRY
+    return app
+
+async def _stop_tenant(name: str, app: Application) -> None:
+    try:
+        if app.updater and app.updater.running:
+            await app.updater.stop()
+        if app.running:
+            await app.stop()
+        await app.shutdown()
+        if app.post_shutdown:
+            await app.post_shutdown(app)
+    except Exception:
+        _log.exception("Arrêt du bot %s", name)
+
+async def _run_tenants(tenants: list[dict]) -> None:
+    """Héberge plusieurs bots (polling) dans la boucle courante; l'échec d'un bot n'arrête pas les autres."""
+    if BOT_MODE == "webhook":
+        raise RuntimeError("Le mode multi-bot (BOT_TENANTS_FILE) fonctionne en polling uniquement.")
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except (NotImplementedError, RuntimeError):
+            pass
+    pools = {kind: _tg_pool(kind) for kind in _TG_POOLS}
+    await asyncio.gather(*(p.initialize() for p in pools.values()))
+    clients = {kind: p._client for kind, p in pools.items()}
+    results = await asyncio.gather(*(asyncio.create_task(_start_tenant(t, clients)) for t in tenants), return_exceptions=True)
+    running = []
+    for tenant, result in zip(tenants, results):
+        if isinstance(result, BaseException):
+            _log.error("Bot %s non démarré: %s: %s", tenant["name"], type(result).__name__, result, exc_info=result)
+        else:
+            running.append((tenant["name"], result))
+    metrics_server = None
+    try:
+        if not running:
+            raise RuntimeError("Aucun bot n'a pu démarrer.")
+        _WATCHDOG.start()
+        if METRICS_PORT:
+            try:
+                metrics_server = _MetricsServer(METRICS_LISTEN, METRICS_PORT)
+                await metrics_server.start()
+            except OSError as e:
+                metrics_server = None
+                _log.error("Endpoint /metrics indisponible: %s", e)
+        _log.info("Multi-bot: %d/%d bot(s) démarré(s): %s", len(running), len(tenants), ", ".join(n for n, _ in running))
+        await stop_event.wait()
+    finally:
+        await asyncio.gather(*(_stop_tenant(name, app) for name, app in running))
+        if metrics_server:
+            await metrics_server.stop()
+        _WATCHDOG.stop()
+        await asyncio.gather(*(p.shutdown() for p in pools.values()))
+
 
-    print("Bot démarré. Appuyez sur Ctrl+C pour arrêter.")
+def main() -> None:
+    global _STARTUP_T0
+    _STARTUP_T0 = time.perf_counter()
+    _setup_logging()
+    if BOT_TENANTS_FILE:
+        asyncio.run(_run_tenants(_load_tenants(BOT_TENANTS_FILE)))
+        return
+    if BOT_WORKERS > 1 and _WORKER_INDEX is None:
+        if BOT_MODE != "webhook":
+            raise RuntimeError("BOT_WORKERS > 1 nécessite BOT_MODE=webhook (le front reçoit les updates).")
+        if not TOKEN:
+            raise RuntimeError("La variable d’environnement TELEGRAM_BOT_TOKEN n’est pas définie.")
+        asyncio.run(_run_front())
+        return
+    application = _build_application()
+    if _WORKER_INDEX is not None:
+        asyncio.run(_run_worker(application))
+        return
+    _log.info("Bot démarré. Appuyez sur Ctrl+C pour arrêter.")
+    if BOT_MODE == "webhook":
+        asyncio.run(_run_webhook(application))
+        return
     application.run_polling(allowed_updates=Update.ALL_TYPES)
 
 
@@ -0,0 +1,23 @@
+"""Tests de comportement de bot.py (pytest).
+
+Usage (depuis bots/tests):
+    pip install -r ../requirements-dev.txt
+    pytest
+
+Comme pour les benchmarks, le module bot est importé avec BOT_DATA_DIR pointant vers un dossier
+temporaire: aucun fichier de bots/ n'est lu ni écrit par les tests.
+"""
+import atexit
+import os
+import shutil
+import sys
+import tempfile
+
+_BOTS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, _BOTS_DIR)
+_DATA_DIR = tempfile.mkdtemp(prefix="bot-tests-")
+atexit.register(shutil.rmtree, _DATA_DIR, ignore_errors=True)
+os.environ["BOT_DATA_DIR"] = _DATA_DIR
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "123456:test")
+
+import bot  # noqa: E402,F401
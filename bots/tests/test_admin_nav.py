@@ -0,0 +1,65 @@
+"""Navigation du panneau admin: Retour rejoue l'écran précédent, jamais une invite de saisie."""
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import bot
+
+_ADMIN = 4242
+
+
+class _StubBot:
+    def __init__(self):
+        self.calls: list[tuple[str, dict]] = []
+
+    async def edit_message_text(self, **kwargs):
+        self.calls.append(("edit_message_text", kwargs))
+
+    async def send_message(self, **kwargs):
+        self.calls.append(("send_message", kwargs))
+        return SimpleNamespace(message_id=99)
+
+
+def _callback(data: str, replies: list):
+    async def answer(*args, **kwargs):
+        pass
+
+    async def reply_text(text, **kwargs):
+        replies.append(text)
+
+    message = SimpleNamespace(chat_id=_ADMIN, message_id=10, text="panneau", photo=None, reply_text=reply_text)
+    query = SimpleNamespace(data=data, from_user=SimpleNamespace(id=_ADMIN), message=message, answer=answer)
+    return SimpleNamespace(callback_query=query)
+
+
+@pytest.fixture
+def admin(monkeypatch):
+    monkeypatch.setattr(bot, "_is_admin", lambda user_id: user_id == _ADMIN)
+    monkeypatch.setattr(bot, "_admin_keyboard", lambda: bot.InlineKeyboardMarkup([]))
+
+
+def test_prompt_routes_are_not_stacked():
+    user_data = {"adm_route": ("adm_manage_buttons", ())}
+    bot._nav_push(user_data, "adm_edit_btn_name:def:contact")
+    bot._nav_push(user_data, "adm_links")
+    assert user_data["adm_nav_stack"] == [("adm_manage_buttons", ())]
+
+
+def test_back_does_not_replay_a_stacked_prompt(admin):
+    """Pile persistée avant l'exclusion: Retour saute l'invite au lieu de la renvoyer."""
+    context = SimpleNamespace(bot=_StubBot(), application=None, user_data={
+        "adm_route": ("adm_edit_btn_url", ("def", "contact")),
+        "adm_nav_stack": [("adm_panel", ()), ("adm_edit_btn_name", ("def", "contact"))],
+        "adm_panel": (10, "text"),
+        "await_action": "edit_btn_url",
+        "adm_edit_key": "contact_link",
+    })
+    replies: list = []
+    asyncio.run(bot.handle_admin_action(_callback("adm_back", replies), context))
+    assert replies == []  # aucune nouvelle invite
+    assert "await_action" not in context.user_data and "editing_button" not in context.user_data
+    assert "adm_edit_key" not in context.user_data
+    assert context.user_data["adm_route"] == ("adm_panel", ())
+    assert context.user_data["adm_nav_stack"] == []
+    assert context.bot.calls and context.bot.calls[0][0] == "edit_message_text"
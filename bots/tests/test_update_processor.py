@@ -0,0 +1,34 @@
+"""Processeur d'updates: verrou par chat pris avant une place du pool borné."""
+import asyncio
+import time
+from types import SimpleNamespace
+
+import bot
+
+
+def _chat_update(chat_id: int):
+    return SimpleNamespace(effective_chat=SimpleNamespace(id=chat_id), effective_user=None)
+
+
+def test_busy_chat_does_not_delay_other_chats():
+    """Pool de 2: le chat A (1 update lente + 1 en attente de son verrou) ne doit pas retarder le chat B."""
+    proc = bot._ChatOrderedUpdateProcessor(2)
+    done: dict[str, float] = {}
+
+    async def work(name: str, delay: float, t0: float):
+        await asyncio.sleep(delay)
+        done[name] = time.perf_counter() - t0
+
+    async def scenario():
+        t0 = time.perf_counter()
+        tasks = [asyncio.create_task(proc.process_update(_chat_update(1), work("a_slow", 0.5, t0)))]
+        await asyncio.sleep(0)
+        tasks.append(asyncio.create_task(proc.process_update(_chat_update(1), work("a_fast", 0, t0))))
+        await asyncio.sleep(0)
+        tasks.append(asyncio.create_task(proc.process_update(_chat_update(2), work("b_fast", 0, t0))))
+        await asyncio.gather(*tasks)
+
+    asyncio.run(scenario())
+    assert done["b_fast"] < 0.1
+    assert done["a_fast"] >= done["a_slow"]
+    assert proc.pending == 0 and not proc._locks
@@ -0,0 +1,309 @@
+"""Faux serveur Bot API local + générateur de charge, pour mesurer le bot sans Telegram.
+
+Usage:
+    # 1) faux Bot API + charge (200 utilisateurs virtuels pendant 30s)
+    python bots/tools/fake_bot_api.py --users 200 --duration 30 --latency-ms 30 --retry-after-rate 0.01
+    # 2) dans un autre terminal, le vrai bot pointé dessus (le jeton peut être quelconque)
+    TELEGRAM_API_BASE_URL=http://127.0.0.1:8081 TELEGRAM_BOT_TOKEN=123:fake python bots/bot.py
+
+    --admin-id <id>   ajoute une session admin (/admin, adm_stats, adm_users, retour): l'id doit
+                      figurer dans admin_ids de config.json
+    --webhook-url     livre les updates en POST au webhook du bot (BOT_MODE=webhook) au lieu
+                      de getUpdates
+    --serve-only      sert l'API sans générer de charge (utilisé par replay_updates.py)
+
+Méthodes simulées: getMe, getUpdates (long polling), sendPhoto, sendMessage, editMessage*,
+deleteMessage(s), answerCallbackQuery, getChat; toute autre méthode répond ok/true.
+La latence mesurée va de la livraison d'une update à la première réponse du bot dans ce chat.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import re
+import time
+from urllib.parse import parse_qsl
+from collections import Counter, deque
+
+import httpx
+
+from fake_webhook_sender import make_callback_update, make_start_update
+
+_MULTIPART_FIELD = re.compile(rb'name="(\w+)"\r\n(?:Content-Type: [^\r\n]*\r\n)?\r\n(.*?)\r\n--', re.S)
+# Méthodes qui constituent une réponse visible à l'utilisateur (fin de la mesure de latence)
+_REPLY_METHODS = {"sendPhoto", "sendMessage", "sendVideo", "sendDocument", "editMessageText", "editMessageCaption",
+                  "editMessageMedia", "editMessageReplyMarkup", "answerCallbackQuery"}
+_THROTTLED_METHODS = _REPLY_METHODS | {"deleteMessage", "deleteMessages"}
+
+
+def pct(values: list[float], p: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p * len(values)))]
+
+
+class FakeBotApi:
+    """Serveur HTTP/1.1 asyncio imitant api.telegram.org/bot<token>/<méthode>."""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 8081, latency_ms: float = 0.0, jitter_ms: float = 0.0,
+                 retry_after_rate: float = 0.0, retry_after: int = 1, webhook_url: str = "", webhook_secret: str = ""):
+        self.host = host
+        self.port = port
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.retry_after_rate = retry_after_rate
+        self.retry_after = retry_after
+        self.webhook_url = webhook_url
+        self.webhook_secret = webhook_secret
+        self.calls: Counter = Counter()
+        self.retry_after_injected = 0
+        self._updates: list[dict] = []
+        self._new_updates = asyncio.Event()
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1000)
+        self._file_ids = itertools.count(1)
+        self._waiters: dict[int, deque[asyncio.Future]] = {}
+        self._cq_chat: dict[str, int] = {}
+        self._server: asyncio.base_events.Server | None = None
+        self._webhook_client: httpx.AsyncClient | None = None
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        if self.webhook_url:
+            self._webhook_client = httpx.AsyncClient(timeout=10.0)
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        if self._webhook_client is not None:
+            await self._webhook_client.aclose()
+
+    # ----- injection des updates -----
+    async def deliver(self, update: dict) -> None:
+        """Numérote l'update puis la livre (file getUpdates ou POST webhook)."""
+        update["update_id"] = next(self._update_ids)
+        cq = update.get("callback_query")
+        if cq:
+            self._cq_chat[cq["id"]] = cq["message"]["chat"]["id"]
+        if self._webhook_client is not None:
+            headers = {"X-Telegram-Bot-Api-Secret-Token": self.webhook_secret, "Content-Type": "application/json"}
+            await self._webhook_client.post(self.webhook_url, content=json.dumps(update), headers=headers)
+            return
+        self._updates.append(update)
+        self._new_updates.set()
+
+    def expect_reply(self, chat_id: int) -> asyncio.Future:
+        """Future résolue par la prochaine réponse du bot dans ce chat (attentes servies dans l'ordre)."""
+        fut = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(int(chat_id), deque()).append(fut)
+        return fut
+
+    def _notify(self, chat_id) -> None:
+        try:
+            waiters = self._waiters.get(int(chat_id))
+        except (TypeError, ValueError):
+            return
+        while waiters:
+            fut = waiters.popleft()
+            if not fut.done():  # une attente abandonnée (timeout) est sautée
+                fut.set_result(time.perf_counter())
+                break
+        if waiters is not None and not waiters:
+            self._waiters.pop(int(chat_id), None)
+
+    # ----- HTTP -----
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+                    return
+                lines = head.decode("latin-1").split("\r\n")
+                _, target, _ = lines[0].split(" ", 2)
+                headers = {k.strip().lower(): v.strip() for k, v in (l.split(":", 1) for l in lines[1:] if ":" in l)}
+                length = int(headers.get("content-length") or 0)
+                body = await reader.readexactly(length) if length else b""
+                params = self._parse_params(headers.get("content-type", ""), body)
+                method = target.split("?", 1)[0].rstrip("/").rsplit("/", 1)[-1]
+                status, payload = await self._api(method, params)
+                data = json.dumps(payload).encode("utf-8")
+                writer.write(
+                    f"HTTP/1.1 {status} OK\r\nContent-Type: application/json\r\nContent-Length: {len(data)}\r\n"
+                    f"Connection: keep-alive\r\n\r\n".encode("latin-1") + data
+                )
+                await writer.drain()
+        except asyncio.CancelledError:
+            pass  # arrêt du serveur
+        except Exception as e:
+            print(f"[fake-api] connexion: {type(e).__name__}: {e}")
+        finally:
+            writer.close()
+
+    @staticmethod
+    def _parse_params(content_type: str, body: bytes) -> dict:
+        if not body:
+            return {}
+        if "json" in content_type:
+            return json.loads(body)
+        if "multipart" in content_type:
+            return {k.decode(): v.decode("utf-8", "replace") for k, v in _MULTIPART_FIELD.findall(body)}
+        # application/x-www-form-urlencoded: format utilisé par PTB pour les appels sans fichier
+        return dict(parse_qsl(body.decode("utf-8", "replace")))
+
+    def _message(self, params: dict, **extra) -> dict:
+        chat_id = params.get("chat_id") or 0
+        try:
+            chat_id = int(chat_id)
+        except (TypeError, ValueError):
+            pass
+        msg = {"message_id": int(params.get("message_id") or next(self._message_ids)), "date": int(time.time()),
+               "chat": {"id": chat_id, "type": "private" if isinstance(chat_id, int) and chat_id > 0 else "channel"}}
+        msg.update(extra)
+        return msg
+
+    async def _api(self, method: str, params: dict) -> tuple[int, dict]:
+        self.calls[method] += 1
+        if method != "getUpdates" and (self.latency_ms or self.jitter_ms):
+            await asyncio.sleep((self.latency_ms + random.random() * self.jitter_ms) / 1000)
+        if method in _THROTTLED_METHODS and self.retry_after_rate and random.random() < self.retry_after_rate:
+            self.retry_after_injected += 1
+            return 429, {"ok": False, "error_code": 429, "description": f"Too Many Requests: retry after {self.retry_after}",
+                         "parameters": {"retry_after": self.retry_after}}
+        if method == "getUpdates":
+            return 200, {"ok": True, "result": await self._get_updates(params)}
+        if method in _REPLY_METHODS:
+            chat_id = params.get("chat_id") or self._cq_chat.pop(str(params.get("callback_query_id")), None)
+            if chat_id is not None:
+                self._notify(chat_id)
+        if method == "getMe":
+            result = {"id": 123456, "is_bot": True, "first_name": "Fake", "username": "fake_load_bot",
+                      "can_join_groups": True, "can_read_all_group_messages": False, "supports_inline_queries": False}
+        elif method in ("sendPhoto", "editMessageMedia"):
+            n = next(self._file_ids)
+            result = self._message(params, caption=params.get("caption") or "",
+                                   photo=[{"file_id": f"fake-photo-{n}", "file_unique_id": f"u{n}", "width": 640, "height": 640}])
+        elif method in ("sendMessage", "editMessageText"):
+            result = self._message(params, text=params.get("text") or "")
+        elif method in ("editMessageCaption", "editMessageReplyMarkup"):
+            result = self._message(params, caption=params.get("caption") or "")
+        elif method == "getChat":
+            chat = params.get("chat_id")
+            uid = abs(hash(chat)) % 10**9 if isinstance(chat, str) and chat.startswith("@") else int(chat or 0)
+            result = {"id": uid, "type": "private", "first_name": "Fake", "username": str(chat).lstrip("@")}
+        else:
+            result = True  # answerCallbackQuery, deleteMessage(s), setChatMenuButton, deleteWebhook...
+        return 200, {"ok": True, "result": result}
+
+    async def _get_updates(self, params: dict) -> list[dict]:
+        offset = int(params.get("offset") or 0)
+        limit = int(params.get("limit") or 100)
+        timeout = float(params.get("timeout") or 0)
+        if offset:
+            self._updates = [u for u in self._updates if u["update_id"] >= offset]
+        if not self._updates and timeout:
+            self._new_updates.clear()
+            try:
+                await asyncio.wait_for(self._new_updates.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return self._updates[:limit]
+
+
+def make_admin_update(admin_id: int, step: int) -> dict:
+    if step % 4 == 0:
+        update = make_start_update(admin_id)
+        update["message"]["text"] = "/admin"
+        update["message"]["entities"][0]["length"] = 6
+        return update
+    return make_callback_update(admin_id, ("adm_stats", "adm_users", "adm_back")[step % 4 - 1])
+
+
+async def run_load(api: FakeBotApi, users: int, duration: float, callback_ratio: float, admin_id: int, think_ms: float) -> None:
+    latencies: dict[str, list[float]] = {"start": [], "callback": [], "admin": []}
+    timeouts: Counter = Counter()
+    end = time.perf_counter() + duration
+
+    async def virtual_user(uid: int, admin: bool) -> None:
+        rnd = random.Random(uid)
+        step = 0
+        while time.perf_counter() < end:
+            if admin:
+                kind, update = "admin", make_admin_update(uid, step)
+            elif step and rnd.random() < callback_ratio:
+                kind, update = "callback", make_callback_update(uid, rnd.choice(["back", "infos", "contact", "nolink_potato"]))
+            else:
+                kind, update = "start", make_start_update(uid)
+            step += 1
+            fut = api.expect_reply(uid)
+            t0 = time.perf_counter()
+            await api.deliver(update)
+            try:
+                latencies[kind].append(await asyncio.wait_for(fut, 15.0) - t0)
+            except asyncio.TimeoutError:
+                timeouts[kind] += 1
+            if think_ms:
+                await asyncio.sleep(rnd.random() * think_ms / 1000)
+
+    tasks = [virtual_user(2_000_000 + i, False) for i in range(users)]
+    if admin_id:
+        tasks.append(virtual_user(admin_id, True))
+    t_start = time.perf_counter()
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - t_start
+
+    total = sum(len(v) for v in latencies.values())
+    print(f"\n{total} updates traitées en {elapsed:.1f}s -> {total / max(elapsed, 1e-9):.0f} updates/s "
+          f"({users} utilisateurs{' + 1 admin' if admin_id else ''})")
+    for kind, values in latencies.items():
+        if values or timeouts[kind]:
+            print(f"  {kind:<9} n={len(values):<6} p50={pct(values, .5) * 1000:7.1f}ms p90={pct(values, .9) * 1000:7.1f}ms "
+                  f"p99={pct(values, .99) * 1000:7.1f}ms max={max(values, default=0) * 1000:7.1f}ms sans réponse={timeouts[kind]}")
+    print(f"  appels Bot API: {dict(api.calls.most_common())}")
+    print(f"  RetryAfter injectés: {api.retry_after_injected}")
+
+
+async def amain(args) -> None:
+    api = FakeBotApi(args.host, args.port, args.latency_ms, args.jitter_ms, args.retry_after_rate, args.retry_after,
+                     args.webhook_url, args.webhook_secret)
+    await api.start()
+    print(f"Faux Bot API sur http://{args.host}:{args.port} (TELEGRAM_API_BASE_URL)")
+    try:
+        if args.serve_only:
+            await asyncio.Event().wait()
+        # Attendre que le bot soit connecté (premier getUpdates, ou délai fixe en webhook)
+        while not args.webhook_url and not api.calls["getUpdates"]:
+            await asyncio.sleep(0.2)
+        if args.webhook_url:
+            await asyncio.sleep(args.warmup)
+        await run_load(api, args.users, args.duration, args.callback_ratio, args.admin_id, args.think_ms)
+    finally:
+        await api.stop()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--users", type=int, default=100, help="utilisateurs virtuels simultanés")
+    parser.add_argument("--duration", type=float, default=20.0, help="durée de la charge (s)")
+    parser.add_argument("--callback-ratio", type=float, default=0.4, help="part de clics parmi les actions")
+    parser.add_argument("--admin-id", type=int, default=0)
+    parser.add_argument("--think-ms", type=float, default=0.0, help="pause aléatoire max entre deux actions")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="latence ajoutée à chaque appel Bot API")
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--retry-after-rate", type=float, default=0.0, help="probabilité de répondre 429 aux envois")
+    parser.add_argument("--retry-after", type=int, default=1)
+    parser.add_argument("--webhook-url", default="")
+    parser.add_argument("--webhook-secret", default=os.getenv("WEBHOOK_SECRET") or os.getenv("TELEGRAM_WEBHOOK_SECRET", ""))
+    parser.add_argument("--warmup", type=float, default=3.0, help="attente avant la charge en mode webhook")
+    parser.add_argument("--serve-only", action="store_true")
+    asyncio.run(amain(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
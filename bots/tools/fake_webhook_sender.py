@@ -0,0 +1,103 @@
+"""Simule Telegram: envoie des updates synthétiques au webhook local du bot.
+
+Usage:
+    BOT_MODE=webhook WEBHOOK_SECRET=... python bots/bot.py
+    python bots/tools/fake_webhook_sender.py --secret ... --count 500 --concurrency 20
+
+Vérifie la réponse HTTP (200 attendu, 403 avec un mauvais secret) et mesure la
+latence d'acceptation: l'update est mise en file, pas traitée, avant la réponse.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import time
+
+import httpx
+
+_UPDATE_IDS = itertools.count(1)
+
+
+def make_start_update(user_id: int) -> dict:
+    now = int(time.time())
+    return {
+        "update_id": next(_UPDATE_IDS),
+        "message": {
+            "message_id": next(_UPDATE_IDS),
+            "date": now,
+            "chat": {"id": user_id, "type": "private", "first_name": "Load"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "Load", "username": f"user{user_id}"},
+            "text": "/start",
+            "entities": [{"type": "bot_command", "offset": 0, "length": 6}],
+        },
+    }
+
+
+def make_callback_update(user_id: int, data: str = "back") -> dict:
+    now = int(time.time())
+    return {
+        "update_id": next(_UPDATE_IDS),
+        "callback_query": {
+            "id": str(next(_UPDATE_IDS)),
+            "chat_instance": str(user_id),
+            "data": data,
+            "from": {"id": user_id, "is_bot": False, "first_name": "Load"},
+            "message": {
+                "message_id": 1,
+                "date": now,
+                "chat": {"id": user_id, "type": "private", "first_name": "Load"},
+                "caption": "Bienvenue",
+            },
+        },
+    }
+
+
+async def run(url: str, secret: str, count: int, concurrency: int, users: int) -> None:
+    latencies: list[float] = []
+    statuses: dict[int, int] = {}
+    sem = asyncio.Semaphore(concurrency)
+    headers = {"X-Telegram-Bot-Api-Secret-Token": secret, "Content-Type": "application/json"}
+
+    async with httpx.AsyncClient(timeout=10.0) as client:
+        async def one(i: int) -> None:
+            uid = 1_000_000 + (i % users)
+            update = make_start_update(uid) if i % 3 else make_callback_update(uid)
+            async with sem:
+                t0 = time.perf_counter()
+                try:
+                    r = await client.post(url, content=json.dumps(update), headers=headers)
+                    code = r.status_code
+                except httpx.HTTPError:
+                    code = 0
+                latencies.append(time.perf_counter() - t0)
+                statuses[code] = statuses.get(code, 0) + 1
+
+        t_start = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(count)))
+        elapsed = time.perf_counter() - t_start
+        # Contrôle: un mauvais secret doit être refusé
+        bad = await client.post(url, content=json.dumps(make_start_update(1)), headers={"X-Telegram-Bot-Api-Secret-Token": "wrong"})
+
+    latencies.sort()
+    pct = lambda p: latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000 if latencies else 0.0
+    print(f"{count} updates en {elapsed:.2f}s ({count / max(elapsed, 1e-9):.0f}/s)")
+    print(f"statuts: {statuses}  | mauvais secret -> {bad.status_code}")
+    print(f"latence ms: p50={pct(0.50):.2f} p90={pct(0.90):.2f} p99={pct(0.99):.2f} max={latencies[-1] * 1000 if latencies else 0:.2f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    port = os.getenv("WEBHOOK_PORT", "8443")
+    path = "/" + os.getenv("WEBHOOK_PATH", "telegram/webhook").lstrip("/")
+    parser.add_argument("--url", default=f"http://127.0.0.1:{port}{path}")
+    parser.add_argument("--secret", default=os.getenv("WEBHOOK_SECRET") or os.getenv("TELEGRAM_WEBHOOK_SECRET", ""))
+    parser.add_argument("--count", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--users", type=int, default=50, help="nombre d'utilisateurs distincts simulés")
+    args = parser.parse_args()
+    asyncio.run(run(args.url, args.secret, args.count, args.concurrency, args.users))
+
+
+if __name__ == "__main__":
+    main()
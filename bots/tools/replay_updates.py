@@ -0,0 +1,282 @@
+"""Rejoue un enregistrement d'updates (RECORD_UPDATES_DIR) contre le faux Bot API et compare deux builds.
+
+Usage:
+    # enregistrer en production (opt-in): RECORD_UPDATES_DIR=/var/lib/bot/records python bots/bot.py
+    # rejouer à 20x contre deux versions du bot et comparer
+    python bots/tools/replay_updates.py records/updates-*.jsonl.gz --speed 20 \\
+        --build avant=/srv/bot-v1/bots/bot.py --build apres=bots/bot.py --admin-id 999
+
+Chaque build est copié dans un dossier temporaire (bot.py, image d'accueil, config.json de --config
+ou config minimale avec --admin-id) puis lancé en polling sur le faux Bot API: les fichiers de
+données du dépôt ne sont jamais touchés. Les updates sont livrées au rythme enregistré divisé
+par --speed (1 à 100). Les updates marquées "admin" sont réattribuées à --admin-id.
+
+Latence = livraison -> première réponse du bot dans le chat (commandes et clics; les autres
+messages sont livrés sans être mesurés). Sans --build, sert seulement le faux Bot API et
+rejoue contre un bot lancé à la main (TELEGRAM_API_BASE_URL=http://127.0.0.1:8081).
+--json-out enregistre le rapport; --compare a.json b.json compare deux rapports existants.
+"""
+import argparse
+import asyncio
+import glob
+import gzip
+import json
+import os
+import shutil
+import signal
+import sys
+import tempfile
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from fake_bot_api import FakeBotApi, pct  # noqa: E402
+
+
+def load_recording(patterns: list[str]) -> list[dict]:
+    """Lit les fichiers .jsonl.gz (ou .jsonl) et renvoie les entrées triées par horodatage."""
+    entries = []
+    paths = sorted({p for pattern in patterns for p in glob.glob(pattern)})
+    for path in paths:
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(path, "rt", encoding="utf-8") as fh:
+            for line in fh:
+                try:
+                    entries.append(json.loads(line))
+                except json.JSONDecodeError:
+                    pass  # dernière ligne tronquée d'un fichier en cours d'écriture
+    entries.sort(key=lambda e: e.get("t", 0))
+    return entries
+
+
+def _kind(update: dict) -> tuple[str, int | None]:
+    """(catégorie, chat à surveiller); chat None = livrée sans mesure."""
+    cq = update.get("callback_query")
+    if cq:
+        chat = ((cq.get("message") or {}).get("chat") or {}).get("id")
+        return "callback", chat
+    msg = update.get("message") or {}
+    text = msg.get("text") or ""
+    chat = (msg.get("chat") or {}).get("id")
+    if text.startswith("/start"):
+        return "start", chat
+    if text.startswith("/"):
+        return "command", chat
+    return "other", None
+
+
+def _remap(entry: dict, admin_id: int) -> dict:
+    update = json.loads(json.dumps(entry["update"]))
+    if not (admin_id and entry.get("admin")):
+        return update
+    # L'admin enregistré est anonymisé: on le remplace par l'admin de test partout
+    raw = json.dumps(update)
+    anon = (update.get("message") or update.get("callback_query") or {}).get("from", {}).get("id")
+    if anon:
+        raw = raw.replace(str(anon), str(admin_id))
+    return json.loads(raw)
+
+
+async def replay(api: FakeBotApi, entries: list[dict], speed: float, admin_id: int, timeout: float) -> dict:
+    latencies: dict[str, list[float]] = {"start": [], "command": [], "callback": []}
+    timeouts: Counter = Counter()
+    delivered: Counter = Counter()
+    pending: list[asyncio.Task] = []
+    t0_rec = entries[0].get("t", 0) if entries else 0
+    t_start = time.perf_counter()
+
+    async def measure(kind: str, fut: asyncio.Future, sent: float) -> None:
+        try:
+            latencies[kind].append(await asyncio.wait_for(fut, timeout) - sent)
+        except asyncio.TimeoutError:
+            timeouts[kind] += 1
+
+    for entry in entries:
+        delay = t_start + (entry.get("t", t0_rec) - t0_rec) / speed - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        update = _remap(entry, admin_id)
+        kind, chat = _kind(update)
+        kind = "admin" if entry.get("admin") and admin_id else kind
+        delivered[kind] += 1
+        if chat is not None:
+            latencies.setdefault(kind, [])
+            fut = api.expect_reply(chat)
+            sent = time.perf_counter()
+            await api.deliver(update)
+            pending.append(asyncio.create_task(measure(kind, fut, sent)))
+        else:
+            await api.deliver(update)
+    await asyncio.gather(*pending)
+    elapsed = time.perf_counter() - t_start
+    recorded = (entries[-1].get("t", 0) - t0_rec) if entries else 0.0
+    return {
+        "updates": len(entries),
+        "elapsed_s": round(elapsed, 3),
+        "recorded_s": round(recorded, 3),
+        "speed": speed,
+        "throughput": round(len(entries) / max(elapsed, 1e-9), 1),
+        "delivered": dict(delivered),
+        "kinds": {
+            kind: {"n": len(v), "p50_ms": round(pct(v, .5) * 1000, 2), "p90_ms": round(pct(v, .9) * 1000, 2),
+                   "p99_ms": round(pct(v, .99) * 1000, 2), "max_ms": round(max(v, default=0) * 1000, 2),
+                   "timeouts": timeouts[kind]}
+            for kind, v in latencies.items() if v or timeouts[kind]
+        },
+        "api_calls": dict(api.calls.most_common()),
+        "retry_after_injected": api.retry_after_injected,
+    }
+
+
+def _prepare_workdir(bot_path: str, config_path: str, admin_id: int) -> str:
+    """Copie du build dans un dossier temporaire: les données du dépôt restent intactes."""
+    src_dir = os.path.dirname(os.path.abspath(bot_path))
+    work = tempfile.mkdtemp(prefix="replay-")
+    bots_dir = os.path.join(work, "bots")
+    os.makedirs(bots_dir)
+    shutil.copy2(bot_path, os.path.join(bots_dir, "bot.py"))
+    image = os.getenv("WELCOME_IMAGE_PATH", "IMG.jpg")
+    if not os.path.isabs(image) and os.path.exists(os.path.join(src_dir, image)):
+        shutil.copy2(os.path.join(src_dir, image), os.path.join(bots_dir, image))
+    config = {}
+    if config_path:
+        with open(config_path, encoding="utf-8") as fh:
+            config = json.load(fh)
+    if admin_id:
+        config["admin_ids"] = sorted(set(config.get("admin_ids") or []) | {admin_id})
+    with open(os.path.join(bots_dir, "config.json"), "w", encoding="utf-8") as fh:
+        json.dump(config, fh)
+    return work
+
+
+async def run_build(name: str, bot_path: str, entries: list[dict], args) -> dict:
+    api = FakeBotApi(args.host, args.port, args.latency_ms, args.jitter_ms, args.retry_after_rate, args.retry_after)
+    await api.start()
+    work = _prepare_workdir(bot_path, args.config, args.admin_id)
+    env = {k: v for k, v in os.environ.items() if k not in ("BOT_MODE", "RECORD_UPDATES_DIR", "METRICS_PORT")}
+    env.update({"TELEGRAM_API_BASE_URL": f"http://{args.host}:{args.port}", "TELEGRAM_BOT_TOKEN": "123456:replay",
+                "LOG_LEVEL": env.get("LOG_LEVEL", "WARNING")})
+    log = open(os.path.join(work, "bot.log"), "wb")
+    proc = await asyncio.create_subprocess_exec(sys.executable, os.path.join(work, "bots", "bot.py"),
+                                                cwd=os.path.join(work, "bots"), env=env, stdout=log, stderr=log)
+    try:
+        deadline = time.perf_counter() + args.start_timeout
+        while not api.calls["getUpdates"]:
+            if proc.returncode is not None or time.perf_counter() > deadline:
+                raise RuntimeError(f"{name}: le bot n'a pas démarré (voir {work}/bot.log)")
+            await asyncio.sleep(0.1)
+        print(f"[{name}] {bot_path}: rejeu de {len(entries)} updates à {args.speed:g}x...")
+        report = await replay(api, entries, args.speed, args.admin_id, args.timeout)
+        report["build"] = name
+        report["bot"] = os.path.abspath(bot_path)
+        return report
+    finally:
+        if proc.returncode is None:
+            proc.send_signal(signal.SIGTERM)
+            try:
+                await asyncio.wait_for(proc.wait(), 15)
+            except asyncio.TimeoutError:
+                proc.kill()
+                await proc.wait()
+        log.close()
+        await api.stop()
+        if not args.keep_workdir:
+            shutil.rmtree(work, ignore_errors=True)
+
+
+def print_report(report: dict) -> None:
+    print(f"\n[{report.get('build', 'bot')}] {report['updates']} updates en {report['elapsed_s']:.1f}s "
+          f"(enregistré: {report['recorded_s']:.1f}s, {report['speed']:g}x) -> {report['throughput']:.0f} updates/s")
+    for kind, k in report["kinds"].items():
+        print(f"  {kind:<9} n={k['n']:<6} p50={k['p50_ms']:7.1f}ms p90={k['p90_ms']:7.1f}ms "
+              f"p99={k['p99_ms']:7.1f}ms max={k['max_ms']:7.1f}ms sans réponse={k['timeouts']}")
+    print(f"  appels Bot API: {report['api_calls']}")
+
+
+def print_comparison(a: dict, b: dict) -> None:
+    def delta(x: float, y: float) -> str:
+        return f"{(y - x) / x * 100:+.1f}%" if x else "n/a"
+
+    na, nb = a.get("build", "A"), b.get("build", "B")
+    print(f"\nComparaison {na} -> {nb} (négatif = plus rapide pour les latences)")
+    print(f"  débit         {a['throughput']:>9.1f} -> {b['throughput']:>9.1f} updates/s  {delta(a['throughput'], b['throughput'])}")
+    for kind in sorted(set(a["kinds"]) | set(b["kinds"])):
+        ka, kb = a["kinds"].get(kind), b["kinds"].get(kind)
+        if not ka or not kb:
+            continue
+        for p in ("p50_ms", "p99_ms"):
+            print(f"  {kind:<9} {p[:3]} {ka[p]:>9.1f} -> {kb[p]:>9.1f} ms  {delta(ka[p], kb[p])}")
+        if ka["timeouts"] or kb["timeouts"]:
+            print(f"  {kind:<9} sans réponse {ka['timeouts']} -> {kb['timeouts']}")
+    calls_a, calls_b = sum(a["api_calls"].values()), sum(b["api_calls"].values())
+    print(f"  appels API    {calls_a:>9} -> {calls_b:>9}  {delta(calls_a, calls_b)}")
+
+
+async def amain(args) -> None:
+    entries = load_recording(args.recordings)
+    if args.limit:
+        entries = entries[:args.limit]
+    if not entries:
+        sys.exit("aucune update dans l'enregistrement")
+    reports = []
+    if args.build:
+        for spec in args.build:
+            name, _, path = spec.rpartition("=")
+            reports.append(await run_build(name or os.path.basename(os.path.dirname(os.path.abspath(path))), path, entries, args))
+            print_report(reports[-1])
+    else:
+        api = FakeBotApi(args.host, args.port, args.latency_ms, args.jitter_ms, args.retry_after_rate, args.retry_after)
+        await api.start()
+        print(f"Faux Bot API sur http://{args.host}:{args.port}: en attente du bot...")
+        try:
+            while not api.calls["getUpdates"]:
+                await asyncio.sleep(0.2)
+            reports.append(await replay(api, entries, args.speed, args.admin_id, args.timeout))
+        finally:
+            await api.stop()
+        print_report(reports[-1])
+    if args.json_out:
+        with open(args.json_out, "w", encoding="utf-8") as fh:
+            json.dump(reports if len(reports) > 1 else reports[0], fh, indent=2)
+    for a, b in zip(reports, reports[1:]):
+        print_comparison(a, b)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("recordings", nargs="*", help="fichiers ou motifs updates-*.jsonl.gz")
+    parser.add_argument("--speed", type=float, default=1.0, help="accélération du rythme enregistré (1 à 100)")
+    parser.add_argument("--build", action="append", default=[], metavar="NOM=chemin/bot.py",
+                        help="build à lancer et mesurer (répéter pour comparer)")
+    parser.add_argument("--config", default="", help="config.json utilisé par les builds (défaut: config minimale)")
+    parser.add_argument("--admin-id", type=int, default=0, help="id admin de test substitué aux updates admin")
+    parser.add_argument("--limit", type=int, default=0, help="ne rejouer que les N premières updates")
+    parser.add_argument("--timeout", type=float, default=15.0, help="attente max d'une réponse (s)")
+    parser.add_argument("--start-timeout", type=float, default=30.0, help="attente max du démarrage d'un build (s)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="latence ajoutée à chaque appel Bot API")
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--retry-after-rate", type=float, default=0.0)
+    parser.add_argument("--retry-after", type=int, default=1)
+    parser.add_argument("--json-out", default="", help="écrit le(s) rapport(s) en JSON")
+    parser.add_argument("--keep-workdir", action="store_true", help="conserve les dossiers temporaires (bot.log)")
+    parser.add_argument("--compare", nargs=2, metavar=("A.json", "B.json"), help="compare deux rapports sans rejouer")
+    args = parser.parse_args()
+    if args.compare:
+        reports = []
+        for path in args.compare:
+            with open(path, encoding="utf-8") as fh:
+                data = json.load(fh)
+            reports.append(data[-1] if isinstance(data, list) else data)
+        print_comparison(*reports)
+        return
+    if not 1 <= args.speed <= 100:
+        parser.error("--speed doit être entre 1 et 100")
+    if not args.recordings:
+        parser.error("aucun enregistrement fourni")
+    asyncio.run(amain(args))
+
+
+if __name__ == "__main__":
+    main()